@@ -0,0 +1,68 @@
+import sys
+import random
+import subprocess
+from typing import List, Optional
+
+from src.core.render_scheduler import RenderScheduler
+from src.core.render_quality import RenderQuality
+from bench_suite.mock_model import parse_latency
+
+# Burns CPU for argv[1] seconds of process time, then fails like a manim error if argv[2] is "1"
+_FAKE_RENDER_SCRIPT = """
+import sys, time
+deadline = time.process_time() + float(sys.argv[1])
+x = 0
+while time.process_time() < deadline:
+    x = (x * 31 + 7) % 1000003
+if sys.argv[2] == "1":
+    sys.stderr.write("Traceback (most recent call last):\\n  File \\"scene.py\\", line 9, in construct\\n"
+                     "NameError: name 'Squar' is not defined\\n")
+    sys.exit(1)
+"""
+
+
+class FakeRenderScheduler(RenderScheduler):
+    """Render scheduler that replaces manim with a CPU-bound stand-in process.
+
+    Each render runs a Python subprocess that burns CPU for a duration drawn from the
+    configured distribution, so render workers contend for cores like real renders do.
+    The drawn duration is scaled by the pixel rate of the quality in the manim command,
+    on top of a fixed startup cost, so draft renders are cheaper than final ones.
+    A configurable share of renders fails with a manim-style traceback, which sends the
+    scene through the normal code fix loop.
+
+    Args:
+        max_workers (int, optional): Number of concurrent renders. Defaults to the same
+            value RenderScheduler derives from this machine.
+        duration (str, optional): CPU seconds per 1080p60 render, see `parse_latency`. Defaults to "lognormal:5.0,0.3".
+        startup_seconds (float, optional): CPU seconds every render takes regardless of quality. Defaults to 1.0.
+        failure_probability (float, optional): Share of renders that fail. Defaults to 0.2.
+        seed (int, optional): Seed for durations and failures. Defaults to None.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, duration: str = "lognormal:5.0,0.3", failure_probability: float = 0.2, seed: Optional[int] = None, startup_seconds: float = 1.0):
+        super().__init__(max_workers=max_workers)
+        self.sample_duration = parse_latency(duration)
+        self.failure_probability = failure_probability
+        self.startup_seconds = startup_seconds
+        self._rng = random.Random(seed)
+        self.renders = 0
+        self.failures = 0
+
+    async def run(self, command: List[str], cwd: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Run a fake render in place of `command`.
+
+        Args:
+            command (List[str]): The manim command that would have run
+            cwd (str, optional): Working directory. Defaults to None.
+
+        Returns:
+            subprocess.CompletedProcess: Result of the stand-in process, reported under the original command
+        """
+        duration = self.startup_seconds + self.sample_duration(self._rng) * RenderQuality.from_manim_args(command).cost
+        fail = self._rng.random() < self.failure_probability
+        self.renders += 1
+        self.failures += int(fail)
+        result = await super().run([sys.executable, "-c", _FAKE_RENDER_SCRIPT, str(duration), "1" if fail else "0"], cwd=cwd)
+        result.args = command
+        return result
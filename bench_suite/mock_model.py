@@ -0,0 +1,351 @@
+import os
+import re
+import random
+import asyncio
+import threading
+import contextlib
+from string import Template
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from mllm_tools.cache import ResponseCache
+from mllm_tools.rate_limiter import RateLimiter, estimate_tokens, get_rate_limiter, report_overload
+
+_OUTLINE_SCENE = """<SCENE_$scene>
+Scene Title: Part $scene of $topic
+Scene Purpose: Introduce step $scene of the argument.
+Scene Description: Build the construction for step $scene and highlight the key quantity.
+Scene Layout: Title at the top, diagram in the center, formula at the bottom.
+</SCENE_$scene>"""
+
+_CODE_BLOCK = """```python
+from manim import *
+
+
+class Scene$scene(Scene):
+    def construct(self):
+        title = Text("Part $scene", font_size=36).to_edge(UP)
+        square = Square(side_length=2)
+        formula = MathTex("a^2 + b^2 = c^2").next_to(square, DOWN)
+        self.play(Write(title))
+        self.play(Create(square))
+        self.play(Write(formula))
+        self.wait(1)
+```"""
+
+_COMMENTARY = """The scene writes the title first so the viewer knows which step is being shown, then
+draws the square and reveals the formula below it. Each animation uses the default run
+time, and the final wait leaves the formula on screen before the next scene starts.
+Objects are positioned relative to each other, which keeps the layout inside the frame."""
+
+_CODE = f"<CODE>\n{_CODE_BLOCK}\n</CODE>\n\n{_COMMENTARY}"
+
+# Fix responses quote snippets in their reasoning before the corrected scene, as real models do
+_FIXED_CODE = f"""<THINKING>
+Error Type: Runtime
+Root Cause: The formula was positioned before the square existed.
+Solution:
+- Fix 1: Create the square first
+  - Change:
+```python
+square = Square(side_length=2)
+```
+</THINKING>
+<FULL_CORRECTED_CODE>
+{_CODE_BLOCK}
+</FULL_CORRECTED_CODE>
+
+{_COMMENTARY}"""
+
+# Matches LiteLLMWrapper: the stop pattern is only searched near the end of the text
+STOP_PATTERN_OVERLAP = 1024
+
+# Fixture responses keyed by the generation_name the pipeline puts in the call metadata.
+# $topic and $scene are filled in from the metadata tags.
+DEFAULT_FIXTURES = {
+    "scene_vision_storyboard": "<SCENE_VISION_STORYBOARD_PLAN>\nStoryboard for scene $scene: show the title, draw the diagram, reveal the formula.\n</SCENE_VISION_STORYBOARD_PLAN>",
+    "scene_technical_implementation": "<SCENE_TECHNICAL_IMPLEMENTATION_PLAN>\nUse Text, Square and MathTex; arrange with to_edge and next_to.\n</SCENE_TECHNICAL_IMPLEMENTATION_PLAN>",
+    "scene_animation_narration": "<SCENE_ANIMATION_NARRATION_PLAN>\nWrite the title, create the square, then write the formula while narrating step $scene.\n</SCENE_ANIMATION_NARRATION_PLAN>",
+    "code_generation": _CODE,
+    "code_fix_error": _FIXED_CODE,
+    "visual_self_reflection": "<LGTM>",
+    "detect-relevant-plugins": "```json\n[]\n```",
+    "rag_query_generation": '```json\n[{"type": "manim-core", "query": "How to create a Square and animate it with Create"}]\n```',
+}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Parse a latency distribution such as "lognormal:2.0,0.5".
+
+    Supported forms are "fixed:SECONDS", "uniform:LOW,HIGH", "exponential:MEAN" and
+    "lognormal:MEDIAN,SIGMA".
+
+    Args:
+        spec (str): Distribution spec
+
+    Returns:
+        Callable[[random.Random], float]: Sampler returning seconds
+
+    Raises:
+        ValueError: If the spec is not recognized
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(",")] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0.0, sigma)
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class MockRateLimitError(Exception):
+    """Injected provider rate limit error."""
+
+
+class MockModelWrapper:
+    """Stand-in for LiteLLMWrapper that answers from fixtures without network access.
+
+    Responses are chosen by the `generation_name` in the call metadata, so the pipeline
+    parses them exactly like real model output. Every call sleeps for a latency drawn
+    from the configured distribution, and a configurable share of calls fails with an
+    injected 429 that goes through the same path as a real one: the overload is reported
+    to the concurrency controllers, the shared rate limiter (if any) pauses, and the call
+    is retried.
+
+    Args:
+        model_name (str, optional): Model name used for rate limiter lookup. Defaults to "mock/model".
+        latency (str, optional): Latency distribution, see `parse_latency`. Defaults to "lognormal:2.0,0.5".
+        rate_limit_probability (float, optional): Share of calls answered with a 429. Defaults to 0.0.
+        retry_after (float, optional): Pause requested by an injected 429. Defaults to 1.0.
+        fixtures_dir (str, optional): Directory of `{generation_name}.txt` files overriding the
+            built-in fixtures. Defaults to None.
+        num_scenes (int, optional): Scenes in the generated outline. Defaults to 3.
+        seed (int, optional): Seed for latencies and injected errors. Defaults to None.
+        cache (ResponseCache, optional): Response cache, as in LiteLLMWrapper. Defaults to None.
+        rate_limiter (RateLimiter, optional): RPM/TPM limiter; defaults to the shared limiter
+            configured for `model_name`, if any.
+    """
+
+    def __init__(self,
+                 model_name: str = "mock/model",
+                 latency: str = "lognormal:2.0,0.5",
+                 rate_limit_probability: float = 0.0,
+                 retry_after: float = 1.0,
+                 fixtures_dir: Optional[str] = None,
+                 num_scenes: int = 3,
+                 seed: Optional[int] = None,
+                 cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.model_name = model_name
+        self.sample_latency = parse_latency(latency)
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.num_scenes = num_scenes
+        self.cache = cache
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter(model_name)
+        self.rate_limit_retries = 8
+        self.fixtures = dict(DEFAULT_FIXTURES)
+        if fixtures_dir:
+            for filename in os.listdir(fixtures_dir):
+                name, ext = os.path.splitext(filename)
+                if ext == ".txt":
+                    with open(os.path.join(fixtures_dir, filename)) as f:
+                        self.fixtures[name] = f.read()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+        self.injected_rate_limits = 0
+        self.busy_seconds = 0.0
+        self.output_chars = 0
+        self.stream_chunk_chars = 16
+
+    def _respond(self, metadata: Dict[str, Any]) -> str:
+        """Build the fixture response for a call.
+
+        Args:
+            metadata (Dict[str, Any]): Call metadata with generation_name and tags
+
+        Returns:
+            str: Fixture text with topic and scene filled in
+        """
+        generation_name = metadata.get("generation_name", "")
+        tags = metadata.get("tags") or []
+        topic = tags[0] if tags else "Topic"
+        scene = next((tag[len("scene"):] for tag in tags[1:] if isinstance(tag, str) and tag.startswith("scene") and tag[len("scene"):].isdigit()), "1")
+
+        if generation_name == "scene_outline" and generation_name not in self.fixtures:
+            scenes = "\n".join(Template(_OUTLINE_SCENE).substitute(scene=i, topic=topic) for i in range(1, self.num_scenes + 1))
+            return f"<SCENE_OUTLINE>\n{scenes}\n</SCENE_OUTLINE>"
+        if generation_name in self.fixtures:
+            fixture = self.fixtures[generation_name]
+        elif generation_name.startswith(("rag_query_generation", "rag-query-generation")):
+            fixture = self.fixtures["rag_query_generation"]
+        else:
+            # Format retries and unknown steps get code, the most common expected shape
+            fixture = self.fixtures["code_generation"]
+        return Template(fixture).safe_substitute(topic=topic, scene=scene)
+
+    def _draw(self) -> tuple:
+        """Draw the latency of a call and whether it is rate limited."""
+        with self._rng_lock:
+            return self.sample_latency(self._rng), self._rng.random() < self.rate_limit_probability
+
+    def _cache_key(self, messages: List[Dict[str, Any]], stop_pattern: Optional[str] = None) -> Optional[str]:
+        if self.cache is None:
+            return None
+        params = {"temperature": None}
+        if stop_pattern is not None:
+            params["stop_pattern"] = stop_pattern
+        return self.cache.make_key(self.model_name, messages, params)
+
+    async def _admit(self, messages: List[Dict[str, Any]]) -> float:
+        """Go through the rate limiter and injected 429s until a request is accepted.
+
+        Args:
+            messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+
+        Returns:
+            float: Generation latency of the accepted request
+
+        Raises:
+            MockRateLimitError: If every retry was rate limited
+        """
+        estimated = estimate_tokens(messages) if self.rate_limiter is not None else 0
+        for attempt in range(self.rate_limit_retries):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(estimated)
+            latency, rate_limited = self._draw()
+            self.calls += 1
+            if not rate_limited:
+                return latency
+            # A 429 comes back quickly, before any generation happens
+            await asyncio.sleep(min(latency, 0.1))
+            self.injected_rate_limits += 1
+            if attempt == self.rate_limit_retries - 1:
+                raise MockRateLimitError(f"{self.model_name} rate limited {self.rate_limit_retries} times")
+            report_overload("rate_limit")
+            if self.rate_limiter is not None:
+                self.rate_limiter.penalize(self.retry_after)
+            else:
+                await asyncio.sleep(self.retry_after)
+
+    def _record_output(self, text: str, latency: float) -> None:
+        self.busy_seconds += latency
+        self.output_chars += len(text)
+        if self.rate_limiter is not None:
+            # Prompt tokens were reserved up front; charge the output, roughly 4 characters per token
+            self.rate_limiter.record_usage(0, len(text) // 4)
+
+    async def acall(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Answer a request after a simulated model latency.
+
+        Args:
+            messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+            metadata (Dict[str, Any], optional): Call metadata. Defaults to None.
+
+        Returns:
+            str: Fixture response
+
+        Raises:
+            MockRateLimitError: If every retry was rate limited
+        """
+        cache_key = self._cache_key(messages)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        latency = await self._admit(messages)
+        await asyncio.sleep(latency)
+        response = self._respond(metadata or {})
+        self._record_output(response, latency)
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+
+    async def astream(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Stream the fixture response, spreading the simulated latency evenly over its text.
+
+        Args:
+            messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+            metadata (Dict[str, Any], optional): Call metadata. Defaults to None.
+
+        Yields:
+            Text deltas of about `stream_chunk_chars` characters
+        """
+        latency = await self._admit(messages)
+        response = self._respond(metadata or {})
+        sent = 0
+        try:
+            for offset in range(0, len(response), self.stream_chunk_chars):
+                delta = response[offset:offset + self.stream_chunk_chars]
+                await asyncio.sleep(latency * len(delta) / len(response))
+                sent += len(delta)
+                yield delta
+        finally:
+            self._record_output(response[:sent], latency * sent / len(response) if response else 0.0)
+
+    async def acall_stream(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None, stop_pattern: Optional[str] = None) -> str:
+        """Stream the fixture response and stop once it matches `stop_pattern`, as LiteLLMWrapper does.
+
+        Args:
+            messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+            metadata (Dict[str, Any], optional): Call metadata. Defaults to None.
+            stop_pattern (str, optional): Regex that ends the stream once matched. Defaults to None.
+
+        Returns:
+            str: Response text up to the end of the first match of `stop_pattern`
+        """
+        cache_key = self._cache_key(messages, stop_pattern)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        stop_regex = re.compile(stop_pattern, re.DOTALL) if stop_pattern else None
+        text = ""
+        matched = stop_regex is None
+        async with contextlib.aclosing(self.astream(messages, metadata)) as stream:
+            async for delta in stream:
+                search_from = max(0, len(text) - STOP_PATTERN_OVERLAP)
+                text += delta
+                match = stop_regex.search(text, search_from) if stop_regex is not None else None
+                if match:
+                    text = text[:match.end()]
+                    matched = True
+                    break
+        if cache_key is not None and text and matched:
+            self.cache.put(cache_key, text)
+        return text
+
+    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Blocking variant of `acall`.
+
+        Args:
+            messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+            metadata (Dict[str, Any], optional): Call metadata. Defaults to None.
+
+        Returns:
+            str: Fixture response
+        """
+        return asyncio.run(self.acall(messages, metadata))
+
+    def stats(self) -> Dict[str, Any]:
+        """Report call statistics.
+
+        Returns:
+            Dict[str, Any]: Calls made, injected rate limits, simulated busy seconds and output characters
+        """
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "injected_rate_limits": self.injected_rate_limits,
+            "busy_seconds": self.busy_seconds,
+            "output_chars": self.output_chars
+        }
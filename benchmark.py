@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+from typing import Dict, List
+
+from mllm_tools.cache import ResponseCache
+from mllm_tools.rate_limiter import configure_rate_limit, get_rate_limiter
+from src.core.adaptive_limiter import AdaptiveLimiter
+from src.core.run_manifest import STAGE_PLAN, STAGE_RENDER
+from src.utils.tracing import Tracer, set_tracer
+from bench_suite.mock_model import MockModelWrapper
+from bench_suite.fake_embeddings import FakeEmbeddings
+from bench_suite.fake_render import FakeRenderScheduler
+from generate_video import VideoGenerator
+
+
+def resource_usage() -> Dict[str, float]:
+    """
+    Read CPU time and peak memory of this process and its finished children.
+
+    Returns:
+        Dict[str, float]: User and system CPU seconds and max RSS in MB, for self and children
+    """
+    usage = {}
+    for name, who in (("self", resource.RUSAGE_SELF), ("children", resource.RUSAGE_CHILDREN)):
+        ru = resource.getrusage(who)
+        usage[f"{name}_user_seconds"] = ru.ru_utime
+        usage[f"{name}_system_seconds"] = ru.ru_stime
+        # ru_maxrss is reported in kilobytes on Linux
+        usage[f"{name}_max_rss_mb"] = ru.ru_maxrss / 1024
+    return usage
+
+
+def load_theorems(theorems_path: str, sample_size: int, seed: int) -> List[Dict]:
+    """
+    Load the fixed theorem set for a benchmark run.
+
+    Args:
+        theorems_path (str): Path to a theorems json file
+        sample_size (int): Number of theorems to use (None for all)
+        seed (int): Seed for the sample, so runs compare the same topics
+
+    Returns:
+        List[Dict]: Theorems with 'theorem' and 'description' keys
+    """
+    with open(theorems_path, "r") as f:
+        theorems = json.load(f)
+    if sample_size is not None and sample_size < len(theorems):
+        theorems = random.Random(seed).sample(theorems, sample_size)
+    return theorems
+
+
+async def run_benchmark(video_generator: VideoGenerator, theorems: List[Dict], args) -> float:
+    """
+    Drive the generation pipeline over all theorems.
+
+    Args:
+        video_generator (VideoGenerator): Generator wired to mock models and fake renders
+        theorems (List[Dict]): Theorems to process
+        args: Parsed command line arguments
+
+    Returns:
+        float: Wall-clock seconds
+    """
+    if args.adaptive_concurrency:
+        topic_semaphore = AdaptiveLimiter("topics", args.max_topic_concurrency, max_limit=args.max_adaptive_concurrency, latency_tolerance=None)
+    else:
+        topic_semaphore = asyncio.Semaphore(args.max_topic_concurrency)
+
+    async def process_theorem(theorem):
+        async with topic_semaphore:
+            # Combining is ffmpeg work outside the scheduler; leave it out of the measurement
+            await video_generator.generate_video_pipeline(
+                theorem['theorem'],
+                theorem['description'],
+                max_retries=args.max_retries
+            )
+
+    started_at = time.perf_counter()
+    results = await asyncio.gather(*(process_theorem(theorem) for theorem in theorems), return_exceptions=True)
+    wall_seconds = time.perf_counter() - started_at
+    for theorem, result in zip(theorems, results):
+        if isinstance(result, Exception):
+            print(f"Topic '{theorem['theorem']}' failed: {result!r}")
+    return wall_seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the generation pipeline offline with mock models and fake renders')
+    parser.add_argument('--theorems_path', type=str, default='data/thb_easy/math.json', help='Path to theorems json file')
+    parser.add_argument('--sample_size', '--sample', type=int, default=5, help='Number of theorems to sample')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the theorem sample, latencies and injected failures')
+    parser.add_argument('--output_dir', type=str, default=None, help='Output directory (defaults to a temporary directory)')
+    parser.add_argument('--keep_output', action='store_true', help='Keep the temporary output directory')
+    parser.add_argument('--scenes_per_topic', type=int, default=3, help='Number of scenes in each mock outline')
+    parser.add_argument('--max_retries', type=int, default=5, help='Maximum number of code fix attempts')
+    parser.add_argument('--planner_latency', type=str, default='lognormal:8.0,0.4',
+                       help='Planner model latency distribution (fixed:S, uniform:LO,HI, exponential:MEAN, lognormal:MEDIAN,SIGMA)')
+    parser.add_argument('--scene_latency', type=str, default='lognormal:15.0,0.4', help='Scene (code) model latency distribution')
+    parser.add_argument('--helper_latency', type=str, default='lognormal:2.0,0.4', help='Helper model latency distribution')
+    parser.add_argument('--rate_limit_probability', type=float, default=0.0, help='Share of model calls answered with an injected 429')
+    parser.add_argument('--retry_after', type=float, default=2.0, help='Pause requested by injected 429s')
+    parser.add_argument('--fixtures_dir', type=str, default=None, help='Directory of {generation_name}.txt fixture overrides')
+    parser.add_argument('--render_seconds', type=str, default='lognormal:5.0,0.3', help='CPU seconds per fake 1080p60 render (distribution)')
+    parser.add_argument('--render_startup_seconds', type=float, default=1.0, help='CPU seconds every fake render takes regardless of quality')
+    parser.add_argument('--render_failure_rate', type=float, default=0.2, help='Share of fake renders that fail and enter the fix loop')
+    parser.add_argument('--use_rag', '--rag', action='store_true', help='Use RAG with fake embeddings')
+    parser.add_argument('--manim_docs_path', type=str, default='data/rag/manim_docs', help='Path to manim docs indexed for RAG')
+    parser.add_argument('--max_scene_concurrency', type=int, default=5, help='Maximum number of scenes to process concurrently')
+    parser.add_argument('--max_topic_concurrency', type=int, default=5, help='Maximum number of topics to process concurrently')
+    parser.add_argument('--max_render_concurrency', type=int, default=None,
+                       help='Maximum number of concurrent renders (defaults to available cores and memory)')
+    parser.add_argument('--adaptive_concurrency', action='store_true', help='Adapt topic and scene concurrency (AIMD)')
+    parser.add_argument('--max_adaptive_concurrency', type=int, default=32, help='Upper bound for the adaptive limits')
+    parser.add_argument('--speculative_candidates', type=int, default=1, help='Number of code candidates raced per scene')
+    parser.add_argument('--draft_quality', type=str, default='low', help='Render quality of fix-loop renders')
+    parser.add_argument('--final_quality', type=str, default='high', help='Render quality of the accepted version')
+    parser.add_argument('--preflight', action='store_true', help='Run the preflight checks (needs manim) before fake renders')
+    parser.add_argument('--rate_limit_rpm', type=float, default=None, help='Requests per minute allowed per mock model')
+    parser.add_argument('--rate_limit_tpm', type=float, default=None, help='Tokens per minute allowed per mock model')
+    parser.add_argument('--llm_cache_dir', type=str, default=None, help='Directory for the LLM response cache (disabled if not set)')
+    parser.add_argument('--trace_path', type=str, default=None, help='Append per-stage timing spans to this JSONL file')
+    parser.add_argument('--report_path', type=str, default=None, help='Write the benchmark report as JSON to this file')
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="tea_bench_")
+    tracer = Tracer(args.trace_path)
+    set_tracer(tracer)
+
+    if args.rate_limit_rpm or args.rate_limit_tpm:
+        for model_name in ("mock/planner", "mock/scene", "mock/helper"):
+            configure_rate_limit(model_name, args.rate_limit_rpm, args.rate_limit_tpm)
+    response_cache = ResponseCache(args.llm_cache_dir) if args.llm_cache_dir else None
+
+    def make_model(model_name, latency, seed_offset):
+        return MockModelWrapper(
+            model_name=model_name,
+            latency=latency,
+            rate_limit_probability=args.rate_limit_probability,
+            retry_after=args.retry_after,
+            fixtures_dir=args.fixtures_dir,
+            num_scenes=args.scenes_per_topic,
+            seed=args.seed + seed_offset,
+            cache=response_cache
+        )
+
+    planner_model = make_model("mock/planner", args.planner_latency, 1)
+    scene_model = make_model("mock/scene", args.scene_latency, 2)
+    helper_model = make_model("mock/helper", args.helper_latency, 3)
+    candidate_models = [make_model("mock/scene", args.scene_latency, 10 + j) for j in range(args.speculative_candidates)]
+
+    fake_embeddings = FakeEmbeddings()
+    if args.use_rag:
+        from src.rag.vector_store import RAGVectorStore
+        RAGVectorStore._get_embedding_function = lambda self: fake_embeddings
+
+    theorems = load_theorems(args.theorems_path, args.sample_size, args.seed)
+    render_scheduler = FakeRenderScheduler(
+        max_workers=args.max_render_concurrency,
+        duration=args.render_seconds,
+        failure_probability=args.render_failure_rate,
+        seed=args.seed,
+        startup_seconds=args.render_startup_seconds
+    )
+    video_generator = VideoGenerator(
+        planner_model=planner_model,
+        scene_model=scene_model,
+        helper_model=helper_model,
+        output_dir=output_dir,
+        use_rag=args.use_rag,
+        # Fake vectors must not mix with a real index
+        chroma_db_path=os.path.join(output_dir, "chroma_db"),
+        manim_docs_path=args.manim_docs_path,
+        use_langfuse=False,
+        max_scene_concurrency=args.max_scene_concurrency,
+        max_render_concurrency=render_scheduler.max_workers,
+        adaptive_concurrency=args.adaptive_concurrency,
+        max_adaptive_concurrency=args.max_adaptive_concurrency,
+        speculative_candidates=args.speculative_candidates,
+        candidate_models=candidate_models,
+        use_preflight=args.preflight,
+        draft_quality=args.draft_quality,
+        final_quality=args.final_quality
+    )
+    video_generator.render_scheduler = render_scheduler
+    video_generator.video_renderer.render_scheduler = render_scheduler
+
+    print(f"Benchmarking {len(theorems)} topics x {args.scenes_per_topic} scenes in {output_dir}")
+    usage_before = resource_usage()
+    wall_seconds = asyncio.run(run_benchmark(video_generator, theorems, args))
+    usage_after = resource_usage()
+
+    manifest = video_generator.run_manifest
+    scenes_rendered = manifest.count_scenes(STAGE_RENDER)
+    cpu = {key: usage_after[key] - usage_before[key] for key in usage_after if key.endswith("_seconds")}
+    report = {
+        "topics": len(theorems),
+        "scenes_total": manifest.count_scenes(),
+        "scenes_planned": manifest.count_scenes(STAGE_PLAN),
+        "scenes_rendered": scenes_rendered,
+        "wall_seconds": wall_seconds,
+        "scenes_per_hour": scenes_rendered / wall_seconds * 3600 if wall_seconds > 0 else 0.0,
+        "renders": render_scheduler.renders,
+        "render_failures": render_scheduler.failures,
+        "cpu_seconds": cpu,
+        "max_rss_mb": {"self": usage_after["self_max_rss_mb"], "children": usage_after["children_max_rss_mb"]},
+        "models": [model.stats() for model in [planner_model, scene_model, helper_model] + candidate_models],
+        "rate_limiters": [limiter.stats() for limiter in map(get_rate_limiter, ("mock/planner", "mock/scene", "mock/helper")) if limiter is not None],
+        "cache": response_cache.stats() if response_cache is not None else None,
+        "concurrency": video_generator.concurrency_snapshot(),
+        "stages": tracer.summary()
+    }
+
+    print(f"\nPer-stage latency:\n{tracer.format_summary()}")
+    print(f"\nScenes rendered: {scenes_rendered}/{report['scenes_total']} in {wall_seconds:.1f}s "
+          f"({report['scenes_per_hour']:.1f} scenes/hour)")
+    print(f"Renders: {report['renders']} ({report['render_failures']} failed)")
+    print(f"CPU seconds: pipeline {cpu['self_user_seconds'] + cpu['self_system_seconds']:.1f}, "
+          f"renders {cpu['children_user_seconds'] + cpu['children_system_seconds']:.1f}; "
+          f"max RSS {report['max_rss_mb']['self']:.0f} MB (pipeline), {report['max_rss_mb']['children']:.0f} MB (largest render)")
+    for stats in report["models"]:
+        print(f"Model {stats['model']}: {stats['calls']} calls, {stats['injected_rate_limits']} injected 429s")
+
+    if args.report_path:
+        with open(args.report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report_path}")
+    tracer.close()
+    manifest.close()
+
+    if args.output_dir is None and not args.keep_output:
+        shutil.rmtree(output_dir, ignore_errors=True)
@@ -9,6 +9,7 @@ from eval_suite.prompts_raw import _image_eval
 from eval_suite.utils import extract_json, convert_score_fields, calculate_geometric_mean
 from mllm_tools.utils import _prepare_text_image_inputs
 from src.core.parse_video import image_with_most_non_black_space
+from src.utils.media_index import get_media_index
 
 def extract_key_frames(video_path, output_dir, num_chunks):
     """Extract key frames from a video by dividing it into chunks and selecting representative frames.
@@ -21,6 +22,12 @@ def extract_key_frames(video_path, output_dir, num_chunks):
     Returns:
         list: List of paths to the extracted key frames
     """
+    # The media index knows whether there is anything to decode without opening the video
+    info = get_media_index().get(video_path)
+    if info.video_stream is None or info.duration <= 0:
+        print("No frames extracted from the video.")
+        return []
+
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
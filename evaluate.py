@@ -14,6 +14,7 @@ from eval_suite.utils import calculate_geometric_mean
 from eval_suite.text_utils import parse_srt_to_text, fix_transcript, evaluate_text
 from eval_suite.video_utils import evaluate_video_chunk_new
 from eval_suite.image_utils import evaluate_sampled_images
+from src.utils.media_index import MediaIndex, get_media_index, set_media_index
 
 load_dotenv()
 
@@ -114,8 +115,8 @@ def evaluate_video_file(model, video_path, transcript_path, description_path, ta
 
     # Chunking
     num_chunks = 10
+    duration = get_media_index().get(video_path).duration
     with VideoFileClip(video_path) as clip:
-        duration = clip.duration
         chunk_duration = duration / num_chunks
         results = []
         
@@ -377,6 +378,7 @@ def main():
     parser.add_argument('--target_fps', type=int, help='Target FPS for video processing. If not set, original video FPS will be used', required=False)
     parser.add_argument('--use_parent_folder_as_topic', action='store_true', help='Use parent folder name as topic name for single file evaluation', default=True)
     parser.add_argument('--max_workers', type=int, default=4, help='Maximum number of concurrent workers for parallel processing')
+    parser.add_argument('--media_index_path', type=str, help='SQLite file caching video metadata, e.g. the media_index.db of a generation run. Defaults to media_index.db in the output folder', required=False)
 
     args = parser.parse_args()
 
@@ -418,6 +420,7 @@ def main():
     moviepy_temp_dir = os.path.join(args.output_folder, "moviepy_temp")
     os.makedirs(moviepy_temp_dir, exist_ok=True)
     VideoFileClip.DEFAULT_TEMP_DIR = moviepy_temp_dir
+    set_media_index(MediaIndex(args.media_index_path or os.path.join(args.output_folder, "media_index.db")))
 
     processed_videos_dir = os.path.join(args.output_folder, "processed_videos")
     os.makedirs(processed_videos_dir, exist_ok=True)
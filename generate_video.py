@@ -10,16 +10,28 @@ import re
 from dotenv import load_dotenv
 import asyncio
 import uuid # Import uuid for generating trace_id
+import atexit
 
 from mllm_tools.litellm import LiteLLMWrapper
+from mllm_tools.cache import ResponseCache
+from mllm_tools.rate_limiter import configure_rate_limit
 from mllm_tools.utils import _prepare_text_inputs # Keep _prepare_text_inputs if still used directly in main
 
 # Import new modules
 from src.core.video_planner import VideoPlanner
 from src.core.code_generator import CodeGenerator
 from src.core.video_renderer import VideoRenderer
-from src.utils.utils import _print_response, _extract_code, extract_xml # Import utility functions
+from src.core.stream_packager import StreamPackager
+from src.core.render_scheduler import RenderScheduler
+from src.core.preflight import PreflightChecker
+from src.core.adaptive_limiter import AdaptiveLimiter
+from src.core.pipeline_scheduler import PipelineScheduler, PipelineStage
+from src.core.work_queue import WorkQueue, default_worker_id
+from src.core.run_manifest import RunManifest, STAGE_PLAN, STAGE_CODE, STAGE_RENDER, STAGE_COMBINE
+from src.utils.utils import _print_response, _extract_code, extract_xml, atomic_write, create_file_once # Import utility functions
 from src.config.config import Config # Import Config class
+from src.utils.tracing import Tracer, get_tracer, set_tracer
+from src.utils.media_index import MediaIndex, set_media_index
 
 # Video parsing
 from src.core.parse_video import (
@@ -60,13 +72,36 @@ class VideoGenerator:
         use_langfuse (bool): Whether to enable Langfuse logging
         trace_id (str, optional): Trace ID for logging
         max_scene_concurrency (int): Maximum number of scenes to process concurrently
+        max_render_concurrency (int, optional): Maximum number of concurrent manim renders,
+            defaults to a value derived from available cores and memory
+        max_combine_concurrency (int): Maximum number of topics combined with ffmpeg at once
+        rebuild_manifest (bool): Whether to rebuild the run manifest from the output directory
+        adaptive_concurrency (bool): Whether to adapt scene concurrency (AIMD) instead of using
+            a fixed semaphore; max_scene_concurrency is then the starting limit
+        max_adaptive_concurrency (int): Upper bound for the adaptive scene limit
+        speculative_candidates (int): Number of code candidates raced per scene; 1 keeps the
+            serial generate -> render -> fix loop
+        candidate_models (list, optional): Models used for the candidates in turn (e.g. the scene
+            model at different temperatures), defaults to the scene model
+        use_preflight (bool): Whether to check code with static checks and a dry construct pass
+            before each manim render
+        draft_quality (str): Render quality of fix-loop, candidate and visual reflection renders
+            ("low", "medium", "high", ... or a profile such as "720p30")
+        final_quality (str): Delivery quality the accepted version of each scene is rendered at
+        max_prompt_tokens (int, optional): Cap on code generation prompt tokens; optional context
+            (examples, cheatsheet, RAG docs) is cut to fit. Defaults to the model's context window.
+        stream_formats (List[str], optional): Also package each accepted scene render for streaming
+            in these formats ("hls", "dash") as soon as it is rendered. Defaults to None.
 
     Attributes:
         output_dir (str): Directory for output files
         verbose (bool): Verbosity flag
         use_visual_fix_code (bool): Visual code fixing flag
         session_id (str): Unique session identifier
-        scene_semaphore (asyncio.Semaphore): Controls concurrent scene processing
+        scene_semaphore (asyncio.Semaphore or AdaptiveLimiter): Controls concurrent LLM calls for scenes
+        render_scheduler (RenderScheduler): Worker pool for manim renders
+        pipeline (PipelineScheduler): Per-scene plan -> scene -> combine stage scheduler
+        run_manifest (RunManifest): Transactional record of outline/plan/code/render/combine state
         banned_reasonings (list): List of banned reasoning patterns
         planner (VideoPlanner): Handles scene planning
         code_generator (CodeGenerator): Handles code generation
@@ -88,12 +123,43 @@ class VideoGenerator:
                  use_visual_fix_code=False,
                  use_langfuse=True,
                  trace_id=None,
-                 max_scene_concurrency: int = 5):
+                 max_scene_concurrency: int = 5,
+                 max_render_concurrency: Optional[int] = None,
+                 max_combine_concurrency: int = 2,
+                 rebuild_manifest: bool = False,
+                 adaptive_concurrency: bool = False,
+                 max_adaptive_concurrency: int = 32,
+                 speculative_candidates: int = 1,
+                 candidate_models: Optional[List] = None,
+                 use_preflight: bool = True,
+                 draft_quality: str = "low",
+                 final_quality: str = "high",
+                 max_prompt_tokens: Optional[int] = None,
+                 stream_formats: Optional[List[str]] = None):
         self.output_dir = output_dir
         self.verbose = verbose
         self.use_visual_fix_code = use_visual_fix_code
+        self.speculative_candidates = max(1, speculative_candidates)
+        self.candidate_models = candidate_models or [scene_model if scene_model is not None else planner_model]
         self.session_id = self._load_or_create_session_id()  # Modified to load existing or create new
-        self.scene_semaphore = asyncio.Semaphore(max_scene_concurrency)
+        self.run_manifest = RunManifest(output_dir)
+        if not self.run_manifest.is_imported or rebuild_manifest:
+            # First run against this output dir with a manifest (or an interrupted import): rebuild state from the tree once
+            self.run_manifest.import_output_tree()
+        if adaptive_concurrency:
+            self.scene_semaphore = AdaptiveLimiter("scenes", max_scene_concurrency, max_limit=max_adaptive_concurrency)
+            # Size the stages for the ceiling so the adaptive limit is what binds
+            stage_concurrency = max_adaptive_concurrency
+        else:
+            self.scene_semaphore = asyncio.Semaphore(max_scene_concurrency)
+            stage_concurrency = max_scene_concurrency
+        self.render_scheduler = RenderScheduler(max_workers=max_render_concurrency)
+        # Scene chains need room for both LLM-bound and render-bound work to stay busy
+        self.pipeline = PipelineScheduler([
+            PipelineStage("plan", stage_concurrency),
+            PipelineStage("scene", stage_concurrency + self.render_scheduler.max_workers),
+            PipelineStage("combine", max_combine_concurrency)
+        ])
         self.banned_reasonings = get_banned_reasonings()
 
         # Initialize separate modules
@@ -109,7 +175,8 @@ class VideoGenerator:
             chroma_db_path=chroma_db_path,
             manim_docs_path=manim_docs_path,
             embedding_model=embedding_model,
-            use_langfuse=use_langfuse
+            use_langfuse=use_langfuse,
+            run_manifest=self.run_manifest
         )
         self.code_generator = CodeGenerator(
             scene_model=scene_model if scene_model is not None else planner_model,
@@ -124,14 +191,40 @@ class VideoGenerator:
             embedding_model=embedding_model,
             use_visual_fix_code=use_visual_fix_code,
             use_langfuse=use_langfuse,
-            session_id=self.session_id
+            session_id=self.session_id,
+            run_manifest=self.run_manifest,
+            max_prompt_tokens=max_prompt_tokens
         )
         self.video_renderer = VideoRenderer(
             output_dir=output_dir,
             print_response=verbose,
-            use_visual_fix_code=use_visual_fix_code
+            use_visual_fix_code=use_visual_fix_code,
+            render_scheduler=self.render_scheduler,
+            run_manifest=self.run_manifest,
+            preflight=PreflightChecker() if use_preflight else None,
+            draft_quality=draft_quality,
+            final_quality=final_quality,
+            stream_packager=StreamPackager(output_dir, stream_formats) if stream_formats else None
         )
 
+    def concurrency_snapshot(self) -> Dict:
+        """
+        Report the current concurrency limits and usage.
+
+        Returns:
+            Dict: Scene limiter snapshot (if adaptive) and render worker usage
+        """
+        snapshot = {
+            "render": {
+                "limit": self.render_scheduler.max_workers,
+                "running": self.render_scheduler.running,
+                "queued": self.render_scheduler.queued
+            }
+        }
+        if isinstance(self.scene_semaphore, AdaptiveLimiter):
+            snapshot["scenes"] = self.scene_semaphore.snapshot()
+        return snapshot
+
     def _load_or_create_session_id(self) -> str:
         """
         Load existing session ID from file or create a new one.
@@ -147,11 +240,13 @@ class VideoGenerator:
                 print(f"Loaded existing session ID: {session_id}")
                 return session_id
 
-        # Create new session ID if none exists
+        # Create new session ID if none exists; workers sharing the output dir may race here
         session_id = str(uuid.uuid4())
-        os.makedirs(self.output_dir, exist_ok=True)
-        with open(session_file, 'w') as f:
-            f.write(session_id)
+        if not create_file_once(session_file, session_id):
+            with open(session_file, 'r') as f:
+                session_id = f.read().strip()
+            print(f"Loaded session ID created by another worker: {session_id}")
+            return session_id
         print(f"Created new session ID: {session_id}")
         return session_id
 
@@ -169,8 +264,7 @@ class VideoGenerator:
         os.makedirs(topic_dir, exist_ok=True)
 
         session_file = os.path.join(topic_dir, "session_id.txt")
-        with open(session_file, 'w') as f:
-            f.write(session_id)
+        atomic_write(session_file, session_id)
 
     def _load_topic_session_id(self, topic: str) -> Optional[str]:
         """
@@ -191,7 +285,7 @@ class VideoGenerator:
                 return f.read().strip()
         return None
 
-    def generate_scene_outline(self,
+    async def generate_scene_outline(self,
                             topic: str,
                             description: str,
                             session_id: str) -> str:
@@ -206,7 +300,7 @@ class VideoGenerator:
         Returns:
             str: Generated scene outline
         """
-        return self.planner.generate_scene_outline(topic, description, session_id)
+        return await self.planner.generate_scene_outline(topic, description, session_id)
 
     async def generate_scene_implementation(self,
                                       topic: str,
@@ -260,26 +354,20 @@ class VideoGenerator:
         file_prefix = topic.lower()
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
 
-        # Load scene outline from file
-        scene_outline_path = os.path.join(self.output_dir, file_prefix, f"{file_prefix}_scene_outline.txt")
-        if not os.path.exists(scene_outline_path):
+        # Number of scenes comes from the run manifest instead of re-parsing the outline
+        scene_number = self.run_manifest.get_scene_count(file_prefix)
+        if not scene_number:
             return {}
-        
-        with open(scene_outline_path, "r") as f:
-            scene_outline = f.read()
-
-        # Extract scene outline to get number of scenes
-        scene_outline_content = extract_xml(scene_outline)
-        scene_number = len(re.findall(r'<SCENE_(\d+)>[^<]', scene_outline_content))
         print(f"Number of scenes: {scene_number}")
 
         implementation_plans = {}
 
         # Check each scene's implementation plan
         for i in range(1, scene_number + 1):
-            plan_path = os.path.join(self.output_dir, file_prefix, f"scene{i}", f"{file_prefix}_scene{i}_implementation_plan.txt")
-            if os.path.exists(plan_path):
-                with open(plan_path, "r") as f:
+            plan_entry = self.run_manifest.get_latest(file_prefix, STAGE_PLAN, scene=i)
+            # A plan recorded in the manifest but deleted from disk is regenerated
+            if plan_entry is not None and plan_entry["artifact_path"] and os.path.exists(plan_entry["artifact_path"]):
+                with open(plan_entry["artifact_path"], "r") as f:
                     implementation_plans[i] = f.read()
                 print(f"Found existing implementation plan for scene {i}")
             else:
@@ -309,30 +397,43 @@ class VideoGenerator:
         file_prefix = topic.lower()
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
 
+        relevant_plugins = await self.planner.detect_relevant_plugins(topic, description) if self.planner.use_rag else []
+
         # Create tasks for each scene
         tasks = []
         for i, implementation_plan in enumerate(implementation_plans):
-            # Try to load scene trace id, or generate new one if it doesn't exist
-            scene_dir = os.path.join(self.output_dir, file_prefix, f"scene{i+1}")
-            subplan_dir = os.path.join(scene_dir, "subplans")
-            os.makedirs(subplan_dir, exist_ok=True)  # Create directories if they don't exist
-            
-            scene_trace_id_path = os.path.join(subplan_dir, "scene_trace_id.txt")
-            try:
-                with open(scene_trace_id_path, 'r') as f:
-                    scene_trace_id = f.read().strip()
-            except FileNotFoundError:
-                scene_trace_id = str(uuid.uuid4())
-                with open(scene_trace_id_path, 'w') as f:
-                    f.write(scene_trace_id)
-
-            task = self.process_scene(i, scene_outline, implementation_plan, topic, description, max_retries, file_prefix, session_id, scene_trace_id)
+            scene_trace_id = self._load_scene_trace_id(file_prefix, i + 1)
+            task = self.process_scene(i, scene_outline, implementation_plan, topic, description, max_retries, file_prefix, session_id, scene_trace_id, relevant_plugins)
             tasks.append(task)
 
         # Execute all tasks concurrently
         await asyncio.gather(*tasks)
 
-    async def process_scene(self, i: int, scene_outline: str, scene_implementation: str, topic: str, description: str, max_retries: int, file_prefix: str, session_id: str, scene_trace_id: str): # added scene_trace_id
+    def _load_scene_trace_id(self, file_prefix: str, scene_number: int) -> str:
+        """
+        Load the trace ID of a scene, or create and save a new one if it doesn't exist.
+
+        Args:
+            file_prefix (str): Prefix for file naming
+            scene_number (int): Scene number (1-based)
+
+        Returns:
+            str: The scene trace ID
+        """
+        subplan_dir = os.path.join(self.output_dir, file_prefix, f"scene{scene_number}", "subplans")
+        os.makedirs(subplan_dir, exist_ok=True)  # Create directories if they don't exist
+
+        scene_trace_id_path = os.path.join(subplan_dir, "scene_trace_id.txt")
+        try:
+            with open(scene_trace_id_path, 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            scene_trace_id = str(uuid.uuid4())
+            with open(scene_trace_id_path, 'w') as f:
+                f.write(scene_trace_id)
+            return scene_trace_id
+
+    async def process_scene(self, i: int, scene_outline: str, scene_implementation: str, topic: str, description: str, max_retries: int, file_prefix: str, session_id: str, scene_trace_id: str, relevant_plugins: List[str] = None): # added scene_trace_id
         """
         Process a single scene using CodeGenerator and VideoRenderer.
 
@@ -346,6 +447,7 @@ class VideoGenerator:
             file_prefix (str): Prefix for file naming
             session_id (str): Session identifier for tracking
             scene_trace_id (str): Trace identifier for this scene
+            relevant_plugins (List[str], optional): Plugins relevant to the topic. Defaults to None.
         """
         curr_scene = i + 1
         curr_version = 0
@@ -357,55 +459,73 @@ class VideoGenerator:
         os.makedirs(code_dir, exist_ok=True)
         media_dir = os.path.join(self.output_dir, file_prefix, "media") # Define media_dir here
 
-        async with self.scene_semaphore:
-            # Step 3A: Generate initial manim code
-            code, log = self.code_generator.generate_manim_code(
-                topic=topic,
-                description=description,
-                scene_outline=scene_outline,
-                scene_implementation=scene_implementation,
-                scene_number=curr_scene,
-                additional_context=[_prompt_manim_cheatsheet, _code_font_size, _code_limit, _code_disable],
-                scene_trace_id=scene_trace_id, # Use passed scene_trace_id
-                session_id=session_id,
-                rag_queries_cache=rag_queries_cache  # Pass the cache
-            )
-
-            # Save initial code and log (file operations can be offloaded if needed)
-            with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}_init_log.txt"), "w") as f:
-                f.write(log)
-            with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}.py"), "w") as f:
-                f.write(code)
-            print(f"Code saved to {code_dir}/{file_prefix}_scene{curr_scene}_v{curr_version}.py")
-
-            # Step 3B: Compile and fix code if needed
-            error_message = None
-            while True: # Retry loop controlled by break statements
-                code, error_message = await self.video_renderer.render_scene(
-                    code=code,
-                    file_prefix=file_prefix,
-                    curr_scene=curr_scene,
-                    curr_version=curr_version,
-                    code_dir=code_dir,
-                    media_dir=media_dir,
-                    max_retries=max_retries, # Pass max_retries here if needed in render_scene
-                    use_visual_fix_code=self.use_visual_fix_code,
-                    visual_self_reflection_func=self.code_generator.visual_self_reflection, # Pass visual_self_reflection function
-                    banned_reasonings=self.banned_reasonings, # Pass banned reasonings
-                    scene_trace_id=scene_trace_id,
+        # LLM work holds a scene slot; renders go through the render scheduler without one
+        async def visual_self_reflection(*args, **kwargs):
+            async with self.scene_semaphore:
+                return await self.code_generator.visual_self_reflection(*args, **kwargs)
+
+        if self.speculative_candidates > 1:
+            winner = await self._race_code_candidates(curr_scene, scene_outline, scene_implementation, topic, description,
+                                                      max_retries, file_prefix, session_id, scene_trace_id, code_dir, media_dir,
+                                                      relevant_plugins)
+            if winner is None:
+                print(f"Max retries reached for scene {curr_scene} in all {self.speculative_candidates} candidates")
+                return
+            code, curr_version = winner
+            if not self.use_visual_fix_code:
+                error_message = await self.video_renderer.render_final(file_prefix, curr_scene, curr_version, code_dir, media_dir, topic=topic)
+                if error_message is not None:
+                    print(f"Final render failed for scene {curr_scene}, error: {error_message}")
+                return
+            # The visual fix loop below re-renders the winning version and refines it
+        else:
+            async with self.scene_semaphore:
+                # Step 3A: Generate initial manim code
+                code, log = await self.code_generator.generate_manim_code(
                     topic=topic,
-                    session_id=session_id
+                    description=description,
+                    scene_outline=scene_outline,
+                    scene_implementation=scene_implementation,
+                    scene_number=curr_scene,
+                    additional_context=[_prompt_manim_cheatsheet, _code_font_size, _code_limit, _code_disable],
+                    scene_trace_id=scene_trace_id, # Use passed scene_trace_id
+                    session_id=session_id,
+                    rag_queries_cache=rag_queries_cache,  # Pass the cache
+                    relevant_plugins=relevant_plugins
                 )
-                if error_message is None: # Render success if error_message is None
-                    break
 
-                if curr_version >= max_retries: # Max retries reached
-                    print(f"Max retries reached for scene {curr_scene}, error: {error_message}")
-                    break # Exit retry loop
+            # Save initial code and log (file operations can be offloaded if needed)
+            self.code_generator.save_code(code, log, code_dir, file_prefix, curr_scene, curr_version, "init_log")
+
+        # Step 3B: Compile and fix code if needed
+        error_message = None
+        while True: # Retry loop controlled by break statements
+            code, error_message = await self.video_renderer.render_scene(
+                code=code,
+                file_prefix=file_prefix,
+                curr_scene=curr_scene,
+                curr_version=curr_version,
+                code_dir=code_dir,
+                media_dir=media_dir,
+                max_retries=max_retries, # Pass max_retries here if needed in render_scene
+                use_visual_fix_code=self.use_visual_fix_code,
+                visual_self_reflection_func=visual_self_reflection, # Pass visual_self_reflection function
+                banned_reasonings=self.banned_reasonings, # Pass banned reasonings
+                scene_trace_id=scene_trace_id,
+                topic=topic,
+                session_id=session_id
+            )
+            if error_message is None: # Render success if error_message is None
+                break
+
+            if curr_version >= max_retries: # Max retries reached
+                print(f"Max retries reached for scene {curr_scene}, error: {error_message}")
+                break # Exit retry loop
 
-                curr_version += 1
-                # if program runs this, it means that the code is not rendered successfully
-                code, log = self.code_generator.fix_code_errors(
+            curr_version += 1
+            # if program runs this, it means that the code is not rendered successfully
+            async with self.scene_semaphore:
+                code, log = await self.code_generator.fix_code_errors(
                     implementation_plan=scene_implementation,
                     code=code,
                     error=error_message,
@@ -413,15 +533,107 @@ class VideoGenerator:
                     topic=topic,
                     scene_number=curr_scene,
                     session_id=session_id,
-                    rag_queries_cache=rag_queries_cache
+                    rag_queries_cache=rag_queries_cache,
+                    relevant_plugins=relevant_plugins
                 )
 
-                with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}_fix_log.txt"), "w") as f:
-                    f.write(log)
-                with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}.py"), "w") as f:
-                    f.write(code)
+            self.code_generator.save_code(code, log, code_dir, file_prefix, curr_scene, curr_version, "fix_log")
+
+    async def _race_code_candidates(self, curr_scene: int, scene_outline: str, scene_implementation: str, topic: str, description: str, max_retries: int, file_prefix: str, session_id: str, scene_trace_id: str, code_dir: str, media_dir: str, relevant_plugins: List[str] = None) -> Optional[tuple]:
+        """
+        Run several generate -> render -> fix chains for a scene concurrently; the first clean render wins.
+
+        Candidate j uses candidate_models[j % len(candidate_models)]. Every attempt is kept
+        in code_dir as ..._v{version}_c{j}.py with its log; candidate renders go to a
+        separate media directory. As soon as one candidate renders, the other chains are
+        cancelled (killing their renders) and the winner is saved as regular version.
+
+        Args:
+            curr_scene (int): Scene number (1-based)
+            scene_outline (str): Overall scene outline
+            scene_implementation (str): Implementation plan for this scene
+            topic (str): The topic of the video
+            description (str): Description of the video content
+            max_retries (int): Maximum number of code fix attempts per candidate
+            file_prefix (str): Prefix for file naming
+            session_id (str): Session identifier for tracking
+            scene_trace_id (str): Trace identifier for this scene
+            code_dir (str): Code directory of the scene
+            media_dir (str): Media directory of the topic
+            relevant_plugins (List[str], optional): Plugins relevant to the topic. Defaults to None.
 
-                print(f"Code saved to {code_dir}/{file_prefix}_scene{curr_scene}_v{curr_version}.py")
+        Returns:
+            Optional[tuple]: (code, version) of the winning candidate, or None if every candidate failed
+        """
+        candidate_media_dir = os.path.join(self.output_dir, file_prefix, f"scene{curr_scene}", "candidate_media")
+        rag_queries_cache = {}
+
+        async def run_candidate(candidate: int):
+            model = self.candidate_models[candidate % len(self.candidate_models)]
+            version = 0
+            async with self.scene_semaphore:
+                code, log = await self.code_generator.generate_manim_code(
+                    topic=topic,
+                    description=description,
+                    scene_outline=scene_outline,
+                    scene_implementation=scene_implementation,
+                    scene_number=curr_scene,
+                    additional_context=[_prompt_manim_cheatsheet, _code_font_size, _code_limit, _code_disable],
+                    scene_trace_id=scene_trace_id,
+                    session_id=session_id,
+                    rag_queries_cache=rag_queries_cache,
+                    model=model,
+                    relevant_plugins=relevant_plugins
+                )
+            log_name = "init_log"
+            while True:
+                self.code_generator.save_code(code, log, code_dir, file_prefix, curr_scene, version, log_name, candidate=candidate)
+                error_message = await self.video_renderer.render_candidate(
+                    file_prefix, curr_scene, version, candidate, code_dir, candidate_media_dir, topic=topic)
+                if error_message is None:
+                    return candidate, version, code, log, log_name
+                if version >= max_retries:
+                    print(f"Max retries reached for scene {curr_scene} candidate {candidate}, error: {error_message}")
+                    return None
+                version += 1
+                async with self.scene_semaphore:
+                    code, log = await self.code_generator.fix_code_errors(
+                        implementation_plan=scene_implementation,
+                        code=code,
+                        error=error_message,
+                        scene_trace_id=scene_trace_id,
+                        topic=topic,
+                        scene_number=curr_scene,
+                        session_id=session_id,
+                        rag_queries_cache=rag_queries_cache,
+                        model=model,
+                        relevant_plugins=relevant_plugins
+                    )
+                log_name = "fix_log"
+
+        tasks = [asyncio.create_task(run_candidate(candidate)) for candidate in range(self.speculative_candidates)]
+        winner = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except Exception as e:
+                    print(f"Code candidate for scene {curr_scene} failed: {e}")
+                    continue
+                if result is not None:
+                    winner = result
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if winner is None:
+            return None
+        candidate, version, code, log, log_name = winner
+        self.code_generator.save_code(code, log, code_dir, file_prefix, curr_scene, version, log_name)
+        self.video_renderer.promote_candidate(file_prefix, curr_scene, version, candidate, candidate_media_dir, media_dir)
+        return code, version
 
     def run_manim_process(self,
                           topic: str):
@@ -456,8 +668,11 @@ class VideoGenerator:
             topic (str): The topic to combine videos for
         """
         self.video_renderer.combine_videos(topic)
+        if self.video_renderer.stream_packager is not None:
+            # Picks up scenes rendered in earlier runs; scenes packaged after their render are skipped
+            self.video_renderer.package_topic(topic)
 
-    async def _generate_scene_implementation_single(self, topic: str, description: str, scene_outline_i: str, i: int, file_prefix: str, session_id: str, scene_trace_id: str) -> str:
+    async def _generate_scene_implementation_single(self, topic: str, description: str, scene_outline_i: str, i: int, file_prefix: str, session_id: str, scene_trace_id: str, relevant_plugins: List[str] = None) -> str:
         """
         Generate detailed implementation plan for a single scene using VideoPlanner.
 
@@ -469,13 +684,14 @@ class VideoGenerator:
             file_prefix (str): Prefix for file naming
             session_id (str): Session identifier for tracking
             scene_trace_id (str): Trace identifier for this scene
+            relevant_plugins (List[str], optional): Plugins relevant to the topic. Defaults to None.
 
         Returns:
             str: Generated implementation plan
         """
-        return await self.planner._generate_scene_implementation_single(topic, description, scene_outline_i, i, file_prefix, session_id, scene_trace_id)
+        return await self.planner._generate_scene_implementation_single(topic, description, scene_outline_i, i, file_prefix, session_id, scene_trace_id, relevant_plugins)
 
-    async def generate_video_pipeline(self, topic: str, description: str, max_retries: int, only_plan: bool = False, specific_scenes: List[int] = None):
+    async def generate_video_pipeline(self, topic: str, description: str, max_retries: int, only_plan: bool = False, specific_scenes: List[int] = None, only_render: bool = False):
         """
         Modified pipeline to handle partial scene completions and option to only generate plans for specific scenes.
 
@@ -485,6 +701,7 @@ class VideoGenerator:
             max_retries (int): Maximum number of code fix attempts
             only_plan (bool, optional): Whether to only generate plans without rendering. Defaults to False.
             specific_scenes (List[int], optional): List of specific scenes to process. Defaults to None.
+            only_render (bool, optional): Only process scenes without code and skip combining. Defaults to False.
         """
         session_id = self._load_or_create_session_id()
         self._save_topic_session_id(topic, session_id)
@@ -498,91 +715,95 @@ class VideoGenerator:
             with open(scene_outline_path, "r") as f:
                 scene_outline = f.read()
             print(f"Loaded existing scene outline for topic: {topic}")
-            if self.planner.use_rag:
-                self.planner.relevant_plugins = self.planner.rag_integration.detect_relevant_plugins(topic, description) or []
-                self.planner.rag_integration.set_relevant_plugins(self.planner.relevant_plugins)
-                print(f"Detected relevant plugins: {self.planner.relevant_plugins}")
         else:
             print(f"Generating new scene outline for topic: {topic}")
-            scene_outline = self.planner.generate_scene_outline(topic, description, session_id)
+            scene_outline = await self.planner.generate_scene_outline(topic, description, session_id)
             os.makedirs(os.path.join(self.output_dir, file_prefix), exist_ok=True)
             with open(scene_outline_path, "w") as f:
                 f.write(scene_outline)
+        # Topics run concurrently on the shared planner, so the plugin list is passed down explicitly
+        relevant_plugins = await self.planner.detect_relevant_plugins(topic, description) if self.planner.use_rag else []
 
         # Load or generate implementation plans
         implementation_plans_dict = self.load_implementation_plans(topic)
+        scene_outline_content = extract_xml(scene_outline)
         if not implementation_plans_dict:
-            scene_outline_content = extract_xml(scene_outline)
             scene_numbers = len(re.findall(r'<SCENE_(\d+)>[^<]', scene_outline_content))
             implementation_plans_dict = {i: None for i in range(1, scene_numbers + 1)}
 
-        # Generate missing implementation plans for specified scenes or all missing scenes
-        missing_scenes = []
-        for scene_num, plan in implementation_plans_dict.items():
-            if plan is None and (specific_scenes is None or scene_num in specific_scenes):
-                missing_scenes.append(scene_num)
-
+        missing_scenes = [scene_num for scene_num, plan in implementation_plans_dict.items()
+                          if plan is None and (specific_scenes is None or scene_num in specific_scenes)]
         if missing_scenes:
             print(f"Generating implementation plans for missing scenes: {missing_scenes}")
-            for scene_num in missing_scenes:
-                scene_outline_content = extract_xml(scene_outline)
+        if only_plan:
+            print(f"Only generating plans - skipping code generation and video rendering for topic: {topic}")
+        else:
+            print(f"Starting video rendering for topic: {topic}")
+
+        # Each scene runs its own plan -> code/render chain, so a scene starts coding as soon
+        # as its own implementation plan exists instead of waiting for every other scene.
+        async def run_scene_chain(scene_num: int):
+            steps = []
+
+            async def plan_step():
                 scene_match = re.search(f'<SCENE_{scene_num}>(.*?)</SCENE_{scene_num}>', scene_outline_content, re.DOTALL)
                 if scene_match:
-                    scene_outline_i = scene_match.group(1)
                     scene_trace_id = str(uuid.uuid4())
-                    implementation_plan = await self._generate_scene_implementation_single(
-                        topic, description, scene_outline_i, scene_num, file_prefix, session_id, scene_trace_id)
-                    implementation_plans_dict[scene_num] = implementation_plan
+                    implementation_plans_dict[scene_num] = await self._generate_scene_implementation_single(
+                        topic, description, scene_match.group(1), scene_num, file_prefix, session_id, scene_trace_id, relevant_plugins)
+
+            async def scene_step():
+                implementation_plan = implementation_plans_dict[scene_num]
+                if implementation_plan is None:
+                    print(f"Scene {scene_num} has no implementation plan, skipping rendering")
+                    return
+                scene_trace_id = self._load_scene_trace_id(file_prefix, scene_num)
+                await self.process_scene(scene_num - 1, scene_outline, implementation_plan, topic, description,
+                                         max_retries, file_prefix, session_id, scene_trace_id, relevant_plugins)
+
+            if scene_num in missing_scenes:
+                steps.append(("plan", plan_step))
+            if not only_plan and self._scene_needs_processing(file_prefix, scene_num, only_render):
+                steps.append(("scene", scene_step))
+            if steps:
+                await self.pipeline.run_chain(steps)
+
+        await asyncio.gather(*(run_scene_chain(scene_num) for scene_num in sorted(implementation_plans_dict.keys())))
+
+        if not only_plan and not only_render:  # Skip video combination in only_render mode
+            print(f"Video rendering completed for topic '{topic}'.")
 
-        if only_plan:
-            print(f"Only generating plans - skipping code generation and video rendering for topic: {topic}")
-            return
+    def _scene_needs_processing(self, file_prefix: str, scene_number: int, only_render: bool = False) -> bool:
+        """
+        Check whether a scene still needs code generation and rendering.
 
-        # Convert dictionary to list maintaining scene order
-        sorted_scene_numbers = sorted(implementation_plans_dict.keys())
-        implementation_plans = [implementation_plans_dict[i] for i in sorted_scene_numbers]
-        
-        # Render scenes
-        print(f"Starting video rendering for topic: {topic}")
-        
-        # Check which scenes need processing
-        scenes_to_process = []
-        for i, implementation_plan in enumerate(implementation_plans):
-            scene_dir = os.path.join(self.output_dir, file_prefix, f"scene{i+1}")
-            code_dir = os.path.join(scene_dir, "code")
-            
-            # Check if scene has any code files
-            has_code = False
-            if os.path.exists(code_dir):
-                if any(f.endswith('.py') for f in os.listdir(code_dir)):
-                    has_code = True
-            
-            # For only_render mode, only process scenes without code
-            if args.only_render:
-                if not has_code:
-                    scenes_to_process.append((i+1, implementation_plan))
-                    print(f"Scene {i+1} has no code, will process")
-                else:
-                    print(f"Scene {i+1} already has code, skipping")
-            # For normal mode, process scenes that haven't been successfully rendered
-            elif not os.path.exists(os.path.join(scene_dir, "succ_rendered.txt")):
-                scenes_to_process.append((i+1, implementation_plan))
-        
-        if not scenes_to_process:
-            print(f"No scenes need processing for topic '{topic}'.")
-        else:
-            print(f"Rendering {len(scenes_to_process)} scenes that need processing...")
-            # Create a list of tuples with scene numbers and plans
-            scene_plans = [(scene_num, plan) for scene_num, plan in scenes_to_process]
-            # Sort by scene number to ensure correct order
-            scene_plans.sort(key=lambda x: x[0])
-            # Extract just the plans in the correct order
-            filtered_implementation_plans = [plan for _, plan in scene_plans]
-            await self.render_video_fix_code(topic, description, scene_outline, filtered_implementation_plans,
-                                           max_retries=max_retries, session_id=session_id)
-        
-        if not args.only_render:  # Skip video combination in only_render mode
-            print(f"Video rendering completed for topic '{topic}'.")
+        Args:
+            file_prefix (str): Prefix for file naming
+            scene_number (int): Scene number (1-based)
+            only_render (bool, optional): Whether only scenes without code are processed. Defaults to False.
+
+        Returns:
+            bool: True if the scene should be processed
+        """
+        # For only_render mode, only process scenes without code
+        if only_render:
+            has_code = self.run_manifest.has_stage(file_prefix, STAGE_CODE, scene=scene_number)
+            if has_code:
+                print(f"Scene {scene_number} already has code, skipping")
+            else:
+                print(f"Scene {scene_number} has no code, will process")
+            return not has_code
+        # For normal mode, process scenes that haven't been successfully rendered
+        return not self.run_manifest.has_stage(file_prefix, STAGE_RENDER, scene=scene_number)
+
+    async def combine_videos_async(self, topic: str):
+        """
+        Combine all videos for a topic in the combine stage without blocking the event loop.
+
+        Args:
+            topic (str): The topic to combine videos for
+        """
+        await self.pipeline.run_stage("combine", lambda: asyncio.to_thread(self.combine_videos, topic))
 
     def check_theorem_status(self, theorem: Dict) -> Dict[str, bool]:
         """
@@ -597,70 +818,19 @@ class VideoGenerator:
         topic = theorem['theorem']
         file_prefix = topic.lower()
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
-        
-        # Check scene outline
-        scene_outline_path = os.path.join(self.output_dir, file_prefix, f"{file_prefix}_scene_outline.txt")
-        has_scene_outline = os.path.exists(scene_outline_path)
-        
-        # Get number of scenes if outline exists
-        num_scenes = 0
-        if has_scene_outline:
-            with open(scene_outline_path, "r") as f:
-                scene_outline = f.read()
-            scene_outline_content = extract_xml(scene_outline)
-            num_scenes = len(re.findall(r'<SCENE_(\d+)>[^<]', scene_outline_content))
-        
-        # Check implementation plans, code files, and rendered videos
-        implementation_plans = 0
-        code_files = 0
-        rendered_scenes = 0
-        
-        # Track status of individual scenes
-        scene_status = []
-        for i in range(1, num_scenes + 1):
-            scene_dir = os.path.join(self.output_dir, file_prefix, f"scene{i}")
-            
-            # Check implementation plan
-            plan_path = os.path.join(scene_dir, f"{file_prefix}_scene{i}_implementation_plan.txt")
-            has_plan = os.path.exists(plan_path)
-            if has_plan:
-                implementation_plans += 1
-            
-            # Check code files
-            code_dir = os.path.join(scene_dir, "code")
-            has_code = False
-            if os.path.exists(code_dir):
-                if any(f.endswith('.py') for f in os.listdir(code_dir)):
-                    has_code = True
-                    code_files += 1
-            
-            # Check rendered scene video
-            has_render = False
-            if os.path.exists(scene_dir):
-                succ_rendered_path = os.path.join(scene_dir, "succ_rendered.txt")
-                if os.path.exists(succ_rendered_path):
-                    has_render = True
-                    rendered_scenes += 1
-            
-            scene_status.append({
-                'scene_number': i,
-                'has_plan': has_plan,
-                'has_code': has_code,
-                'has_render': has_render
-            })
-
-        # Check combined video
-        combined_video_path = os.path.join(self.output_dir, file_prefix, f"{file_prefix}_combined.mp4")
-        has_combined_video = os.path.exists(combined_video_path)
-        
+
+        # A single indexed manifest query replaces probing every scene directory
+        status = self.run_manifest.topic_status(file_prefix)
+        scene_status = status['scene_status']
+
         return {
             'topic': topic,
-            'has_scene_outline': has_scene_outline,
-            'total_scenes': num_scenes,
-            'implementation_plans': implementation_plans,
-            'code_files': code_files,
-            'rendered_scenes': rendered_scenes,
-            'has_combined_video': has_combined_video,
+            'has_scene_outline': status['has_scene_outline'],
+            'total_scenes': status['total_scenes'],
+            'implementation_plans': sum(1 for scene in scene_status if scene['has_plan']),
+            'code_files': sum(1 for scene in scene_status if scene['has_code']),
+            'rendered_scenes': sum(1 for scene in scene_status if scene['has_render']),
+            'has_combined_video': status['has_combined_video'],
             'scene_status': scene_status
         }
 
@@ -698,12 +868,55 @@ if __name__ == "__main__":
     parser.add_argument('--max_scene_concurrency', type=int, default=1, help='Maximum number of scenes to process concurrently')
     parser.add_argument('--max_topic_concurrency', type=int, default=1,
                        help='Maximum number of topics to process concurrently')
+    parser.add_argument('--max_render_concurrency', type=int, default=None,
+                       help='Maximum number of concurrent manim renders (defaults to available cores and memory)')
+    parser.add_argument('--adaptive_concurrency', action='store_true',
+                       help='Adapt topic and scene concurrency (AIMD) to latency, 429s, timeouts and render OOMs; '
+                            'the max_*_concurrency values become the starting limits')
+    parser.add_argument('--max_adaptive_concurrency', type=int, default=32,
+                       help='Upper bound for the adaptive topic and scene limits')
     parser.add_argument('--debug_combine_topic', type=str, help='Debug combine videos', default=None)
     parser.add_argument('--only_plan', action='store_true', help='Only generate scene outline and implementation plans')
     parser.add_argument('--check_status', action='store_true', 
                        help='Check planning and code status for all theorems')
+    parser.add_argument('--rebuild_manifest', action='store_true',
+                       help='Rebuild the run manifest from the existing output directory before running')
     parser.add_argument('--only_render', action='store_true', help='Only render scenes without combining videos')
+    parser.add_argument('--llm_cache_dir', type=str, default=None,
+                       help='Directory for the on-disk LLM response cache (disabled if not set)')
+    parser.add_argument('--llm_cache_max_mb', type=int, default=1024,
+                       help='Maximum size of the LLM response cache in MB')
     parser.add_argument('--scenes', nargs='+', type=int, help='Specific scenes to process (if theorems_path is provided)')
+    parser.add_argument('--rate_limit_rpm', type=float, default=None,
+                       help='Requests per minute allowed per provider deployment, shared by all topics')
+    parser.add_argument('--rate_limit_tpm', type=float, default=None,
+                       help='Tokens per minute allowed per provider deployment, shared by all topics')
+    parser.add_argument('--speculative_candidates', type=int, default=1,
+                       help='Number of code candidates generated and rendered concurrently per scene; the first clean render wins')
+    parser.add_argument('--candidate_models', nargs='+', type=str, choices=allowed_models, default=None,
+                       help='Models used for the speculative candidates in turn (defaults to --model)')
+    parser.add_argument('--candidate_temperatures', nargs='+', type=float, default=[0.7, 1.0, 0.4],
+                       help='Temperatures used for the speculative candidates in turn')
+    parser.add_argument('--skip_preflight', action='store_true',
+                       help='Render code directly without the static checks and dry construct pass')
+    parser.add_argument('--draft_quality', type=str, default='low',
+                       help='Render quality of fix-loop and visual reflection renders (low, medium, high, production, 4k or e.g. 720p30)')
+    parser.add_argument('--final_quality', type=str, default='high',
+                       help='Delivery quality the accepted version of each scene is rendered at (e.g. high or 1080p30)')
+    parser.add_argument('--max_prompt_tokens', type=int, default=None,
+                       help='Cap on code generation prompt tokens; examples, cheatsheet and RAG docs are cut to fit (defaults to the model context window)')
+    parser.add_argument('--trace_path', type=str, default=None,
+                       help='Append per-stage timing spans to this JSONL file and write a latency summary next to it')
+    parser.add_argument('--stream_formats', type=str, nargs='+', choices=['hls', 'dash'], default=None,
+                       help='Also package each accepted scene as stream-copied HLS/DASH segments with one chapter per scene, updated as scenes render')
+    parser.add_argument('--media_index_path', type=str, default=None,
+                       help='SQLite file caching ffprobe results and content hashes of videos (defaults to media_index.db in the output directory)')
+    parser.add_argument('--work_queue', type=str, default=None,
+                       help='Path to a shared work queue database; workers on several machines pull topics from it')
+    parser.add_argument('--worker_id', type=str, default=None,
+                       help='Worker id for the work queue (defaults to hostname-pid)')
+    parser.add_argument('--lease_seconds', type=float, default=600,
+                       help='Work queue lease duration; leases of dead workers are re-leased after it expires')
     args = parser.parse_args()
 
     # Initialize planner model using LiteLLM
@@ -711,29 +924,97 @@ if __name__ == "__main__":
         verbose = True
     else:
         verbose = False
+
+    # Identical prompts on reruns are answered from the response cache
+    response_cache = None
+    if args.llm_cache_dir:
+        response_cache = ResponseCache(args.llm_cache_dir, max_size_bytes=args.llm_cache_max_mb * 1024 * 1024)
+        atexit.register(lambda: print(f"LLM response cache: {response_cache.stats()}"))
+
+    if args.trace_path:
+        set_tracer(Tracer(args.trace_path))
+
+    # Shared with evaluate.py, so videos are probed once per content change rather than once per lookup
+    set_media_index(MediaIndex(args.media_index_path or os.path.join(args.output_dir, "media_index.db")))
+
+    def report_trace():
+        tracer = get_tracer()
+        if not tracer.summary():
+            return
+        print(f"\nPer-stage latency:\n{tracer.format_summary()}")
+        if tracer.trace_path:
+            summary_path = os.path.splitext(tracer.trace_path)[0] + "_summary.json"
+            tracer.write_summary(summary_path)
+            print(f"Trace written to {tracer.trace_path}, summary to {summary_path}")
+        tracer.close()
+
+    atexit.register(report_trace)
+
+    def make_topic_semaphore():
+        if args.adaptive_concurrency:
+            # Topic slots last minutes, so only overload signals (not latency) drive the topic limit
+            return AdaptiveLimiter("topics", args.max_topic_concurrency, max_limit=args.max_adaptive_concurrency, latency_tolerance=None)
+        return asyncio.Semaphore(args.max_topic_concurrency)
+
+    def print_concurrency(video_generator, topic_semaphore):
+        snapshot = video_generator.concurrency_snapshot()
+        if isinstance(topic_semaphore, AdaptiveLimiter):
+            snapshot["topics"] = topic_semaphore.snapshot()
+        print(f"Concurrency: {snapshot}")
+        get_tracer().event("concurrency", **snapshot)
+
+    # Wrappers pick up the limiter registered for their provider deployment
+    if args.rate_limit_rpm or args.rate_limit_tpm:
+        for model_name in {args.model, args.helper_model or args.model}:
+            rate_limiter = configure_rate_limit(model_name, args.rate_limit_rpm, args.rate_limit_tpm)
+            atexit.register(lambda limiter=rate_limiter: print(f"Rate limiter: {limiter.stats()}"))
+
     planner_model = LiteLLMWrapper(
         model_name=args.model,
         temperature=0.7,
         print_cost=True,
         verbose=verbose,
-        use_langfuse=args.use_langfuse
+        use_langfuse=args.use_langfuse,
+        cache=response_cache
     )
     helper_model = LiteLLMWrapper(
         model_name=args.helper_model if args.helper_model else args.model, # Use helper_model if provided, else planner_model
         temperature=0.7,
         print_cost=True,
         verbose=verbose,
-        use_langfuse=args.use_langfuse
+        use_langfuse=args.use_langfuse,
+        cache=response_cache
     )
     scene_model = LiteLLMWrapper( # Initialize scene_model separately
         model_name=args.model,
         temperature=0.7,
         print_cost=True,
         verbose=verbose,
-        use_langfuse=args.use_langfuse
+        use_langfuse=args.use_langfuse,
+        cache=response_cache
     )
     print(f"Planner model: {args.model}, Helper model: {args.helper_model if args.helper_model else args.model}, Scene model: {args.model}") # Print all models
 
+    # Speculative candidates differ in model and/or temperature so they explore different code
+    candidate_models = None
+    if args.speculative_candidates > 1:
+        candidate_model_names = args.candidate_models or [args.model]
+        candidate_models = [
+            LiteLLMWrapper(
+                model_name=candidate_model_names[j % len(candidate_model_names)],
+                temperature=args.candidate_temperatures[j % len(args.candidate_temperatures)],
+                print_cost=True,
+                verbose=verbose,
+                use_langfuse=args.use_langfuse,
+                cache=response_cache
+            )
+            for j in range(args.speculative_candidates)
+        ]
+        print(f"Speculative candidates: {[(m.model_name, m.temperature) for m in candidate_models]}")
+
+    # Shows how much of each prompt the providers served from their prompt caches
+    atexit.register(lambda: print(f"Prompt cache: {[model.prompt_cache_stats() for model in [planner_model, helper_model, scene_model] + (candidate_models or [])]}"))
+
 
     if args.theorems_path:
         # Load the sample theorems
@@ -745,27 +1026,13 @@ if __name__ == "__main__":
 
         if args.peek_existing_videos:
             print(f"Here's the results of checking whether videos are rendered successfully in {args.output_dir}:")
-            # in output_dir, find all combined.mp4 files and print number of successful rendered videos out of total number of folders
-            successful_rendered_videos = 0
-            total_folders = 0
-            for item in os.listdir(args.output_dir):
-                if os.path.isdir(os.path.join(args.output_dir, item)):
-                    total_folders += 1
-                    if os.path.exists(os.path.join(args.output_dir, item, f"{item}_combined.mp4")):
-                        successful_rendered_videos += 1
-            print(f"Number of successful rendered videos: {successful_rendered_videos}/{total_folders}")
-
-            # also check whether any succ_rendered.txt in scene{i} folder, and then add up the number of successful rendered videos
-            successful_rendered_videos = 0
-            total_scenes = 0
-            for item in os.listdir(args.output_dir):
-                if os.path.isdir(os.path.join(args.output_dir, item)):
-                    for scene_folder in os.listdir(os.path.join(args.output_dir, item)):
-                        if "scene" in scene_folder and os.path.isdir(os.path.join(args.output_dir, item, scene_folder)):
-                            total_scenes += 1
-                            if os.path.exists(os.path.join(args.output_dir, item, scene_folder, "succ_rendered.txt")):
-                                successful_rendered_videos += 1
-            print(f"Number of successful rendered scenes: {successful_rendered_videos}/{total_scenes}")
+            run_manifest = RunManifest(args.output_dir)
+            if not run_manifest.is_imported or args.rebuild_manifest:
+                run_manifest.import_output_tree()
+            # count topics with a combined video out of all planned topics
+            print(f"Number of successful rendered videos: {run_manifest.count_topics(STAGE_COMBINE)}/{run_manifest.count_topics()}")
+            # and the number of successfully rendered scenes out of all scenes in the outlines
+            print(f"Number of successful rendered scenes: {run_manifest.count_scenes(STAGE_RENDER)}/{run_manifest.count_scenes()}")
             exit()
 
         video_generator = VideoGenerator(
@@ -782,7 +1049,18 @@ if __name__ == "__main__":
             embedding_model=args.embedding_model,
             use_visual_fix_code=args.use_visual_fix_code,
             use_langfuse=args.use_langfuse,
-            max_scene_concurrency=args.max_scene_concurrency
+            max_scene_concurrency=args.max_scene_concurrency,
+            max_render_concurrency=args.max_render_concurrency,
+            rebuild_manifest=args.rebuild_manifest,
+            adaptive_concurrency=args.adaptive_concurrency,
+            max_adaptive_concurrency=args.max_adaptive_concurrency,
+            speculative_candidates=args.speculative_candidates,
+            candidate_models=candidate_models,
+            use_preflight=not args.skip_preflight,
+            draft_quality=args.draft_quality,
+            final_quality=args.final_quality,
+            max_prompt_tokens=args.max_prompt_tokens,
+            stream_formats=args.stream_formats
         )
 
         if args.debug_combine_topic is not None:
@@ -801,9 +1079,10 @@ if __name__ == "__main__":
 
             async def main():
                 # Use the command-line argument for topic concurrency
-                topic_semaphore = asyncio.Semaphore(args.max_topic_concurrency)
+                topic_semaphore = make_topic_semaphore()
                 tasks = [process_theorem(theorem, topic_semaphore) for theorem in theorems]
                 await asyncio.gather(*tasks)
+                print_concurrency(video_generator, topic_semaphore)
 
             asyncio.run(main())
 
@@ -823,7 +1102,17 @@ if __name__ == "__main__":
                 embedding_model=args.embedding_model,
                 use_visual_fix_code=args.use_visual_fix_code,
                 use_langfuse=args.use_langfuse,
-                max_scene_concurrency=args.max_scene_concurrency
+                max_scene_concurrency=args.max_scene_concurrency,
+                max_render_concurrency=args.max_render_concurrency,
+                adaptive_concurrency=args.adaptive_concurrency,
+                max_adaptive_concurrency=args.max_adaptive_concurrency,
+                speculative_candidates=args.speculative_candidates,
+                candidate_models=candidate_models,
+                use_preflight=not args.skip_preflight,
+                draft_quality=args.draft_quality,
+                final_quality=args.final_quality,
+                max_prompt_tokens=args.max_prompt_tokens,
+                stream_formats=args.stream_formats
             )
             
             all_statuses = [video_generator.check_theorem_status(theorem) for theorem in theorems]
@@ -888,31 +1177,52 @@ if __name__ == "__main__":
             # Generate video pipeline from scratch
             print("Generating video pipeline from scratch...")
 
+            async def run_theorem(theorem):
+                topic = theorem['theorem']
+                description = theorem['description']
+                print(f"Processing topic: {topic}")
+                if args.only_combine:
+                    video_generator.combine_videos(topic)
+                else:
+                    await video_generator.generate_video_pipeline(
+                        topic, 
+                        description, 
+                        max_retries=args.max_retries,
+                        only_plan=args.only_plan,
+                        specific_scenes=args.scenes,
+                        only_render=args.only_render
+                    )
+                    if not args.only_plan and not args.only_render:  # Add condition for only_render
+                        await video_generator.combine_videos_async(topic)
+
             async def process_theorem(theorem, topic_semaphore):
                 async with topic_semaphore:
-                    topic = theorem['theorem']
-                    description = theorem['description']
-                    print(f"Processing topic: {topic}")
-                    if args.only_combine:
-                        video_generator.combine_videos(topic)
-                    else:
-                        await video_generator.generate_video_pipeline(
-                            topic, 
-                            description, 
-                            max_retries=args.max_retries,
-                            only_plan=args.only_plan,
-                            specific_scenes=args.scenes
-                        )
-                        if not args.only_plan and not args.only_render:  # Add condition for only_render
-                            video_generator.combine_videos(topic)
+                    await run_theorem(theorem)
 
             async def main():
                 # Use the command-line argument for topic concurrency
-                topic_semaphore = asyncio.Semaphore(args.max_topic_concurrency)
+                topic_semaphore = make_topic_semaphore()
                 tasks = [process_theorem(theorem, topic_semaphore) for theorem in theorems]
                 await asyncio.gather(*tasks)
-
-            asyncio.run(main())
+                print_concurrency(video_generator, topic_semaphore)
+
+            async def queue_main():
+                # Every worker seeds the shared queue (idempotent), then pulls topics until none are left
+                work_queue = WorkQueue(args.work_queue, lease_seconds=args.lease_seconds)
+                for theorem in theorems:
+                    work_queue.enqueue(theorem['theorem'], theorem)
+                worker_id = args.worker_id or default_worker_id()
+                topic_semaphore = make_topic_semaphore()
+                slots = args.max_adaptive_concurrency if args.adaptive_concurrency else args.max_topic_concurrency
+                # One lease loop per topic slot; the topic semaphore gates when a loop may lease
+                completed = await asyncio.gather(*[
+                    work_queue.run_worker(f"{worker_id}-{slot}", run_theorem, slot_limiter=topic_semaphore)
+                    for slot in range(slots)
+                ])
+                print(f"Worker {worker_id} completed {sum(completed)} topics, queue status: {work_queue.counts()}")
+                print_concurrency(video_generator, topic_semaphore)
+
+            asyncio.run(queue_main() if args.work_queue else main())
 
     elif args.topic and args.context:
         video_generator = VideoGenerator(
@@ -929,7 +1239,18 @@ if __name__ == "__main__":
             embedding_model=args.embedding_model,
             use_visual_fix_code=args.use_visual_fix_code,
             use_langfuse=args.use_langfuse,
-            max_scene_concurrency=args.max_scene_concurrency
+            max_scene_concurrency=args.max_scene_concurrency,
+            max_render_concurrency=args.max_render_concurrency,
+            rebuild_manifest=args.rebuild_manifest,
+            adaptive_concurrency=args.adaptive_concurrency,
+            max_adaptive_concurrency=args.max_adaptive_concurrency,
+            speculative_candidates=args.speculative_candidates,
+            candidate_models=candidate_models,
+            use_preflight=not args.skip_preflight,
+            draft_quality=args.draft_quality,
+            final_quality=args.final_quality,
+            max_prompt_tokens=args.max_prompt_tokens,
+            stream_formats=args.stream_formats
         )
         # Process single topic with context
         print(f"Processing topic: {args.topic}")
@@ -946,6 +1267,7 @@ if __name__ == "__main__":
                 args.context,
                 max_retries=args.max_retries,
                 only_plan=args.only_plan,
+                only_render=args.only_render
             ))
             if not args.only_plan and not args.only_render:
                 video_generator.combine_videos(args.topic)
@@ -0,0 +1,175 @@
+import os
+import io
+import json
+import hashlib
+import tempfile
+import threading
+from typing import List, Dict, Any, Optional
+from PIL import Image
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache for model responses.
+
+    Entries are keyed on the model name, the normalized messages and the sampling
+    parameters. Media messages contribute the hash of their content rather than their
+    path, so a re-rendered frame with identical pixels still hits while a changed frame
+    with the same file name does not. Each entry is a small JSON file stored under a
+    two-character shard directory; the file mtime doubles as the last-access time for
+    LRU eviction once the cache grows past `max_size_bytes`.
+
+    Args:
+        cache_dir (str): Directory that holds the cache entries
+        max_size_bytes (int, optional): Size bound of the cache. Defaults to 1 GiB.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+    def _entry_paths(self) -> List[str]:
+        """List the paths of all cache entries.
+
+        Returns:
+            List[str]: Paths of the entry files
+        """
+        paths = []
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            paths.extend(
+                os.path.join(shard_dir, name) for name in os.listdir(shard_dir) if name.endswith(".json")
+            )
+        return paths
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    @staticmethod
+    def _hash_media(content: Any) -> str:
+        """Hash the content of a media message.
+
+        Args:
+            content: PIL Image, local file path or URL
+
+        Returns:
+            str: Hash of the media content, or the URL itself for remote media
+        """
+        if isinstance(content, Image.Image):
+            buffered = io.BytesIO()
+            content.save(buffered, format="PNG")
+            return hashlib.sha256(buffered.getvalue()).hexdigest()
+        if isinstance(content, str) and os.path.isfile(content):
+            digest = hashlib.sha256()
+            with open(content, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        return str(content)
+
+    def make_key(self, model_name: str, messages: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None) -> str:
+        """Compute the cache key for a request.
+
+        Args:
+            model_name (str): Name of the model
+            messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+            params (Dict[str, Any], optional): Sampling parameters such as temperature
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        normalized = []
+        for msg in messages:
+            if msg["type"] == "text":
+                normalized.append({"type": "text", "content": msg["content"]})
+            else:
+                normalized.append({"type": msg["type"], "content": self._hash_media(msg["content"])})
+        payload = json.dumps(
+            {"model": model_name, "messages": normalized, "params": params or {}},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response and mark it as recently used.
+
+        Args:
+            key (str): Cache key from `make_key`
+
+        Returns:
+            Optional[str]: The cached response, or None on a miss
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = json.load(f)["response"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response, evicting least recently used entries if needed.
+
+        Args:
+            key (str): Cache key from `make_key`
+            response (str): Response text to store
+        """
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"response": response}, f)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size_bytes += os.path.getsize(path) - old_size
+            if self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is 10% below its bound."""
+        target = self.max_size_bytes * 0.9
+        entries = []
+        for path in self._entry_paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self._size_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._size_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache usage.
+
+        Returns:
+            Dict[str, Any]: Hit and miss counts, hit rate and current size in bytes
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size_bytes": self._size_bytes
+            }
@@ -7,9 +7,13 @@ import mimetypes
 import google.generativeai as genai
 import tempfile
 import time
+import asyncio
 from urllib.parse import urlparse
 import requests
 from io import BytesIO
+from google.api_core import exceptions as google_exceptions
+from .cache import ResponseCache
+from .rate_limiter import report_overload
 
 class GeminiWrapper:
     """Wrapper for Gemini to support multiple models and logging"""
@@ -20,7 +24,8 @@ class GeminiWrapper:
         temperature: float = 0.7,
         print_cost: bool = False,
         verbose: bool = False,
-        use_langfuse: bool = False
+        use_langfuse: bool = False,
+        cache: Optional[ResponseCache] = None
     ):
         """
         Initialize the Gemini wrapper
@@ -31,8 +36,10 @@ class GeminiWrapper:
             print_cost: Whether to print the cost of the completion
             verbose: Whether to print verbose output
             use_langfuse: Whether to enable Langfuse logging
+            cache: Optional response cache; identical requests are answered from it
         """
         self.model_name = model_name.split('/')[-1] if '/' in model_name else model_name
+        self.cache = cache
         self.temperature = temperature
         self.print_cost = print_cost
         self.verbose = verbose
@@ -43,7 +50,7 @@ class GeminiWrapper:
             raise ValueError("No API_KEY found. Please set the `GEMINI_API_KEY` or `GOOGLE_API_KEY` environment variable.")
         genai.configure(api_key=api_key)
 
-        generation_config = {
+        self.generation_config = generation_config = {
             "temperature": self.temperature,
             "top_p": 0.95,
             "response_mime_type": "text/plain",
@@ -122,16 +129,15 @@ class GeminiWrapper:
         """
         return genai.upload_file(file_path, mime_type=mime_type)
 
-    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+    def _prepare_contents(self, messages: List[Dict[str, Any]]) -> List[Any]:
         """
-        Process messages and return completion
+        Convert messages to Gemini contents, uploading media files as needed
         
         Args:
             messages: List of message dictionaries with 'type' and 'content' keys
-            metadata: Optional metadata to pass to Gemini completion
         
         Returns:
-            Generated text response
+            List of contents accepted by GenerativeModel.generate_content
         """
         contents = []
         for msg in messages:
@@ -163,8 +169,18 @@ class GeminiWrapper:
                 contents.append(uploaded_file)
             else:
                 raise ValueError("Unsupported message type")
+        return contents
 
-        response = self.model.generate_content(contents, request_options={"timeout": 600})
+    def _handle_response(self, response) -> str:
+        """
+        Extract the text content from a Gemini response
+        
+        Args:
+            response: Response returned by generate_content / generate_content_async
+        
+        Returns:
+            Generated text response, or the prompt feedback if the response was blocked
+        """
         try:
             return response.text
         except Exception as e:
@@ -172,5 +188,87 @@ class GeminiWrapper:
             print(response.prompt_feedback)
             return str(response.prompt_feedback)
 
+    def _cache_key(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Compute the response cache key for a request
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+        
+        Returns:
+            Cache key, or None if no cache is configured
+        """
+        if self.cache is None:
+            return None
+        params = {"temperature": self.generation_config["temperature"], "top_p": self.generation_config["top_p"]}
+        return self.cache.make_key(self.model_name, messages, params)
+
+    def _cache_response(self, cache_key: Optional[str], response) -> None:
+        """
+        Store a successful response in the cache; blocked responses are not cached
+        
+        Args:
+            cache_key: Key from _cache_key, or None if no cache is configured
+            response: Response returned by generate_content / generate_content_async
+        """
+        if cache_key is None:
+            return
+        try:
+            text = response.text
+        except Exception:
+            return
+        self.cache.put(cache_key, text)
+
+    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Process messages and return completion
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to Gemini completion
+        
+        Returns:
+            Generated text response
+        """
+        cache_key = self._cache_key(messages)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        contents = self._prepare_contents(messages)
+        response = self.model.generate_content(contents, request_options={"timeout": 600})
+        self._cache_response(cache_key, response)
+        return self._handle_response(response)
+
+    async def acall(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Process messages and return completion without blocking the event loop
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to Gemini completion
+        
+        Returns:
+            Generated text response
+        """
+        # Hashing media for the cache key reads whole files, so keep it off the event loop
+        cache_key = await asyncio.to_thread(self._cache_key, messages)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        # Media uploads poll with time.sleep, so keep them off the event loop
+        contents = await asyncio.to_thread(self._prepare_contents, messages)
+        try:
+            response = await self.model.generate_content_async(contents, request_options={"timeout": 600})
+        except google_exceptions.ResourceExhausted:
+            report_overload("rate_limit")
+            raise
+        except google_exceptions.DeadlineExceeded:
+            report_overload("timeout")
+            raise
+        self._cache_response(cache_key, response)
+        return self._handle_response(response)
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -1,17 +1,26 @@
 import json
 import re
-from typing import List, Dict, Any, Union, Optional
+import time
+import asyncio
+import contextlib
+from typing import List, Dict, Any, AsyncIterator, Union, Optional
 import io
 import os
 import base64
 from PIL import Image
 import mimetypes
 import litellm
-from litellm import completion, completion_cost
+from litellm import completion, acompletion, completion_cost
 from dotenv import load_dotenv
+from .cache import ResponseCache
+from .rate_limiter import RateLimiter, estimate_tokens, get_rate_limiter, has_overload_listeners, report_overload
 
 load_dotenv()
 
+# How far back acall_stream re-searches for its stop pattern when a delta arrives, so
+# matching stays linear in the response length; stop patterns must be shorter than this
+STOP_PATTERN_OVERLAP = 1024
+
 class LiteLLMWrapper:
     """Wrapper for LiteLLM to support multiple models and logging"""
     
@@ -22,6 +31,8 @@ class LiteLLMWrapper:
         print_cost: bool = False,
         verbose: bool = False,
         use_langfuse: bool = True,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
     ):
         """
         Initialize the LiteLLM wrapper
@@ -32,12 +43,22 @@ class LiteLLMWrapper:
             print_cost: Whether to print the cost of the completion
             verbose: Whether to print verbose output
             use_langfuse: Whether to enable Langfuse logging
+            cache: Optional response cache; identical requests are answered from it
+            rate_limiter: Optional RPM/TPM limiter; defaults to the shared limiter configured
+                for this model's provider and deployment, if any
         """
         self.model_name = model_name
+        self.cache = cache
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter(model_name)
+        self.rate_limit_retries = 8
         self.temperature = temperature
         self.print_cost = print_cost
         self.verbose = verbose
         self.accumulated_cost = 0
+        # OpenAI, Azure and Gemini cache stable prompt prefixes automatically; Anthropic needs markers
+        self.use_cache_markers = "claude" in model_name or model_name.startswith("anthropic/")
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
 
         if self.verbose:
             os.environ['LITELLM_LOG'] = 'DEBUG'
@@ -80,28 +101,26 @@ class LiteLLMWrapper:
             raise ValueError(f"Unsupported file type: {file_path}")
         return mime_type
 
-    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+    def _format_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Process messages and return completion
+        Convert messages to LiteLLM format
         
         Args:
             messages: List of message dictionaries with 'type' and 'content' keys
-            metadata: Optional metadata to pass to litellm completion, e.g. for Langfuse tracking
         
         Returns:
-            Generated text response
+            List of messages in the LiteLLM (OpenAI) chat format
         """
-        if metadata is None:
-            print("No metadata provided, using empty metadata")
-            metadata = {}
-        metadata["trace_name"] = f"litellm-completion-{self.model_name}"
-        # Convert messages to LiteLLM format
         formatted_messages = []
         for msg in messages:
             if msg["type"] == "text":
+                part = {"type": "text", "text": msg["content"]}
+                if msg.get("cache") and self.use_cache_markers:
+                    # The provider caches the prompt prefix up to and including this part
+                    part["cache_control"] = {"type": "ephemeral"}
                 formatted_messages.append({
                     "role": "user",
-                    "content": [{"type": "text", "text": msg["content"]}]
+                    "content": [part]
                 })
             elif msg["type"] in ["image", "audio", "video"]:
                 # Check if content is a local file path or PIL Image
@@ -150,44 +169,424 @@ class LiteLLMWrapper:
                         raise ValueError("For GPT, only text and image inferencing are supported")
                 else:
                     raise ValueError("Only support Gemini and Gpt for Multimodal capability now")
+        return formatted_messages
+
+    def _completion_kwargs(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Build the keyword arguments shared by completion and acompletion
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to litellm completion, e.g. for Langfuse tracking
+        
+        Returns:
+            Keyword arguments for litellm.completion / litellm.acompletion
+        """
+        if metadata is None:
+            print("No metadata provided, using empty metadata")
+            metadata = {}
+        metadata["trace_name"] = f"litellm-completion-{self.model_name}"
+        kwargs = {
+            "model": self.model_name,
+            "messages": self._format_messages(messages),
+            "temperature": self.temperature,
+            "metadata": metadata,
+            # With a limiter, 429s pause the shared budget instead of being retried blindly; with an
+            # adaptive limiter they must surface so that report_overload can shrink concurrency
+            "max_retries": 2 if self.rate_limiter is not None or has_overload_listeners() else 99
+        }
+        # if it's openai o series model, set temperature to None and reasoning_effort to "medium"
+        if (re.match(r"^o\d+.*$", self.model_name) or re.match(r"^openai/o.*$", self.model_name)):
+            self.temperature = None
+            self.reasoning_effort = "medium"
+            kwargs["temperature"] = self.temperature
+            kwargs["reasoning_effort"] = self.reasoning_effort
+        return kwargs
+
+    def _handle_response(self, response) -> str:
+        """
+        Track cost and extract the text content from a completion response
+        
+        Args:
+            response: Response returned by litellm.completion / litellm.acompletion
+        
+        Returns:
+            Generated text response
+        """
+        if self.print_cost:
+            # pass your response from completion to completion_cost
+            cost = completion_cost(completion_response=response)
+            self.accumulated_cost += cost
+            print(f"Accumulated Cost: ${self.accumulated_cost:.10f}")
+        self._track_prompt_cache(getattr(response, "usage", None))
+            
+        content = response.choices[0].message.content
+        if content is None:
+            print(f"Got null response from model. Full response: {response}")
+        return content
+
+    def _track_prompt_cache(self, usage) -> None:
+        """
+        Count prompt tokens and the share served from the provider's prompt cache
+        
+        Args:
+            usage: Usage block of a response, in LiteLLM's OpenAI format
+        """
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        # Anthropic cache reads are also mapped into prompt_tokens_details by LiteLLM
+        cached_tokens = getattr(details, "cached_tokens", None) or getattr(usage, "cache_read_input_tokens", None) or 0
+        self.prompt_tokens += prompt_tokens
+        self.cached_prompt_tokens += cached_tokens
+        if self.print_cost:
+            print(f"Prompt tokens: {prompt_tokens} ({cached_tokens} cached)")
+
+    def prompt_cache_stats(self) -> Dict[str, Any]:
+        """
+        Report prompt tokens sent so far and how many were served from the provider's prompt cache
+        
+        Returns:
+            Dictionary with model, prompt_tokens, cached_prompt_tokens and cached_share
+        """
+        return {
+            "model": self.model_name,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "cached_share": self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        }
 
+    def _cache_key(self, messages: List[Dict[str, Any]], kwargs: Dict[str, Any], stop_pattern: Optional[str] = None) -> Optional[str]:
+        """
+        Compute the response cache key for a request
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            kwargs: Keyword arguments built by _completion_kwargs
+            stop_pattern: Pattern a streamed response was truncated at, if any
+        
+        Returns:
+            Cache key, or None if no cache is configured
+        """
+        if self.cache is None:
+            return None
+        params = {
+            "temperature": kwargs.get("temperature"),
+            "reasoning_effort": kwargs.get("reasoning_effort")
+        }
+        if stop_pattern is not None:
+            # A truncated response must not be served for a different (or no) stop pattern
+            params["stop_pattern"] = stop_pattern
+        return self.cache.make_key(self.model_name, messages, params)
+
+    def _prepare_request(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None, stop_pattern: Optional[str] = None) -> tuple:
+        """
+        Build the completion kwargs and the cache key of a request
+        
+        Both base64-encode or hash every image and video in the messages, so async
+        callers run this in a thread.
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to litellm completion
+            stop_pattern: Pattern a streamed response is truncated at, if any
+        
+        Returns:
+            Tuple of the completion kwargs and the cache key (None without a cache)
+        """
+        kwargs = self._completion_kwargs(messages, metadata)
+        return kwargs, self._cache_key(messages, kwargs, stop_pattern)
+
+    def _report_failure(self, error: Exception) -> None:
+        """
+        Signal overload to the adaptive concurrency controllers for rate limits and timeouts
+        
+        Args:
+            error: Exception raised by the completion call
+        """
+        if isinstance(error, litellm.RateLimitError):
+            report_overload("rate_limit")
+        elif isinstance(error, litellm.Timeout):
+            report_overload("timeout")
+
+    def _retry_after(self, error: Exception, attempt: int) -> float:
+        """
+        Get the pause requested by a rate limit error
+        
+        Args:
+            error: The rate limit error raised by litellm
+            attempt: Zero-based attempt number, used for exponential backoff
+        
+        Returns:
+            Seconds to pause
+        """
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
         try:
-            # if it's openai o series model, set temperature to None and reasoning_effort to "medium"
-            if (re.match(r"^o\d+.*$", self.model_name) or re.match(r"^openai/o.*$", self.model_name)):
-                self.temperature = None
-                self.reasoning_effort = "medium"
-                response = completion(
-                    model=self.model_name,
-                    messages=formatted_messages,
-                    temperature=self.temperature,
-                    reasoning_effort=self.reasoning_effort,
-                    metadata=metadata,
-                    max_retries=99
-                )
-            else:
-                response = completion(
-                    model=self.model_name,
-                    messages=formatted_messages,
-                    temperature=self.temperature,
-                    metadata=metadata,
-                    max_retries=99
-                )
-            if self.print_cost:
-                # pass your response from completion to completion_cost
-                cost = completion_cost(completion_response=response)
-                formatted_string = f"Cost: ${float(cost):.10f}"
-                # print(formatted_string)
-                self.accumulated_cost += cost
-                print(f"Accumulated Cost: ${self.accumulated_cost:.10f}")
-                
-            content = response.choices[0].message.content
-            if content is None:
-                print(f"Got null response from model. Full response: {response}")
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return min(60.0, 2.0 ** attempt)
+
+    def _completion(self, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]):
+        """
+        Call litellm.completion, waiting for the rate limiter if one is configured
+        
+        Rate limit errors and timeouts are reported as overload and retried with backoff.
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            kwargs: Keyword arguments built by _completion_kwargs
+        
+        Returns:
+            The litellm response
+        """
+        estimated = estimate_tokens(messages) if self.rate_limiter is not None else 0
+        for attempt in range(self.rate_limit_retries):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_sync(estimated)
+            try:
+                response = completion(**kwargs)
+            except (litellm.RateLimitError, litellm.Timeout) as e:
+                if isinstance(e, litellm.RateLimitError) and self.rate_limiter is not None:
+                    # A rejected request consumed nothing; give its reservation back to the budget
+                    self.rate_limiter.record_usage(estimated, 0)
+                if attempt == self.rate_limit_retries - 1:
+                    # The caller reports the final failure
+                    raise
+                self._report_failure(e)
+                time.sleep(self._backoff(e, attempt))
+                continue
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_usage(estimated, getattr(getattr(response, "usage", None), "total_tokens", None))
+            return response
+
+    async def _acompletion(self, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]):
+        """
+        Call litellm.acompletion, waiting for the rate limiter if one is configured
+        
+        Rate limit errors and timeouts are reported as overload and retried with backoff.
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            kwargs: Keyword arguments built by _completion_kwargs
+        
+        Returns:
+            The litellm response
+        """
+        estimated = estimate_tokens(messages) if self.rate_limiter is not None else 0
+        for attempt in range(self.rate_limit_retries):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(estimated)
+            try:
+                response = await acompletion(**kwargs)
+            except (litellm.RateLimitError, litellm.Timeout) as e:
+                if isinstance(e, litellm.RateLimitError) and self.rate_limiter is not None:
+                    # A rejected request consumed nothing; give its reservation back to the budget
+                    self.rate_limiter.record_usage(estimated, 0)
+                if attempt == self.rate_limit_retries - 1:
+                    # The caller reports the final failure
+                    raise
+                self._report_failure(e)
+                await asyncio.sleep(self._backoff(e, attempt))
+                continue
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_usage(estimated, getattr(getattr(response, "usage", None), "total_tokens", None))
+            return response
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        """
+        Pause before retrying a rate limited or timed out request
+        
+        With a rate limiter, a rate limit error pauses the whole shared budget and the
+        retry then waits in acquire; otherwise only this request backs off.
+        
+        Args:
+            error: The rate limit error or timeout raised by litellm
+            attempt: Zero-based attempt number, used for exponential backoff
+        
+        Returns:
+            Seconds this request should sleep itself
+        """
+        if isinstance(error, litellm.RateLimitError) and self.rate_limiter is not None:
+            self.rate_limiter.penalize(self._retry_after(error, attempt))
+            return 0.0
+        return self._retry_after(error, attempt)
+
+    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Process messages and return completion
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to litellm completion, e.g. for Langfuse tracking
+        
+        Returns:
+            Generated text response
+        """
+        kwargs = self._completion_kwargs(messages, metadata)
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        try:
+            response = self._completion(messages, kwargs)
+            content = self._handle_response(response)
+            if cache_key is not None and content is not None:
+                self.cache.put(cache_key, content)
+            return content
+        except Exception as e:
+            print(f"Error in model completion: {e}")
+            self._report_failure(e)
+            return str(e)
+
+    async def acall(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Process messages and return completion without blocking the event loop
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to litellm completion, e.g. for Langfuse tracking
+        
+        Returns:
+            Generated text response
+        """
+        # Encoding media for the request blocks, so keep it off the event loop
+        kwargs, cache_key = await asyncio.to_thread(self._prepare_request, messages, metadata)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        try:
+            response = await self._acompletion(messages, kwargs)
+            content = self._handle_response(response)
+            if cache_key is not None and content is not None:
+                self.cache.put(cache_key, content)
             return content
+        except Exception as e:
+            print(f"Error in model completion: {e}")
+            self._report_failure(e)
+            return str(e)
+
+    async def astream(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Stream a completion as text deltas
+        
+        The caller may stop iterating at any time; closing the generator (e.g. with
+        contextlib.aclosing) closes the connection so the provider stops generating.
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to litellm completion, e.g. for Langfuse tracking
+        
+        Yields:
+            Text deltas in the order they are generated
+        """
+        kwargs = await asyncio.to_thread(self._completion_kwargs, messages, metadata)
+        kwargs["stream"] = True
+        response = await self._acompletion(messages, kwargs)
+        chunks = []
+        generated = []
+        try:
+            async for chunk in response:
+                chunks.append(chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    generated.append(delta)
+                    yield delta
+        finally:
+            await self._close_stream(response)
+            self._track_stream_usage(kwargs, chunks, "".join(generated))
+            # Providers that report usage in streams do so in the last chunks
+            self._track_prompt_cache(next((chunk.usage for chunk in reversed(chunks) if getattr(chunk, "usage", None)), None))
+
+    async def _close_stream(self, response) -> None:
+        """
+        Close the provider connection of a streamed response, if the provider exposes it
+        
+        Args:
+            response: Stream returned by litellm.acompletion(stream=True)
+        """
+        stream = getattr(response, "completion_stream", None)
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is None:
+            return
+        try:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+        except Exception as e:
+            print(f"Error closing completion stream: {e}")
+
+    def _track_stream_usage(self, kwargs: Dict[str, Any], chunks: List[Any], text: str) -> None:
+        """
+        Track cost and rate limiter usage of a (possibly truncated) streamed response
+        
+        Args:
+            kwargs: Keyword arguments built by _completion_kwargs
+            chunks: Chunks received before the stream ended or was closed
+            text: Generated text received so far
+        """
+        if self.rate_limiter is not None:
+            # Prompt tokens were reserved up front; streamed responses report no usage, so charge the output
+            self.rate_limiter.record_usage(0, estimate_tokens([{"type": "text", "content": text}]))
+        if self.print_cost and chunks:
+            try:
+                response = litellm.stream_chunk_builder(chunks, messages=kwargs["messages"])
+                self.accumulated_cost += completion_cost(completion_response=response)
+                print(f"Accumulated Cost: ${self.accumulated_cost:.10f}")
+            except Exception as e:
+                print(f"Could not compute cost of streamed response: {e}")
+
+    async def acall_stream(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None, stop_pattern: Optional[str] = None) -> str:
+        """
+        Stream a completion and stop as soon as the text matches `stop_pattern`
+        
+        Used for code generation, where everything the model writes after the closing
+        code fence is discarded anyway; stopping there saves the time and output tokens
+        of the trailing commentary.
+        
+        Args:
+            messages: List of message dictionaries with 'type' and 'content' keys
+            metadata: Optional metadata to pass to litellm completion, e.g. for Langfuse tracking
+            stop_pattern: Regex searched (with re.DOTALL) in the accumulated text; the stream
+                is closed after the first match. Only the new text and the last
+                STOP_PATTERN_OVERLAP characters before it are searched, so the pattern should
+                match a short end marker. Defaults to None (read the whole stream).
         
+        Returns:
+            Generated text, up to the end of the first match of `stop_pattern`
+        """
+        cache_key = None
+        if self.cache is not None:
+            _, cache_key = await asyncio.to_thread(self._prepare_request, messages, metadata, stop_pattern)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        stop_regex = re.compile(stop_pattern, re.DOTALL) if stop_pattern else None
+        text = ""
+        matched = stop_regex is None
+        try:
+            async with contextlib.aclosing(self.astream(messages, metadata)) as stream:
+                async for delta in stream:
+                    search_from = max(0, len(text) - STOP_PATTERN_OVERLAP)
+                    text += delta
+                    if stop_regex is not None:
+                        match = stop_regex.search(text, search_from)
+                        if match:
+                            text = text[:match.end()]
+                            matched = True
+                            break
         except Exception as e:
             print(f"Error in model completion: {e}")
+            self._report_failure(e)
             return str(e)
+        # A stream that ended without the pattern (e.g. cut off by the token limit) is not cached
+        if cache_key is not None and text and matched:
+            self.cache.put(cache_key, text)
+        return text
         
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,259 @@
+import time
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+import tiktoken
+
+# Rough prompt cost of a high-detail image, used when estimating tokens up front
+IMAGE_TOKEN_ESTIMATE = 765
+
+_encoding = None
+_limiters: Dict[str, "RateLimiter"] = {}
+_limiters_lock = threading.Lock()
+# Callbacks notified of overload signals (429s, timeouts, OOMs) raised in the current task
+_overload_listeners: ContextVar[tuple] = ContextVar("overload_listeners", default=())
+
+
+def add_overload_listener(listener: Callable[[str], None]):
+    """Register a callback for overload signals raised in the current context.
+
+    Tasks created afterwards inherit the registration, so a limiter held around a whole
+    topic hears about overloads from every scene of that topic.
+
+    Args:
+        listener (Callable[[str], None]): Called with the overload reason
+
+    Returns:
+        Token to pass to `remove_overload_listener`
+    """
+    return _overload_listeners.set(_overload_listeners.get() + (listener,))
+
+
+def remove_overload_listener(token) -> None:
+    """Undo `add_overload_listener`.
+
+    Args:
+        token: Token returned by `add_overload_listener`
+    """
+    _overload_listeners.reset(token)
+
+
+def report_overload(reason: str) -> None:
+    """Tell the concurrency controllers of the current context that a dependency is overloaded.
+
+    Args:
+        reason (str): Short reason such as "rate_limit", "timeout" or "render_oom"
+    """
+    for listener in _overload_listeners.get():
+        listener(reason)
+
+
+def has_overload_listeners() -> bool:
+    """Whether a concurrency controller listens for overload signals in the current context.
+
+    Returns:
+        bool: True inside a task governed by an adaptive limiter
+    """
+    return bool(_overload_listeners.get())
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text with the shared budgeting encoding.
+
+    Args:
+        text (str): Text to count
+
+    Returns:
+        int: Number of tokens
+    """
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        # cl100k_base is close enough for budgeting across providers
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the prompt tokens of a request before sending it.
+
+    Args:
+        messages (List[Dict[str, Any]]): Messages with 'type' and 'content' keys
+
+    Returns:
+        int: Estimated number of prompt tokens
+    """
+    tokens = 0
+    for msg in messages:
+        if msg["type"] == "text":
+            tokens += count_tokens(msg["content"])
+        else:
+            tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def limiter_key(model_name: str) -> str:
+    """Build the limiter key for a model: provider plus deployment.
+
+    Args:
+        model_name (str): LiteLLM model name, e.g. "azure/gpt-4o"
+
+    Returns:
+        str: Key such as "azure/gpt-4o"; models without a provider prefix use "openai"
+    """
+    if "/" in model_name:
+        return model_name
+    return f"openai/{model_name}"
+
+
+def configure_rate_limit(model_name: str, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> "RateLimiter":
+    """Create or reconfigure the shared limiter for a model's provider and deployment.
+
+    Args:
+        model_name (str): LiteLLM model name
+        requests_per_minute (float, optional): Request budget. Defaults to None (unlimited).
+        tokens_per_minute (float, optional): Token budget. Defaults to None (unlimited).
+
+    Returns:
+        RateLimiter: The limiter shared by every wrapper using this provider and deployment
+    """
+    key = limiter_key(model_name)
+    with _limiters_lock:
+        limiter = RateLimiter(key, requests_per_minute, tokens_per_minute)
+        _limiters[key] = limiter
+        return limiter
+
+
+def get_rate_limiter(model_name: str) -> Optional["RateLimiter"]:
+    """Get the shared limiter for a model, if one was configured.
+
+    Args:
+        model_name (str): LiteLLM model name
+
+    Returns:
+        Optional[RateLimiter]: The configured limiter, or None
+    """
+    with _limiters_lock:
+        return _limiters.get(limiter_key(model_name))
+
+
+class _TokenBucket:
+    """A token bucket that may run into debt; callers wait until the debt is repaid.
+
+    Letting the balance go negative makes reservations first come, first served: each
+    caller learns its wait time immediately and later callers queue behind it.
+
+    Args:
+        per_minute (float): Refill rate and capacity
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.balance = per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.balance = min(self.capacity, self.balance + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` from the bucket and return how long the caller must wait."""
+        self._refill(now)
+        # A single request larger than the whole budget still has to go through eventually
+        self.balance -= min(amount, self.capacity)
+        return 0.0 if self.balance >= 0 else -self.balance / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Correct the balance once the real cost of a request is known."""
+        self.balance = min(self.capacity, self.balance - amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter shared across all topics.
+
+    Every wrapper that talks to the same provider deployment shares one limiter, so
+    concurrent topics and scenes are spread over the provider's quota instead of firing
+    together and falling back on retry storms after 429s.
+
+    Args:
+        key (str): Provider/deployment key, for logging
+        requests_per_minute (float, optional): Request budget. Defaults to None (unlimited).
+        tokens_per_minute (float, optional): Token budget. Defaults to None (unlimited).
+    """
+
+    def __init__(self, key: str, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.key = key
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+        self.rate_limit_errors = 0
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            if self._requests is not None:
+                delay = max(delay, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.reserve(tokens, now))
+            self.throttled_seconds += delay
+            return delay
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until a request of `tokens` prompt tokens fits the budget.
+
+        Args:
+            tokens (int): Estimated prompt tokens
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, tokens: int) -> None:
+        """Blocking variant of `acquire` for synchronous callers.
+
+        Args:
+            tokens (int): Estimated prompt tokens
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Charge the difference between the estimated and the reported token usage.
+
+        Args:
+            estimated_tokens (int): Tokens reserved before the request
+            actual_tokens (int, optional): Total tokens reported by the provider
+        """
+        if self._tokens is None or actual_tokens is None:
+            return
+        with self._lock:
+            self._tokens.adjust(actual_tokens - estimated_tokens)
+
+    def penalize(self, retry_after: float) -> None:
+        """Pause all requests after the provider answered with a rate limit error.
+
+        Args:
+            retry_after (float): Seconds to pause
+        """
+        with self._lock:
+            self.rate_limit_errors += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        print(f"Rate limited by {self.key}, pausing requests for {retry_after:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Report throttling statistics.
+
+        Returns:
+            Dict[str, Any]: Seconds spent throttled and number of rate limit errors
+        """
+        with self._lock:
+            return {"key": self.key, "throttled_seconds": self.throttled_seconds, "rate_limit_errors": self.rate_limit_errors}
@@ -28,6 +28,23 @@ def _prepare_text_inputs(texts: List[str]) -> List[Dict[str, str]]:
         })
     return inputs
 
+def _prepare_cached_text_inputs(static_texts: List[str], texts: Union[str, List[str]]) -> List[Dict[str, str]]:
+    """
+    Converts a static prompt prefix and the dynamic text after it into the input format for the Agent model.
+
+    Static parts are marked with "cache": True so that wrappers can ask providers to cache
+    the prompt prefix up to them.
+
+    Args:
+        static_texts (List[str]): Prefix texts that repeat across requests; empty entries are skipped
+        texts (Union[str, List[str]]): Dynamic text strings following the prefix
+
+    Returns:
+        List[Dict[str, str]]: A list of dictionaries formatted for the Agent model.
+    """
+    inputs = [{"type": "text", "content": text, "cache": True} for text in static_texts if text]
+    return inputs + _prepare_text_inputs(texts)
+
 def _prepare_text_image_inputs(texts: Union[str, List[str]], images: Union[str, Image.Image, List[Union[str, Image.Image]]]) -> List[Dict[str, str]]:
     """
     Converts text strings and images into the input format for the Agent model.
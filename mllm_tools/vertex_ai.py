@@ -42,18 +42,14 @@ class VertexAIWrapper:
         vertexai.init(project=project_id, location=location)
         self.model = GenerativeModel(model_name)
         
-    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
-        """Process messages and return completion.
+    def _prepare_parts(self, messages: List[Dict[str, Any]]) -> List[Part]:
+        """Convert messages to Vertex AI parts.
         
         Args:
             messages: List of message dictionaries containing type and content
-            metadata: Optional metadata dictionary to pass to the model
             
         Returns:
-            Generated text response from the model
-            
-        Raises:
-            ValueError: If message type is not supported
+            List of Part objects for generate_content
         """
         parts = []
         
@@ -74,13 +70,47 @@ class VertexAIWrapper:
                         msg["content"],
                         mime_type=mime_type
                     ))
-                    
+        return parts
+
+    def __call__(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Process messages and return completion.
+        
+        Args:
+            messages: List of message dictionaries containing type and content
+            metadata: Optional metadata dictionary to pass to the model
+            
+        Returns:
+            Generated text response from the model
+            
+        Raises:
+            ValueError: If message type is not supported
+        """
         response = self.model.generate_content(
-            parts,
+            self._prepare_parts(messages),
+            generation_config={
+                "temperature": self.temperature,
+                "top_p": 0.95,
+            }
+        )
+        
+        return response.text
+
+    async def acall(self, messages: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Process messages and return completion without blocking the event loop.
+        
+        Args:
+            messages: List of message dictionaries containing type and content
+            metadata: Optional metadata dictionary to pass to the model
+            
+        Returns:
+            Generated text response from the model
+        """
+        response = await self.model.generate_content_async(
+            self._prepare_parts(messages),
             generation_config={
                 "temperature": self.temperature,
                 "top_p": 0.95,
             }
         )
         
-        return response.text
\ No newline at end of file
+        return response.text
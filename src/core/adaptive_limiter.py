@@ -0,0 +1,152 @@
+import time
+import asyncio
+from collections import deque
+from typing import Any, Dict, Optional
+
+from mllm_tools.rate_limiter import add_overload_listener, remove_overload_listener
+from src.utils.tracing import get_tracer
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adapts with additive increase / multiplicative decrease.
+
+    Drop-in replacement for the asyncio.Semaphore that gates topics and scenes
+    (`async with limiter:`). After every released slot the limit grows by 1/limit, so it
+    rises by about one per limit's worth of healthy completions, as long as the recent
+    error rate is low and the recent p95 hold time stays within `latency_tolerance` times
+    the best p95 seen so far. Any overload signal raised while holding a slot (429s and
+    timeouts from the model wrappers, OOM-killed renders) halves the limit, at most once
+    per cooldown period so that one burst of 429s is not counted several times.
+
+    Args:
+        name (str): Name used in logs and snapshots, e.g. "scenes"
+        initial_limit (int): Starting concurrency
+        min_limit (int, optional): Lower bound. Defaults to 1.
+        max_limit (int, optional): Upper bound. Defaults to 32.
+        window (int, optional): Number of recent slots used for p95 and error rate. Defaults to 20.
+        latency_tolerance (float, optional): Allowed p95 growth over the best observed p95;
+            None disables the latency check (for long slots such as whole topics). Defaults to 2.0.
+        max_error_rate (float, optional): Error rate above which the limit stops growing. Defaults to 0.1.
+        cooldown_seconds (float, optional): Minimum time between two decreases. Defaults to 10.
+    """
+
+    def __init__(self,
+                 name: str,
+                 initial_limit: int,
+                 min_limit: int = 1,
+                 max_limit: int = 32,
+                 window: int = 20,
+                 latency_tolerance: Optional[float] = 2.0,
+                 max_error_rate: float = 0.1,
+                 cooldown_seconds: float = 10.0):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.cooldown_seconds = cooldown_seconds
+        self.in_flight = 0
+        self.waiting = 0
+        self.increases = 0
+        self.decreases = 0
+        self._samples = deque(maxlen=window)
+        self._best_p95 = None
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+        # Per-task slot state: start time, overload flag and listener token
+        self._slots = {}
+
+    @property
+    def effective_limit(self) -> int:
+        return int(self.limit)
+
+    async def __aenter__(self):
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_flight < self.effective_limit)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+        slot = {"started_at": time.monotonic(), "overloaded": False}
+        slot["token"] = add_overload_listener(lambda reason, slot=slot: self._on_overload(slot, reason))
+        self._slots[id(asyncio.current_task())] = slot
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        slot = self._slots.pop(id(asyncio.current_task()))
+        remove_overload_listener(slot["token"])
+        latency = time.monotonic() - slot["started_at"]
+        # Cancellation is not a health signal
+        failed = slot["overloaded"] or (exc_type is not None and not issubclass(exc_type, asyncio.CancelledError))
+        async with self._condition:
+            self.in_flight -= 1
+            self._samples.append((latency, failed))
+            if not slot["overloaded"]:
+                self._maybe_increase()
+            self._condition.notify_all()
+        return False
+
+    def _on_overload(self, slot: Dict, reason: str) -> None:
+        """Halve the limit when a dependency reports overload during a slot."""
+        slot["overloaded"] = True
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_seconds:
+            return
+        self._last_decrease = now
+        old_limit = self.effective_limit
+        self.limit = max(float(self.min_limit), self.limit / 2)
+        self.decreases += 1
+        print(f"Adaptive limit {self.name}: {old_limit} -> {self.effective_limit} ({reason})")
+        get_tracer().event("concurrency_limit", limiter=self.name, limit=self.effective_limit, reason=reason)
+
+    def _p95(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        latencies = sorted(latency for latency, _ in self._samples)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def _error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, failed in self._samples if failed) / len(self._samples)
+
+    def _maybe_increase(self) -> None:
+        """Grow the limit by 1/limit if the recent window looks healthy."""
+        if self.limit >= self.max_limit or self._error_rate() > self.max_error_rate:
+            return
+        # Only push further once the current limit is actually used
+        if self.in_flight + self.waiting + 1 < self.effective_limit:
+            return
+        if self.latency_tolerance is not None and len(self._samples) >= min(5, self._samples.maxlen):
+            p95 = self._p95()
+            if self._best_p95 is None or p95 < self._best_p95:
+                self._best_p95 = p95
+            if p95 > self._best_p95 * self.latency_tolerance:
+                return
+        old_limit = self.effective_limit
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        if self.effective_limit > old_limit:
+            self.increases += 1
+            print(f"Adaptive limit {self.name}: {old_limit} -> {self.effective_limit}")
+            get_tracer().event("concurrency_limit", limiter=self.name, limit=self.effective_limit, reason="healthy")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Report the current state of the controller.
+
+        Returns:
+            Dict[str, Any]: Current limit, slots in flight and waiting, recent p95 and error rate,
+                and the number of increases and decreases so far
+        """
+        return {
+            "name": self.name,
+            "limit": self.effective_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "p95_seconds": self._p95(),
+            "error_rate": self._error_rate(),
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
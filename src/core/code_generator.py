@@ -1,16 +1,20 @@
 import os
 import re
 import json
-from typing import Union, List, Dict
+import asyncio
+from typing import Union, List, Dict, Optional
 from PIL import Image
 import glob
 
 from src.utils.utils import extract_json
-from mllm_tools.utils import _prepare_text_inputs, _extract_code, _prepare_text_image_inputs
+from src.utils.error_distiller import distill_error
+from src.utils.prompt_budget import PromptBudget, PromptComponent, prompt_token_budget
+from mllm_tools.utils import _prepare_text_inputs, _prepare_cached_text_inputs, _extract_code, _prepare_text_image_inputs
 from mllm_tools.gemini import GeminiWrapper
 from mllm_tools.vertex_ai import VertexAIWrapper
 from task_generator import (
     get_prompt_code_generation,
+    get_prompt_code_generation_parts,
     get_prompt_fix_error,
     get_prompt_visual_fix_error,
     get_banned_reasonings,
@@ -25,11 +29,26 @@ from task_generator.prompts_raw import (
     _prompt_manim_cheatsheet
 )
 from src.rag.vector_store import RAGVectorStore # Import RAGVectorStore
+from src.core.run_manifest import STAGE_CODE, STATUS_SUCCEEDED
+from src.utils.tracing import traced
+
+# The response is complete for our purposes once the tag around the code is closed.
+# Anchoring on the tag matters: fix responses often quote snippets in <THINKING> first.
+CODE_END_PATTERN = r"</CODE>"
+FIXED_CODE_END_PATTERN = r"</FULL_CORRECTED_CODE>"
+# The corrected scene follows its tag; a greedy search from the first fence would pick up those snippets
+FIXED_CODE_PATTERN = r"<FULL_CORRECTED_CODE>\s*```python(.*)```"
+
+# Order in which prompt context is cut (lowest first) when a prompt exceeds the model's budget
+PRIORITY_EXAMPLES = 0
+PRIORITY_CHEATSHEET = 1
+PRIORITY_RAG = 2
+PRIORITY_GUIDELINES = 3
 
 class CodeGenerator:
     """A class for generating and managing Manim code."""
 
-    def __init__(self, scene_model, helper_model, output_dir="output", print_response=False, use_rag=False, use_context_learning=False, context_learning_path="data/context_learning", chroma_db_path="rag/chroma_db", manim_docs_path="rag/manim_docs", embedding_model="azure/text-embedding-3-large", use_visual_fix_code=False, use_langfuse=True, session_id=None):
+    def __init__(self, scene_model, helper_model, output_dir="output", print_response=False, use_rag=False, use_context_learning=False, context_learning_path="data/context_learning", chroma_db_path="rag/chroma_db", manim_docs_path="rag/manim_docs", embedding_model="azure/text-embedding-3-large", use_visual_fix_code=False, use_langfuse=True, session_id=None, run_manifest=None, max_prompt_tokens=None):
         """Initialize the CodeGenerator.
 
         Args:
@@ -46,6 +65,9 @@ class CodeGenerator:
             use_visual_fix_code (bool, optional): Whether to use visual code fixing. Defaults to False.
             use_langfuse (bool, optional): Whether to use Langfuse logging. Defaults to True.
             session_id (str, optional): Session identifier. Defaults to None.
+            run_manifest (RunManifest, optional): Run manifest to record code versions in. Defaults to None.
+            max_prompt_tokens (int, optional): Cap on prompt tokens below the model's context window;
+                optional context is cut to fit. Defaults to None.
         """
         self.scene_model = scene_model
         self.helper_model = helper_model
@@ -60,6 +82,8 @@ class CodeGenerator:
         self.use_visual_fix_code = use_visual_fix_code
         self.banned_reasonings = get_banned_reasonings()
         self.session_id = session_id # Use session_id passed from VideoGenerator
+        self.run_manifest = run_manifest
+        self.max_prompt_tokens = max_prompt_tokens
 
         if use_rag:
             self.vector_store = RAGVectorStore(
@@ -72,6 +96,37 @@ class CodeGenerator:
         else:
             self.vector_store = None
 
+    def save_code(self, code: str, log: str, code_dir: str, file_prefix: str, scene_number: int, version: int, log_name: str, candidate: Optional[int] = None) -> str:
+        """Save a code version with its generation log and record it in the run manifest.
+
+        Speculative candidates are saved as `..._v{version}_c{candidate}.py` and are not
+        recorded in the manifest; only the winning candidate becomes a real version.
+
+        Args:
+            code (str): The generated code
+            log (str): The model response the code was extracted from
+            code_dir (str): Directory for code files
+            file_prefix (str): Prefix for output files
+            scene_number (int): Scene number
+            version (int): Code version
+            log_name (str): Suffix of the log file, e.g. "init_log" or "fix_log"
+            candidate (int, optional): Speculative candidate index. Defaults to None.
+
+        Returns:
+            str: Path of the saved code file
+        """
+        stem = f"{file_prefix}_scene{scene_number}_v{version}" + (f"_c{candidate}" if candidate is not None else "")
+        with open(os.path.join(code_dir, f"{stem}_{log_name}.txt"), "w") as f:
+            f.write(log)
+        code_path = os.path.join(code_dir, f"{stem}.py")
+        with open(code_path, "w") as f:
+            f.write(code)
+        print(f"Code saved to {code_path}")
+
+        if self.run_manifest is not None and candidate is None:
+            self.run_manifest.record(file_prefix, STAGE_CODE, STATUS_SUCCEEDED, scene=scene_number, version=version, artifact_path=code_path)
+        return code_path
+
     def _load_context_examples(self) -> str:
         """Load all context learning examples from the specified directory.
 
@@ -91,7 +146,8 @@ class CodeGenerator:
             return formatted_examples
         return None
 
-    def _generate_rag_queries_code(self, implementation: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
+    @traced("rag_query_generation", kind="code")
+    async def _generate_rag_queries_code(self, implementation: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
         """Generate RAG queries from the implementation plan.
 
         Args:
@@ -126,7 +182,7 @@ class CodeGenerator:
         else:
             prompt = get_prompt_rag_query_generation_code(implementation, "No plugins are relevant.")
 
-        queries = self.helper_model(
+        queries = await self.helper_model.acall(
             _prepare_text_inputs(prompt),
             metadata={"generation_name": "rag_query_generation", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
         )
@@ -148,7 +204,8 @@ class CodeGenerator:
 
         return queries
 
-    def _generate_rag_queries_error_fix(self, error: str, code: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
+    @traced("rag_query_generation", kind="error_fix")
+    async def _generate_rag_queries_error_fix(self, error: str, code: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
         """Generate RAG queries for fixing code errors.
 
         Args:
@@ -185,7 +242,7 @@ class CodeGenerator:
             relevant_plugins=", ".join(relevant_plugins) if relevant_plugins else "No plugins are relevant."
         )
 
-        queries = self.helper_model(
+        queries = await self.helper_model.acall(
             _prepare_text_inputs(prompt),
             metadata={"generation_name": "rag-query-generation-fix-error", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
         )
@@ -205,7 +262,47 @@ class CodeGenerator:
 
         return queries
 
-    def _extract_code_with_retries(self, response_text: str, pattern: str, generation_name: str = None, trace_id: str = None, session_id: str = None, max_retries: int = 10) -> str:
+    def _fit_prompt_context(self, base_prompt: str, contexts: List[tuple], prompt_name: str, model=None) -> List[PromptComponent]:
+        """Cut optional prompt context so that the prompt fits the model's token budget.
+
+        Args:
+            base_prompt (str): Prompt without additional context; never cut
+            contexts (List[tuple]): (name, text, priority, trimmable) per context component
+            prompt_name (str): Prompt name used in logs
+            model (optional): Model the prompt is sent to. Defaults to the scene model.
+
+        Returns:
+            List[PromptComponent]: Context components that fit, in their original order
+        """
+        model = model if model is not None else self.scene_model
+        budget = PromptBudget(prompt_token_budget(getattr(model, "model_name", None), self.max_prompt_tokens), name=prompt_name)
+        budget.add("plan", base_prompt, required=True)
+        for name, text, priority, trimmable in contexts:
+            budget.add(name, text, priority=priority, trimmable=trimmable)
+        return [component for component in budget.fit() if not component.required]
+
+    async def _acall_code(self, messages: List[Dict], metadata: Dict, model=None, stop_pattern: Optional[str] = None) -> str:
+        """Call the scene model for a response containing a python code block.
+
+        Models that support streaming are cut off once `stop_pattern` matches, so
+        commentary written after the code is neither waited for nor paid for.
+
+        Args:
+            messages (List[Dict]): Prepared model inputs
+            metadata (Dict): Call metadata
+            model (optional): Model to use instead of the scene model. Defaults to None.
+            stop_pattern (str, optional): Regex marking the end of the code, e.g.
+                CODE_END_PATTERN. Defaults to None, which reads the whole response.
+
+        Returns:
+            str: Model response, ending at the end of `stop_pattern` when streamed
+        """
+        model = model if model is not None else self.scene_model
+        if stop_pattern is not None and hasattr(model, "acall_stream"):
+            return await model.acall_stream(messages, metadata=metadata, stop_pattern=stop_pattern)
+        return await model.acall(messages, metadata=metadata)
+
+    async def _extract_code_with_retries(self, response_text: str, pattern: str, generation_name: str = None, trace_id: str = None, session_id: str = None, max_retries: int = 10, model=None) -> str:
         """Extract code from response text with retry logic.
 
         Args:
@@ -215,6 +312,7 @@ class CodeGenerator:
             trace_id (str, optional): Trace identifier. Defaults to None.
             session_id (str, optional): Session identifier. Defaults to None.
             max_retries (int, optional): Maximum number of retries. Defaults to 10.
+            model (optional): Model to use instead of the scene model. Defaults to None.
 
         Returns:
             str: The extracted code
@@ -238,18 +336,20 @@ class CodeGenerator:
             if attempt < max_retries - 1:
                 print(f"Attempt {attempt + 1}: Failed to extract code pattern. Retrying...")
                 # Regenerate response with a more explicit prompt
-                response_text = self.scene_model(
+                response_text = await self._acall_code(
                     _prepare_text_inputs(retry_prompt.format(pattern=pattern, response_text=response_text)),
                     metadata={
                         "generation_name": f"{generation_name}_format_retry_{attempt + 1}",
                         "trace_id": trace_id,
                         "session_id": session_id
-                    }
+                    },
+                    model=model
                 )
         
         raise ValueError(f"Failed to extract code pattern after {max_retries} attempts. Pattern: {pattern}")
 
-    def generate_manim_code(self,
+    @traced("code_generation")
+    async def generate_manim_code(self,
                             topic: str,
                             description: str,                            
                             scene_outline: str,
@@ -258,7 +358,9 @@ class CodeGenerator:
                             additional_context: Union[str, List[str]] = None,
                             scene_trace_id: str = None,
                             session_id: str = None,
-                            rag_queries_cache: Dict = None) -> str:
+                            rag_queries_cache: Dict = None,
+                            model=None,
+                            relevant_plugins: List[str] = None) -> str:
         """Generate Manim code from video plan.
 
         Args:
@@ -271,70 +373,82 @@ class CodeGenerator:
             scene_trace_id (str, optional): Trace identifier. Defaults to None.
             session_id (str, optional): Session identifier. Defaults to None.
             rag_queries_cache (Dict, optional): Cache for RAG queries. Defaults to None.
+            model (optional): Model to use instead of the scene model, e.g. for a
+                speculative candidate. Defaults to None.
+            relevant_plugins (List[str], optional): Plugins relevant to the topic. Defaults to None.
 
         Returns:
             Tuple[str, str]: Generated code and response text
         """
-        if self.use_context_learning:
-            # Add context examples to additional_context
-            if additional_context is None:
-                additional_context = []
-            elif isinstance(additional_context, str):
-                additional_context = [additional_context]
-            
-            # Now using the properly formatted code examples
-            if self.context_examples:
-                additional_context.append(self.context_examples)
+        contexts = []
+        if additional_context is not None:
+            for text in ([additional_context] if isinstance(additional_context, str) else additional_context):
+                if text == _prompt_manim_cheatsheet:
+                    contexts.append(("cheatsheet", text, PRIORITY_CHEATSHEET, True))
+                else:
+                    contexts.append(("guidelines", text, PRIORITY_GUIDELINES, False))
+
+        if self.use_context_learning and self.context_examples:
+            contexts.append(("examples", self.context_examples, PRIORITY_EXAMPLES, True))
 
         if self.use_rag:
             # Generate RAG queries (will use cache if available)
-            rag_queries = self._generate_rag_queries_code(
+            rag_queries = await self._generate_rag_queries_code(
                 implementation=scene_implementation,
                 scene_trace_id=scene_trace_id,
                 topic=topic,
                 scene_number=scene_number,
-                session_id=session_id
+                session_id=session_id,
+                relevant_plugins=relevant_plugins
             )
 
-            retrieved_docs = self.vector_store.find_relevant_docs(
+            retrieved_docs = await asyncio.to_thread(
+                self.vector_store.find_relevant_docs,
                 queries=rag_queries,
                 k=2, # number of documents to retrieve
                 trace_id=scene_trace_id,
                 topic=topic,
                 scene_number=scene_number
             )
-            # Format the retrieved documents into a string
-            if additional_context is None:
-                additional_context = []
-            additional_context.append(retrieved_docs)
+            contexts.append(("rag", retrieved_docs, PRIORITY_RAG, True))
 
-        # Format code generation prompt with plan and retrieved context
-        prompt = get_prompt_code_generation(
+        # Format code generation prompt with plan and the context that fits the budget
+        prompt_args = dict(
             scene_outline=scene_outline,
             scene_implementation=scene_implementation,
             topic=topic,
             description=description,
-            scene_number=scene_number,
-            additional_context=additional_context
+            scene_number=scene_number
+        )
+        kept = self._fit_prompt_context(get_prompt_code_generation(**prompt_args), contexts, "code_generation", model)
+        # Everything but the retrieved docs is the same for all scenes and goes into the cacheable prefix
+        static_parts, prompt = get_prompt_code_generation_parts(
+            **prompt_args,
+            static_context=[component.text for component in kept if component.name != "rag"],
+            additional_context=[component.text for component in kept if component.name == "rag"] or None
         )
 
         # Generate code using model
-        response_text = self.scene_model(
-            _prepare_text_inputs(prompt),
-            metadata={"generation_name": "code_generation", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
+        response_text = await self._acall_code(
+            _prepare_cached_text_inputs(static_parts, prompt),
+            metadata={"generation_name": "code_generation", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id},
+            model=model,
+            stop_pattern=CODE_END_PATTERN
         )
 
         # Extract code with retries
-        code = self._extract_code_with_retries(
+        code = await self._extract_code_with_retries(
             response_text,
             r"```python(.*)```",
             generation_name="code_generation",
             trace_id=scene_trace_id,
-            session_id=session_id
+            session_id=session_id,
+            model=model
         )
         return code, response_text
 
-    def fix_code_errors(self, implementation_plan: str, code: str, error: str, scene_trace_id: str, topic: str, scene_number: int, session_id: str, rag_queries_cache: Dict = None) -> str:
+    @traced("code_fix")
+    async def fix_code_errors(self, implementation_plan: str, code: str, error: str, scene_trace_id: str, topic: str, scene_number: int, session_id: str, rag_queries_cache: Dict = None, model=None, relevant_plugins: List[str] = None) -> str:
         """Fix errors in generated Manim code.
 
         Args:
@@ -346,24 +460,31 @@ class CodeGenerator:
             scene_number (int): Scene number
             session_id (str): Session identifier
             rag_queries_cache (Dict, optional): Cache for RAG queries. Defaults to None.
+            model (optional): Model to use instead of the scene model. Defaults to None.
+            relevant_plugins (List[str], optional): Plugins relevant to the topic. Defaults to None.
 
         Returns:
             Tuple[str, str]: Fixed code and response text
         """
+        # Manim's stderr is mostly rich traceback frames and logs; the prompt only needs the distilled record
+        error = distill_error(error, code)
+
         # Format error fix prompt
         prompt = get_prompt_fix_error(implementation_plan=implementation_plan, manim_code=code, error=error)
 
         if self.use_rag:
             # Generate RAG queries for error fixing
-            rag_queries = self._generate_rag_queries_error_fix(
+            rag_queries = await self._generate_rag_queries_error_fix(
                 error=error,
                 code=code,
                 scene_trace_id=scene_trace_id,
                 topic=topic,
                 scene_number=scene_number,
-                session_id=session_id
+                session_id=session_id,
+                relevant_plugins=relevant_plugins
             )
-            retrieved_docs = self.vector_store.find_relevant_docs(
+            retrieved_docs = await asyncio.to_thread(
+                self.vector_store.find_relevant_docs,
                 queries=rag_queries,
                 k=2, # number of documents to retrieve for error fixing
                 trace_id=scene_trace_id,
@@ -371,25 +492,31 @@ class CodeGenerator:
                 scene_number=scene_number
             )
             # Format the retrieved documents into a string
-            prompt = get_prompt_fix_error(implementation_plan=implementation_plan, manim_code=code, error=error, additional_context=retrieved_docs)
+            kept = self._fit_prompt_context(prompt, [("rag", retrieved_docs, PRIORITY_RAG, True)], "code_fix_error", model)
+            prompt = get_prompt_fix_error(implementation_plan=implementation_plan, manim_code=code, error=error,
+                                          additional_context=[component.text for component in kept] or None)
 
         # Get fixed code from model
-        response_text = self.scene_model(
+        response_text = await self._acall_code(
             _prepare_text_inputs(prompt),
-            metadata={"generation_name": "code_fix_error", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
+            metadata={"generation_name": "code_fix_error", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id},
+            model=model,
+            stop_pattern=FIXED_CODE_END_PATTERN
         )
 
         # Extract fixed code with retries
-        fixed_code = self._extract_code_with_retries(
+        fixed_code = await self._extract_code_with_retries(
             response_text,
-            r"```python(.*)```",
+            FIXED_CODE_PATTERN,
             generation_name="code_fix_error",
             trace_id=scene_trace_id,
-            session_id=session_id
+            session_id=session_id,
+            model=model
         )
         return fixed_code, response_text
 
-    def visual_self_reflection(self, code: str, media_path: Union[str, Image.Image], scene_trace_id: str, topic: str, scene_number: int, session_id: str) -> str:
+    @traced("visual_reflection")
+    async def visual_self_reflection(self, code: str, media_path: Union[str, Image.Image], scene_trace_id: str, topic: str, scene_number: int, session_id: str) -> str:
         """Use snapshot image or mp4 video to fix code.
 
         Args:
@@ -433,7 +560,7 @@ class CodeGenerator:
             ]
         
         # Get model response
-        response_text = self.scene_model(
+        response_text = await self.scene_model.acall(
             messages,
             metadata={
                 "generation_name": "visual_self_reflection",
@@ -444,7 +571,7 @@ class CodeGenerator:
         )
         
         # Extract code with retries
-        fixed_code = self._extract_code_with_retries(
+        fixed_code = await self._extract_code_with_retries(
             response_text,
             r"```python(.*)```",
             generation_name="visual_self_reflection",
@@ -73,6 +73,72 @@ def image_with_most_non_black_space(images, output_path, return_type="path"):
             return image_with_max_non_black_space
     return image_with_max_non_black_space
 
+def _keyframe_times(video_path):
+    """List the timestamps of a video's keyframes from its packets, without decoding."""
+    import ffmpeg
+    probe = ffmpeg.probe(video_path, select_streams='v:0', show_entries='packet=pts_time,flags')
+    return [float(p['pts_time']) for p in probe.get('packets', []) if 'K' in p.get('flags', '') and 'pts_time' in p]
+
+def _non_black_thumbnail_pixels(video_path, timestamp, thumbnail_width):
+    """Decode one downscaled grayscale frame at a timestamp and count its non-black pixels."""
+    import ffmpeg
+    out, _ = (
+        ffmpeg.input(video_path, ss=timestamp)
+        .output('pipe:', vframes=1, vf=f'scale={thumbnail_width}:-2', format='rawvideo', pix_fmt='gray')
+        .run(capture_stdout=True, quiet=True)
+    )
+    # Same threshold as image_with_most_non_black_space
+    return int(np.sum(np.frombuffer(out, dtype=np.uint8) > 10))
+
+def extract_snapshot_frame(video_path, output_path, return_type="path", max_candidates=24, thumbnail_width=160):
+    """Save the frame of a video with the most non-black space, decoding full resolution only once.
+
+    Candidates are keyframes, so seeking to them decodes a single frame. They are scored on
+    small grayscale thumbnails and only the winner is decoded at full resolution, so the
+    cost depends on max_candidates rather than on the length of the video. Falls back to
+    sampling with moviepy if ffmpeg fails.
+
+    Args:
+        video_path (str): Path to the video file.
+        output_path (str): Path where the snapshot should be saved.
+        return_type (str, optional): Type of return value - "path" or "image". Defaults to "path".
+        max_candidates (int, optional): Maximum keyframes scored. Defaults to 24.
+        thumbnail_width (int, optional): Width of the thumbnails frames are scored on. Defaults to 160.
+
+    Returns:
+        Union[str, PIL.Image, None]: Path to saved image, PIL Image object, or None if no frame was found.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import ffmpeg
+    from src.utils.media_index import get_media_index
+
+    try:
+        times = _keyframe_times(video_path) or [0.0]
+        if len(times) > max_candidates:
+            # Spread the candidates evenly over the video
+            times = sorted({times[round(i * (len(times) - 1) / (max_candidates - 1))] for i in range(max_candidates)})
+        with ThreadPoolExecutor(max_workers=min(8, len(times))) as pool:
+            scores = list(pool.map(lambda t: _non_black_thumbnail_pixels(video_path, t, thumbnail_width), times))
+        best_time = times[scores.index(max(scores))]
+
+        info = get_media_index().get(video_path)
+        out, _ = (
+            ffmpeg.input(video_path, ss=best_time)
+            .output('pipe:', vframes=1, format='rawvideo', pix_fmt='rgb24')
+            .run(capture_stdout=True, quiet=True)
+        )
+        frame = np.frombuffer(out, dtype=np.uint8).reshape(info.height, info.width, 3)
+    except Exception as e:
+        print(f"Warning: seek-based snapshot failed for {video_path} ({e}), sampling the whole video instead")
+        return image_with_most_non_black_space(get_images_from_video(video_path), output_path, return_type=return_type)
+
+    image = Image.fromarray(frame)
+    image.save(output_path)
+    print(f"Saved image with most non-black space to {output_path}")
+    if return_type == "path":
+        return output_path
+    return image
+
 def parse_srt_to_text(output_dir, topic_name):
     """Convert SRT subtitle file to plain text.
 
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class PipelineStage:
+    """A pipeline stage with its own concurrency limit and a bounded queue.
+
+    Args:
+        name (str): Stage name, e.g. "plan", "scene" or "combine"
+        concurrency (int): Number of items the stage processes at once
+        max_queue (int, optional): Number of items allowed to wait for a free worker.
+            Defaults to the stage concurrency.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: Optional[int] = None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = self.concurrency if max_queue is None else max(0, max_queue)
+        # Admission covers both waiting and running items; once it is exhausted the
+        # upstream stage blocks, which is what gives us backpressure.
+        self._admission = asyncio.Semaphore(self.concurrency + self.max_queue)
+        self._workers = asyncio.Semaphore(self.concurrency)
+
+
+class PipelineScheduler:
+    """Runs per-scene dependency chains through shared, individually bounded stages.
+
+    Every scene of every topic runs its own chain (e.g. plan -> scene), so scene 1 can
+    start code generation and rendering as soon as its implementation plan exists while
+    scene 5 is still planning. An item that finishes a stage keeps its worker slot until
+    the next stage admits it, so a full downstream queue throttles the stages upstream.
+
+    Args:
+        stages (List[PipelineStage]): Stages available to chains, looked up by name
+    """
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages: Dict[str, PipelineStage] = {stage.name: stage for stage in stages}
+
+    async def run_chain(self, steps: List[Tuple[str, Callable[[], Awaitable]]]) -> list:
+        """Run steps in order, each inside the stage it names.
+
+        Args:
+            steps (List[Tuple[str, Callable[[], Awaitable]]]): (stage name, coroutine factory) pairs
+
+        Returns:
+            list: Result of each step, in order
+        """
+        results = []
+        held: List[asyncio.Semaphore] = []
+        try:
+            for stage_name, step in steps:
+                stage = self.stages[stage_name]
+                await stage._admission.acquire()
+                # Admitted downstream: release the upstream worker and queue slot
+                while held:
+                    held.pop().release()
+                held.append(stage._admission)
+                await stage._workers.acquire()
+                held.append(stage._workers)
+                results.append(await step())
+        finally:
+            while held:
+                held.pop().release()
+        return results
+
+    async def run_stage(self, stage_name: str, step: Callable[[], Awaitable]):
+        """Run a single step inside a stage.
+
+        Args:
+            stage_name (str): Name of the stage
+            step (Callable[[], Awaitable]): Coroutine factory to run
+
+        Returns:
+            The result of the step
+        """
+        results = await self.run_chain([(stage_name, step)])
+        return results[0]
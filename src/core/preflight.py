@@ -0,0 +1,447 @@
+import os
+import sys
+import ast
+import json
+import time
+import signal
+import asyncio
+import selectors
+import traceback
+import contextlib
+import importlib.util
+from typing import Any, Dict, Optional
+
+from src.utils.tracing import span
+
+# Name the scene module is imported under inside the dry-run child
+_SCENE_MODULE = "preflight_scene"
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Scene methods replaced by the dry-run stubs, with their original implementations
+_PLAYBACK_METHODS = ("play", "wait", "wait_until", "pause")
+_original_playback: Dict[str, Any] = {}
+
+
+def _base_name(node: ast.expr) -> str:
+    """Name of a base class expression, e.g. "VoiceoverScene" for `manim_voiceover.VoiceoverScene`."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return ""
+
+
+def static_check(code: str, file_path: str) -> Optional[str]:
+    """Check generated scene code without running it.
+
+    Parses the code, checks that every imported top-level package is installed and
+    that the file defines a Scene subclass. Takes milliseconds.
+
+    Args:
+        code (str): Scene source code
+        file_path (str): Path of the code file, used in error messages
+
+    Returns:
+        Optional[str]: None if the checks pass, otherwise an error in Python traceback format
+    """
+    try:
+        tree = ast.parse(code, filename=file_path)
+    except SyntaxError as e:
+        return "".join(traceback.format_exception_only(type(e), e))
+
+    source_lines = code.splitlines()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            # Only the top-level package: find_spec on a submodule would import its parents
+            package = module.split(".")[0]
+            if importlib.util.find_spec(package) is None:
+                line = source_lines[node.lineno - 1].strip() if node.lineno <= len(source_lines) else ""
+                return (f'  File "{file_path}", line {node.lineno}\n    {line}\n'
+                        f"ModuleNotFoundError: No module named '{package}'\n")
+
+    has_scene = any(
+        isinstance(node, ast.ClassDef) and any(_base_name(base).endswith("Scene") for base in node.bases)
+        for node in tree.body
+    )
+    if not has_scene:
+        return (f'  File "{file_path}"\n'
+                "Error: no Scene subclass found. The code must define a class such as "
+                "`class Scene1(VoiceoverScene)` with a construct() method.\n")
+    return None
+
+
+class _DryTracker:
+    """Stands in for manim_voiceover's VoiceoverTracker when speech is skipped."""
+
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.data = {"input_text": text}
+        # About 15 characters per second of speech
+        self.duration = max(1.0, len(text) / 15)
+        self.start_t = 0.0
+        self.end_t = self.duration
+
+    def get_remaining_duration(self, buff: float = 0.0) -> float:
+        return max(self.duration - buff, 0.0)
+
+    def time_until_bookmark(self, mark: str, buff: float = 0, limit: Optional[float] = None) -> float:
+        return 0.0
+
+
+def _patch_for_dry_run() -> None:
+    """Make scenes construct without rendering frames, waiting or synthesizing speech."""
+    from manim import Scene
+
+    if not _original_playback:
+        _original_playback.update({name: getattr(Scene, name) for name in _PLAYBACK_METHODS})
+
+    def play(self, *args, subcaption=None, subcaption_duration=None, subcaption_offset=0, **kwargs):
+        # Compile the animations like the renderer does, so play() kwargs such as run_time
+        # or rate_func are applied, then jump to their end state for later code to see
+        if self.compile_animation_data(*args, **kwargs) is None:
+            return
+        self.begin_animations()
+        for animation in self.animations:
+            animation.finish()
+        for animation in self.animations:
+            animation.clean_up_from_scene(self)
+
+    Scene.play = play
+    Scene.wait = lambda self, *args, **kwargs: None
+    Scene.wait_until = lambda self, *args, **kwargs: None
+    Scene.pause = lambda self, *args, **kwargs: None
+    Scene.add_sound = lambda self, *args, **kwargs: None
+
+    try:
+        from manim_voiceover import VoiceoverScene
+    except ImportError:
+        return
+
+    @contextlib.contextmanager
+    def voiceover(self, text: str = "", ssml: Optional[str] = None, **kwargs):
+        yield _DryTracker(text or ssml or "")
+
+    VoiceoverScene.set_speech_service = lambda self, speech_service, *args, **kwargs: setattr(self, "speech_service", speech_service)
+    VoiceoverScene.voiceover = voiceover
+    VoiceoverScene.add_voiceover_text = lambda self, text, **kwargs: _DryTracker(text)
+    try:
+        from src.utils.kokoro_voiceover import KokoroService
+        # Loading the TTS model takes longer than the whole check
+        KokoroService.__init__ = lambda self, *args, **kwargs: None
+    except ImportError:
+        pass
+
+
+@contextlib.contextmanager
+def _real_playback():
+    """Temporarily restore Scene.play and the waits, with frame rendering still skipped."""
+    from manim import Scene
+
+    stubs = {name: getattr(Scene, name) for name in _PLAYBACK_METHODS}
+    for name, method in _original_playback.items():
+        setattr(Scene, name, method)
+    try:
+        yield
+    finally:
+        for name, method in stubs.items():
+            setattr(Scene, name, method)
+
+
+def _construct_scenes(scene_classes: list, skip_rendering: bool = False) -> Optional[BaseException]:
+    """Run construct() of every scene class.
+
+    Args:
+        scene_classes (list): Scene subclasses defined in the scene file
+        skip_rendering (bool, optional): Give each scene a renderer that skips frame
+            rendering, for runs with the real play(). Defaults to False.
+
+    Returns:
+        Optional[BaseException]: The first exception raised, or None
+    """
+    from manim.renderer.cairo_renderer import CairoRenderer
+
+    try:
+        for scene_class in scene_classes:
+            scene = scene_class(renderer=CairoRenderer(skip_animations=True)) if skip_rendering else scene_class()
+            scene.setup()
+            scene.construct()
+    except Exception as e:
+        return e
+    return None
+
+
+def _format_scene_error(error: BaseException, file_path: str) -> Optional[str]:
+    """Format an exception raised by scene code like the traceback manim would print.
+
+    Args:
+        error (BaseException): Exception raised during the dry run
+        file_path (str): Path of the scene file
+
+    Returns:
+        Optional[str]: Traceback starting at the first frame in the scene file, or None if the
+            error did not pass through the scene code or was raised by the dry-run stubs
+    """
+    frames = traceback.extract_tb(error.__traceback__)
+    if frames and frames[-1].filename == os.path.abspath(__file__):
+        return None
+    scene_frames = [i for i, frame in enumerate(frames) if frame.filename == file_path]
+    if not scene_frames:
+        return None
+    return ("Traceback (most recent call last):\n"
+            + "".join(traceback.format_list(frames[scene_frames[0]:]))
+            + "".join(traceback.format_exception_only(type(error), error)))
+
+
+def _dry_construct(file_path: str, media_dir: str) -> Optional[str]:
+    """Import the scene file and run construct() of every Scene in it with animations skipped.
+
+    Args:
+        file_path (str): Path of the scene file
+        media_dir (str): Media directory of the real render; LaTeX output cached here is reused by it
+
+    Returns:
+        Optional[str]: None if construction succeeds (or fails outside the scene code), otherwise the error
+    """
+    from manim import config, Scene
+
+    config.media_dir = media_dir
+    config.dry_run = True
+    config.write_to_movie = False
+    _patch_for_dry_run()
+    try:
+        spec = importlib.util.spec_from_file_location(_SCENE_MODULE, file_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[_SCENE_MODULE] = module
+        spec.loader.exec_module(module)
+    except Exception as e:
+        return _format_scene_error(e, file_path)
+    scene_classes = [
+        value for value in vars(module).values()
+        if isinstance(value, type) and issubclass(value, Scene) and value.__module__ == _SCENE_MODULE
+    ]
+
+    error = _construct_scenes(scene_classes)
+    if error is None:
+        return None
+    frames = traceback.extract_tb(error.__traceback__)
+    if frames and frames[-1].filename != file_path:
+        # Raised inside manim or another library, which the stubs may have driven unlike a
+        # real render would; only keep the error if it reproduces with the real play()
+        with _real_playback():
+            error = _construct_scenes(scene_classes, skip_rendering=True)
+        if error is None:
+            return None
+    return _format_scene_error(error, file_path)
+
+
+def _serve() -> None:
+    """Preflight worker: import manim once, then fork a child per request.
+
+    Reads one JSON request per line on stdin ({"id", "path", "media_dir", "timeout"}) and
+    answers with one JSON line {"id", "error"} per request, in completion order. Forking
+    from the warm process skips interpreter startup and the manim import, and gives every
+    check a clean copy of the patched modules.
+    """
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    # Anything printed by manim or scene code must not end up in the protocol stream
+    os.dup2(2, 1)
+    try:
+        import manim  # noqa: F401
+        _patch_for_dry_run()
+    except ImportError as e:
+        print(f"Preflight worker could not import manim: {e}", file=sys.stderr)
+
+    selector = selectors.DefaultSelector()
+    selector.register(0, selectors.EVENT_READ, None)
+    pending: Dict[int, Dict[str, Any]] = {}
+    buffer = b""
+    stdin_open = True
+
+    def finish(fd: int, error: Optional[str]) -> None:
+        request = pending.pop(fd)
+        selector.unregister(fd)
+        os.close(fd)
+        os.waitpid(request["pid"], 0)
+        protocol.write(json.dumps({"id": request["id"], "error": error}) + "\n")
+
+    while stdin_open or pending:
+        now = time.monotonic()
+        timeout = max(0.0, min(request["deadline"] for request in pending.values()) - now) if pending else None
+        for key, _ in selector.select(timeout):
+            if key.data is None:
+                chunk = os.read(0, 65536)
+                if not chunk:
+                    selector.unregister(0)
+                    stdin_open = False
+                    continue
+                buffer += chunk
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    request = json.loads(line)
+                    read_fd, write_fd = os.pipe()
+                    pid = os.fork()
+                    if pid == 0:
+                        os.close(read_fd)
+                        devnull = os.open(os.devnull, os.O_WRONLY)
+                        os.dup2(devnull, 1)
+                        os.dup2(devnull, 2)
+                        try:
+                            result = json.dumps({"error": _dry_construct(request["path"], request["media_dir"])})
+                        except BaseException:
+                            result = json.dumps({"error": None})
+                        with os.fdopen(write_fd, "w") as f:
+                            f.write(result)
+                        os._exit(0)
+                    os.close(write_fd)
+                    selector.register(read_fd, selectors.EVENT_READ, request["id"])
+                    pending[read_fd] = {"id": request["id"], "pid": pid, "deadline": now + request["timeout"], "data": b""}
+            else:
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    pending[key.fd]["data"] += chunk
+                    continue
+                data = pending[key.fd]["data"]
+                # A child that died without answering (e.g. a segfault) is inconclusive
+                finish(key.fd, json.loads(data)["error"] if data else None)
+        now = time.monotonic()
+        for fd in [fd for fd, request in pending.items() if request["deadline"] <= now]:
+            # Slow scenes are left to the real render
+            os.kill(pending[fd]["pid"], signal.SIGKILL)
+            finish(fd, None)
+
+
+class PreflightChecker:
+    """Fast checks of generated scene code before a full manim render.
+
+    A check first runs `static_check` (syntax, imports, Scene subclass) and then a dry
+    construct pass: the scene's construct() runs in a forked copy of a warm worker process
+    that has manim imported already, with play/wait, speech synthesis and file output
+    skipped. Errors come back as Python tracebacks, the same kind of text the render's
+    stderr gives `fix_code_errors`. Checks that are inconclusive (timeouts, worker
+    failures, errors in the stubs) pass, leaving the decision to the real render.
+
+    Args:
+        timeout (float, optional): Seconds allowed for a dry construct pass. Defaults to 20.
+    """
+
+    def __init__(self, timeout: float = 20.0):
+        self.timeout = timeout
+        self.checks = 0
+        self.rejected = 0
+        self._process = None
+        self._loop = None
+        self._reader = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._start_lock = asyncio.Lock()
+
+    async def check(self, file_path: str, media_dir: str, topic: Optional[str] = None, scene: Optional[int] = None, version: Optional[int] = None) -> Optional[str]:
+        """Check a scene file.
+
+        Args:
+            file_path (str): Path of the scene code file
+            media_dir (str): Media directory the real render will use
+            topic (str, optional): Topic, for tracing. Defaults to None.
+            scene (int, optional): Scene number, for tracing. Defaults to None.
+            version (int, optional): Code version, for tracing. Defaults to None.
+
+        Returns:
+            Optional[str]: None if the code may be rendered, otherwise the error to fix
+        """
+        with span("preflight", topic=topic, scene=scene, version=version) as preflight_span:
+            with open(file_path, "r") as f:
+                code = f.read()
+            file_path = os.path.abspath(file_path)
+            error = static_check(code, file_path)
+            if error is None and hasattr(os, "fork"):
+                error = await self._dry_construct(file_path, os.path.abspath(media_dir))
+            preflight_span.set(outcome="rejected" if error else "ok")
+        self.checks += 1
+        if error is not None:
+            self.rejected += 1
+            print(f"Preflight rejected {file_path}: {error.strip().splitlines()[-1]}")
+        return error
+
+    async def _ensure_worker(self):
+        """Start the worker process if it is not running in this event loop."""
+        async with self._start_lock:
+            loop = asyncio.get_running_loop()
+            if self._process is not None and self._process.returncode is None and self._loop is loop:
+                return self._process
+            env = dict(os.environ)
+            env["PYTHONPATH"] = os.pathsep.join(p for p in (_REPO_ROOT, env.get("PYTHONPATH")) if p)
+            try:
+                self._process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "src.core.preflight", "--worker",
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    env=env
+                )
+            except OSError as e:
+                print(f"Could not start preflight worker: {e}")
+                self._process = None
+                return None
+            self._loop = loop
+            self._reader = asyncio.create_task(self._read_responses(self._process))
+            return self._process
+
+    async def _read_responses(self, process) -> None:
+        """Resolve pending checks from the worker's answers."""
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._pending.pop(response["id"], None)
+            if future is not None and not future.done():
+                future.set_result(response.get("error"))
+        # Worker exited: pending checks are inconclusive
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+        self._pending.clear()
+
+    async def _dry_construct(self, file_path: str, media_dir: str) -> Optional[str]:
+        """Run the dry construct pass in the worker.
+
+        Args:
+            file_path (str): Absolute path of the scene file
+            media_dir (str): Absolute media directory
+
+        Returns:
+            Optional[str]: The scene error, or None
+        """
+        process = await self._ensure_worker()
+        if process is None:
+            return None
+        request_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {"id": request_id, "path": file_path, "media_dir": media_dir, "timeout": self.timeout}
+        try:
+            process.stdin.write((json.dumps(request) + "\n").encode())
+            await process.stdin.drain()
+            return await asyncio.wait_for(future, self.timeout + 10)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            print(f"Preflight dry run of {file_path} inconclusive: {e!r}")
+            return None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self) -> None:
+        """Stop the worker process."""
+        if self._process is not None and self._process.returncode is None:
+            self._process.stdin.close()
+            await self._process.wait()
+        self._process = None
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        _serve()
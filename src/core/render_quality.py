@@ -0,0 +1,134 @@
+import os
+import re
+from typing import List, Optional
+
+# Manim's quality presets: CLI flag -> (width, height, frame rate)
+QUALITY_PRESETS = {
+    "l": (854, 480, 15),
+    "m": (1280, 720, 30),
+    "h": (1920, 1080, 60),
+    "p": (2560, 1440, 60),
+    "k": (3840, 2160, 60),
+}
+
+QUALITY_NAMES = {
+    "low": "l",
+    "medium": "m",
+    "high": "h",
+    "production": "p",
+    "fourk": "k",
+    "4k": "k",
+}
+
+
+class RenderQuality:
+    """A manim render quality, either one of manim's presets or a custom delivery profile.
+
+    Accepted specs are the preset names ("low", "medium", "high", "production", "4k"),
+    the manim flags ("-ql", "-qm", "-qh", "-qp", "-qk") and custom 16:9 profiles written
+    as "{height}p{fps}", e.g. "1080p30".
+
+    Args:
+        spec (str): Quality spec
+
+    Raises:
+        ValueError: If the spec is not recognised
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        key = spec.strip().lower()
+        key = QUALITY_NAMES.get(key, key)
+        if key.startswith("-q"):
+            key = key[2:]
+        if key in QUALITY_PRESETS:
+            self.preset = key
+            self.width, self.height, self.fps = QUALITY_PRESETS[key]
+            return
+        match = re.fullmatch(r"(\d+)p(\d+)", key)
+        if match is None:
+            raise ValueError(f"Unknown render quality '{spec}', expected one of "
+                             f"{', '.join(QUALITY_NAMES)} or a profile such as 1080p30")
+        self.height, self.fps = int(match.group(1)), int(match.group(2))
+        # Round to an even width, which H.264 requires
+        self.width = round(self.height * 16 / 9 / 2) * 2
+        self.preset = next((flag for flag, dims in QUALITY_PRESETS.items() if dims == (self.width, self.height, self.fps)), None)
+
+    @property
+    def folder_name(self) -> str:
+        """Name of the folder manim writes videos of this quality to, e.g. "1080p60"."""
+        return f"{self.height}p{self.fps}"
+
+    @property
+    def cost(self) -> float:
+        """Pixels rendered per second of video, relative to 1080p60."""
+        return (self.width * self.height * self.fps) / (1920 * 1080 * 60)
+
+    def manim_args(self) -> List[str]:
+        """Build the manim CLI arguments that select this quality.
+
+        Returns:
+            List[str]: Arguments such as ["-ql"] or ["-r", "1920,1080", "--fps", "30"]
+        """
+        if self.preset is not None:
+            return [f"-q{self.preset}"]
+        return ["-r", f"{self.width},{self.height}", "--fps", str(self.fps)]
+
+    @classmethod
+    def from_manim_args(cls, args: List[str]) -> "RenderQuality":
+        """Recover the quality selected by a manim command line.
+
+        Args:
+            args (List[str]): Manim command line
+
+        Returns:
+            RenderQuality: The selected quality; manim's default is high quality
+        """
+        height, fps = None, None
+        quality = cls("high")
+        for i, arg in enumerate(args):
+            if arg in ("-ql", "-qm", "-qh", "-qp", "-qk"):
+                quality = cls(arg)
+            elif arg in ("-r", "--resolution") and i + 1 < len(args):
+                height = int(args[i + 1].split(",")[-1])
+            elif arg in ("--fps", "--frame_rate") and i + 1 < len(args):
+                fps = int(float(args[i + 1]))
+        if height is None and fps is None:
+            return quality
+        return cls(f"{height or quality.height}p{fps or quality.fps}")
+
+    def __repr__(self) -> str:
+        return f"RenderQuality({self.folder_name})"
+
+
+def find_video_folder(version_dir: str, preferred: Optional[RenderQuality] = None) -> Optional[str]:
+    """Find the quality folder holding the rendered video of one scene version.
+
+    Args:
+        version_dir (str): Manim video folder of a scene version, e.g. media/videos/{prefix}_scene1_v2
+        preferred (RenderQuality, optional): Quality to use when it was rendered. Defaults to None.
+
+    Returns:
+        Optional[str]: The preferred quality folder if it contains an mp4, otherwise the
+            highest-resolution folder that does, or None if nothing was rendered
+    """
+    if not os.path.isdir(version_dir):
+        return None
+
+    def has_video(folder):
+        return any(f.endswith('.mp4') for f in os.listdir(folder))
+
+    if preferred is not None:
+        folder = os.path.join(version_dir, preferred.folder_name)
+        if os.path.isdir(folder) and has_video(folder):
+            return folder
+
+    candidates = []
+    for name in os.listdir(version_dir):
+        match = re.fullmatch(r"(\d+)p(\d+)", name)
+        folder = os.path.join(version_dir, name)
+        if match and os.path.isdir(folder) and has_video(folder):
+            candidates.append(((int(match.group(1)), int(match.group(2))), folder))
+    if not candidates:
+        return None
+    return max(candidates)[1]
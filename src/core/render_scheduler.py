@@ -0,0 +1,117 @@
+import os
+import asyncio
+import signal
+import subprocess
+from typing import List, Optional
+
+from mllm_tools.rate_limiter import report_overload
+
+
+class RenderScheduler:
+    """A bounded pool of render workers shared by every scene and topic.
+
+    Manim renders are CPU and memory bound while code generation is bound by API
+    latency, so renders get their own worker count instead of sharing the scene
+    semaphore that gates LLM calls. Callers submit render commands with `run`; the
+    command waits for a free worker and runs as an asyncio subprocess, so the event
+    loop keeps serving model requests in the meantime.
+
+    Args:
+        max_workers (int, optional): Number of concurrent renders. Defaults to a value
+            derived from available cores and memory.
+        memory_per_worker_gb (float, optional): Memory budget assumed for a single
+            manim render when deriving the default worker count. Defaults to 2.0.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, memory_per_worker_gb: float = 2.0):
+        self.max_workers = max_workers if max_workers else self.default_worker_count(memory_per_worker_gb)
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        self.queued = 0
+        self.running = 0
+        print(f"Render scheduler using {self.max_workers} workers")
+
+    @staticmethod
+    def available_cores() -> int:
+        """Count the cores this process may run on.
+
+        Returns:
+            int: Number of usable cores, at least 1
+        """
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @property
+    def free_workers(self) -> int:
+        """Number of workers not running a render right now."""
+        return max(0, self.max_workers - self.running)
+
+    @staticmethod
+    def default_worker_count(memory_per_worker_gb: float = 2.0) -> int:
+        """Derive a worker count from the cores and memory available to this process.
+
+        Args:
+            memory_per_worker_gb (float, optional): Memory budget per render. Defaults to 2.0.
+
+        Returns:
+            int: Number of render workers, at least 1
+        """
+        cores = RenderScheduler.available_cores()
+
+        try:
+            available_bytes = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+            memory_workers = int(available_bytes // (memory_per_worker_gb * 1024 ** 3))
+        except (ValueError, OSError, AttributeError):
+            # sysconf is not available on every platform, fall back to cores only
+            memory_workers = cores
+
+        return max(1, min(cores, memory_workers))
+
+    async def run(self, command: List[str], cwd: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Run a render command once a worker is free.
+
+        If the awaiting task is cancelled, the render process is killed so the worker
+        is released immediately.
+
+        Args:
+            command (List[str]): Command to execute, e.g. a manim invocation
+            cwd (str, optional): Working directory for the command. Defaults to None.
+
+        Returns:
+            subprocess.CompletedProcess: Result of the finished command with text stdout/stderr
+        """
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd
+            )
+            try:
+                stdout, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+            result = subprocess.CompletedProcess(
+                command,
+                process.returncode,
+                stdout.decode("utf-8", errors="replace"),
+                stderr.decode("utf-8", errors="replace")
+            )
+            # SIGKILL is what the kernel OOM killer sends; let the concurrency controllers back off
+            if result.returncode == -signal.SIGKILL or "MemoryError" in result.stderr:
+                report_overload("render_oom")
+            return result
+        finally:
+            self.running -= 1
+            self._semaphore.release()
@@ -0,0 +1,361 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from src.utils.utils import extract_xml, hash_file
+
+# Stage names recorded in the manifest. Topic-level stages use scene 0.
+STAGE_OUTLINE = "outline"
+STAGE_PLAN = "plan"
+STAGE_CODE = "code"
+STAGE_RENDER = "render"
+STAGE_COMBINE = "combine"
+
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    topic TEXT PRIMARY KEY,
+    scene_count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    topic TEXT NOT NULL,
+    scene INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    artifact_path TEXT,
+    artifact_hash TEXT,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    PRIMARY KEY (topic, scene, version, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_stages_topic_stage ON stages (topic, stage, status);
+CREATE INDEX IF NOT EXISTS idx_stages_stage_status ON stages (stage, status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_UPSERT_STAGE = (
+    "INSERT INTO stages (topic, scene, version, stage, status, artifact_path, artifact_hash, started_at, finished_at, duration) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(topic, scene, version, stage) DO UPDATE SET "
+    "status = excluded.status, artifact_path = COALESCE(excluded.artifact_path, stages.artifact_path), "
+    "artifact_hash = COALESCE(excluded.artifact_hash, stages.artifact_hash), "
+    "started_at = COALESCE(excluded.started_at, stages.started_at), "
+    "finished_at = excluded.finished_at, duration = excluded.duration"
+)
+
+_UPSERT_TOPIC = (
+    "INSERT INTO topics (topic, scene_count, updated_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(topic) DO UPDATE SET scene_count = excluded.scene_count, updated_at = excluded.updated_at"
+)
+
+# Meta key set when the output tree has been imported into the manifest
+_META_IMPORTED = "imported"
+
+
+class RunManifest:
+    """Transactional record of pipeline state for every topic, scene and version.
+
+    Replaces probing the output tree with os.path.exists/os.listdir and marker files.
+    Each row stores the status of one stage (outline, plan, code, render, combine) along
+    with its artifact path, artifact hash and timings. Writes are atomic SQLite
+    transactions and lookups go through indexes, so status checks stay fast on network
+    filesystems with thousands of topics.
+
+    Args:
+        output_dir (str): Output directory of the run; the database lives at
+            `{output_dir}/run_manifest.db`
+        db_path (str, optional): Explicit database path. Defaults to None.
+    """
+
+    def __init__(self, output_dir: str = "output", db_path: Optional[str] = None):
+        self.output_dir = output_dir
+        self.db_path = db_path or os.path.join(output_dir, "run_manifest.db")
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # Renders and combines record from worker threads, so share one guarded connection
+        self._conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    @property
+    def is_imported(self) -> bool:
+        """Whether the output tree has been imported, i.e. the manifest is authoritative.
+
+        A manifest created by an interrupted import (or before the pipeline recorded
+        into it) lacks the marker and is rebuilt on the next start.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (_META_IMPORTED,)).fetchone()
+        return row is not None
+
+    def set_scene_count(self, topic: str, scene_count: int) -> None:
+        """Record the number of scenes in a topic's outline.
+
+        Args:
+            topic (str): Topic file prefix
+            scene_count (int): Number of scenes
+        """
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT_TOPIC, (topic, scene_count, time.time()))
+
+    def get_scene_count(self, topic: str) -> int:
+        """Get the number of scenes recorded for a topic.
+
+        Args:
+            topic (str): Topic file prefix
+
+        Returns:
+            int: Number of scenes, 0 if the topic has no outline yet
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT scene_count FROM topics WHERE topic = ?", (topic,)).fetchone()
+        return row["scene_count"] if row else 0
+
+    def record(self,
+               topic: str,
+               stage: str,
+               status: str,
+               scene: int = 0,
+               version: int = 0,
+               artifact_path: Optional[str] = None,
+               started_at: Optional[float] = None,
+               artifact_hash: Optional[str] = None) -> None:
+        """Insert or update the state of one stage.
+
+        Args:
+            topic (str): Topic file prefix
+            stage (str): Stage name, e.g. STAGE_PLAN
+            status (str): One of STATUS_RUNNING, STATUS_SUCCEEDED, STATUS_FAILED
+            scene (int, optional): Scene number, 0 for topic-level stages. Defaults to 0.
+            version (int, optional): Code version. Defaults to 0.
+            artifact_path (str, optional): Path of the produced artifact. Defaults to None.
+            started_at (float, optional): Start timestamp, used to compute the duration. Defaults to None.
+            artifact_hash (str, optional): Precomputed artifact hash; computed from the file if omitted.
+        """
+        row = self._stage_row(topic, stage, status, scene, version, artifact_path, started_at, artifact_hash)
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT_STAGE, row)
+
+    @staticmethod
+    def _stage_row(topic: str, stage: str, status: str, scene: int = 0, version: int = 0,
+                   artifact_path: Optional[str] = None, started_at: Optional[float] = None,
+                   artifact_hash: Optional[str] = None) -> tuple:
+        """Build the parameters of _UPSERT_STAGE for one stage; see record for the arguments."""
+        now = time.time()
+        finished_at = None if status == STATUS_RUNNING else now
+        if artifact_hash is None and status == STATUS_SUCCEEDED:
+            artifact_hash = hash_file(artifact_path)
+        duration = finished_at - started_at if (finished_at is not None and started_at is not None) else None
+        return (topic, scene, version, stage, status, artifact_path, artifact_hash,
+                started_at if started_at is not None else now, finished_at, duration)
+
+    def get_latest(self, topic: str, stage: str, scene: int = 0, status: Optional[str] = STATUS_SUCCEEDED) -> Optional[Dict]:
+        """Get the highest-version row of a stage.
+
+        Args:
+            topic (str): Topic file prefix
+            stage (str): Stage name
+            scene (int, optional): Scene number. Defaults to 0.
+            status (str, optional): Only consider rows with this status, None for any. Defaults to STATUS_SUCCEEDED.
+
+        Returns:
+            Optional[Dict]: The row as a dictionary, or None if nothing was recorded
+        """
+        query = "SELECT * FROM stages WHERE topic = ? AND scene = ? AND stage = ?"
+        params = [topic, scene, stage]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY version DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+        return dict(row) if row else None
+
+    def has_stage(self, topic: str, stage: str, scene: int = 0) -> bool:
+        """Check whether a stage succeeded for a topic/scene in any version.
+
+        Args:
+            topic (str): Topic file prefix
+            stage (str): Stage name
+            scene (int, optional): Scene number. Defaults to 0.
+
+        Returns:
+            bool: True if a succeeded row exists
+        """
+        return self.get_latest(topic, stage, scene) is not None
+
+    def topic_status(self, topic: str) -> Dict:
+        """Summarize the state of a topic in a single indexed query.
+
+        Args:
+            topic (str): Topic file prefix
+
+        Returns:
+            Dict: Keys has_scene_outline, total_scenes, has_combined_video and
+                scene_status (list of dicts with scene_number, has_plan, has_code, has_render)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT scene, stage FROM stages WHERE topic = ? AND status = ?",
+                (topic, STATUS_SUCCEEDED)
+            ).fetchall()
+        done = {(row["scene"], row["stage"]) for row in rows}
+        total_scenes = self.get_scene_count(topic)
+        return {
+            'has_scene_outline': (0, STAGE_OUTLINE) in done,
+            'total_scenes': total_scenes,
+            'has_combined_video': (0, STAGE_COMBINE) in done,
+            'scene_status': [{
+                'scene_number': i,
+                'has_plan': (i, STAGE_PLAN) in done,
+                'has_code': (i, STAGE_CODE) in done,
+                'has_render': (i, STAGE_RENDER) in done
+            } for i in range(1, total_scenes + 1)]
+        }
+
+    def count_topics(self, stage: str = None) -> int:
+        """Count topics, optionally only those with a succeeded topic-level stage.
+
+        Args:
+            stage (str, optional): Topic-level stage name. Defaults to None (all topics).
+
+        Returns:
+            int: Number of topics
+        """
+        with self._lock:
+            if stage is None:
+                row = self._conn.execute("SELECT COUNT(*) AS n FROM topics").fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(DISTINCT topic) AS n FROM stages WHERE scene = 0 AND stage = ? AND status = ?",
+                    (stage, STATUS_SUCCEEDED)
+                ).fetchone()
+        return row["n"]
+
+    def count_scenes(self, stage: str = None) -> int:
+        """Count scenes, optionally only those with a succeeded stage.
+
+        Args:
+            stage (str, optional): Scene-level stage name. Defaults to None (all scenes in outlines).
+
+        Returns:
+            int: Number of scenes
+        """
+        with self._lock:
+            if stage is None:
+                row = self._conn.execute("SELECT COALESCE(SUM(scene_count), 0) AS n FROM topics").fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) AS n FROM (SELECT DISTINCT topic, scene FROM stages WHERE scene > 0 AND stage = ? AND status = ?)",
+                    (stage, STATUS_SUCCEEDED)
+                ).fetchone()
+        return row["n"]
+
+    def import_output_tree(self, output_dir: Optional[str] = None) -> int:
+        """Rebuild the manifest from an existing output tree.
+
+        The tree is scanned (and artifacts hashed) first; the old state is then replaced
+        in a single transaction that also sets the imported marker, so an interrupted
+        import leaves either the previous manifest or the complete new one.
+
+        Args:
+            output_dir (str, optional): Output directory to scan. Defaults to the manifest's output_dir.
+
+        Returns:
+            int: Number of topics imported
+        """
+        output_dir = output_dir or self.output_dir
+        topics = []
+        stages = []
+        for file_prefix in sorted(os.listdir(output_dir)) if os.path.isdir(output_dir) else []:
+            topic_dir = os.path.join(output_dir, file_prefix)
+            scene_outline_path = os.path.join(topic_dir, f"{file_prefix}_scene_outline.txt")
+            if not os.path.isdir(topic_dir) or not os.path.exists(scene_outline_path):
+                continue
+
+            with open(scene_outline_path, "r") as f:
+                scene_outline = extract_xml(f.read())
+            scene_count = len(re.findall(r'<SCENE_(\d+)>[^<]', scene_outline))
+            topics.append((file_prefix, scene_count, time.time()))
+            stages.append(self._stage_row(file_prefix, STAGE_OUTLINE, STATUS_SUCCEEDED, artifact_path=scene_outline_path))
+
+            for i in range(1, scene_count + 1):
+                scene_dir = os.path.join(topic_dir, f"scene{i}")
+                plan_path = os.path.join(scene_dir, f"{file_prefix}_scene{i}_implementation_plan.txt")
+                if os.path.exists(plan_path):
+                    stages.append(self._stage_row(file_prefix, STAGE_PLAN, STATUS_SUCCEEDED, scene=i, artifact_path=plan_path))
+
+                code_dir = os.path.join(scene_dir, "code")
+                versions = self._code_versions(code_dir, file_prefix, i)
+                for version in versions:
+                    code_path = os.path.join(code_dir, f"{file_prefix}_scene{i}_v{version}.py")
+                    stages.append(self._stage_row(file_prefix, STAGE_CODE, STATUS_SUCCEEDED, scene=i, version=version, artifact_path=code_path))
+
+                if versions and os.path.exists(os.path.join(scene_dir, "succ_rendered.txt")):
+                    stages.append(self._stage_row(
+                        file_prefix, STAGE_RENDER, STATUS_SUCCEEDED, scene=i, version=versions[-1],
+                        artifact_path=os.path.join(topic_dir, "media", "videos", f"{file_prefix}_scene{i}_v{versions[-1]}")))
+
+            combined_video_path = os.path.join(topic_dir, f"{file_prefix}_combined.mp4")
+            if os.path.exists(combined_video_path):
+                # Hashing the combined video is expensive and not needed to rebuild state
+                stages.append(self._stage_row(file_prefix, STAGE_COMBINE, STATUS_SUCCEEDED,
+                                              artifact_path=combined_video_path, artifact_hash=""))
+
+        with self._lock:
+            # Rebuilding replaces whatever the manifest knew before
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM stages")
+                self._conn.execute("DELETE FROM topics")
+                self._conn.executemany(_UPSERT_TOPIC, topics)
+                self._conn.executemany(_UPSERT_STAGE, stages)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   (_META_IMPORTED, str(time.time())))
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+        print(f"Imported {len(topics)} topics from {output_dir} into run manifest {self.db_path}")
+        return len(topics)
+
+    @staticmethod
+    def _code_versions(code_dir: str, file_prefix: str, scene_number: int) -> List[int]:
+        """List the code versions present in a scene's code directory.
+
+        Args:
+            code_dir (str): Path to the scene's code directory
+            file_prefix (str): Topic file prefix
+            scene_number (int): Scene number
+
+        Returns:
+            List[int]: Sorted version numbers
+        """
+        if not os.path.isdir(code_dir):
+            return []
+        pattern = re.compile(rf'^{re.escape(file_prefix)}_scene{scene_number}_v(\d+)\.py$')
+        versions = []
+        for filename in os.listdir(code_dir):
+            match = pattern.match(filename)
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import math
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import ffmpeg # You might need to install ffmpeg-python package: pip install ffmpeg-python
+
+from src.utils.media_index import get_media_index
+from src.utils.utils import atomic_write
+
+STREAM_FORMATS = ("hls", "dash")
+# Segments are cut at keyframes, so with stream copy this is a target rather than an exact length
+SEGMENT_SECONDS = 4
+
+_MPD_NS = "urn:mpeg:dash:schema:mpd:2011"
+ET.register_namespace("", _MPD_NS)
+ET.register_namespace("xlink", "http://www.w3.org/1999/xlink")
+ET.register_namespace("xsi", "http://www.w3.org/2001/XMLSchema-instance")
+
+# Scenes of one topic finish rendering concurrently; playlists are rebuilt one at a time
+_playlist_lock = threading.Lock()
+
+
+def srt_to_vtt(srt: str) -> str:
+    """Convert SRT subtitles to WebVTT for HLS/DASH players.
+
+    Args:
+        srt (str): SRT content
+
+    Returns:
+        str: WebVTT content whose cue times are relative to the start of the segment
+    """
+    lines = []
+    for line in srt.replace('\r\n', '\n').strip().split('\n'):
+        if '-->' in line:
+            line = re.sub(r'(\d{2}:\d{2}:\d{2}),(\d{3})', r'\1.\2', line)
+        lines.append(line)
+    body = "\n".join(lines)
+    return "WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000\n\n" + (body + "\n" if body else "")
+
+
+def _iso_duration(seconds: float) -> str:
+    return f"PT{seconds:.3f}S"
+
+
+def _vtt_time(seconds: float) -> str:
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+
+def _scene_titles(outline_path: str) -> Tuple[int, Dict[int, str]]:
+    """Read the scene count and scene titles from a topic's scene outline."""
+    if not os.path.exists(outline_path):
+        return 0, {}
+    with open(outline_path, encoding='utf-8') as f:
+        plan = f.read()
+    outline = re.search(r'<SCENE_OUTLINE>(.*?)</SCENE_OUTLINE>', plan, re.DOTALL)
+    if outline is None:
+        return 0, {}
+    scenes = re.findall(r'<SCENE_(\d+)>(.*?)</SCENE_\1>', outline.group(1), re.DOTALL)
+    titles = {}
+    for number, body in scenes:
+        title = re.search(r'Scene Title:\**\s*(.+)', body)
+        titles[int(number)] = title.group(1).strip() if title else f"Scene {number}"
+    return len(scenes), titles
+
+
+class StreamPackager:
+    """Packages accepted scene renders as HLS (and optionally DASH) without re-encoding.
+
+    Each scene is segmented on its own into `{output_dir}/{prefix}/stream/scene{N}`, so a
+    scene can be served as soon as it renders and a re-rendered scene only replaces its
+    own segments. Topic playlists join the scenes in order: one chapter per scene, with a
+    discontinuity (HLS) or a new period (DASH) at every scene boundary, and the scenes'
+    subtitles as WebVTT. Playlists list scenes up to the first one that is not packaged
+    yet and are marked complete once every scene in the outline is.
+
+    Args:
+        output_dir (str): Output directory of the run
+        formats (List[str], optional): Any of STREAM_FORMATS. Defaults to ["hls"].
+        segment_seconds (int, optional): Target segment length. Defaults to SEGMENT_SECONDS.
+    """
+
+    def __init__(self, output_dir: str, formats: Optional[List[str]] = None, segment_seconds: int = SEGMENT_SECONDS):
+        self.output_dir = output_dir
+        self.formats = sorted(set(formats or ["hls"]))
+        unknown = [f for f in self.formats if f not in STREAM_FORMATS]
+        if unknown:
+            raise ValueError(f"Unknown stream formats {unknown}, expected any of {', '.join(STREAM_FORMATS)}")
+        self.segment_seconds = segment_seconds
+
+    def stream_dir(self, file_prefix: str) -> str:
+        return os.path.join(self.output_dir, file_prefix, "stream")
+
+    def package_scene(self, file_prefix: str, scene: int, video_path: str, subtitle_path: Optional[str] = None) -> bool:
+        """Segment one scene render, replacing the scene's previous segments.
+
+        Args:
+            file_prefix (str): Topic file prefix
+            scene (int): Scene number
+            video_path (str): Accepted render of the scene
+            subtitle_path (str, optional): SRT subtitles of the render. Defaults to None.
+
+        Returns:
+            bool: Whether the scene was packaged; False if its segments were already up to date
+        """
+        media_index = get_media_index()
+        source = {
+            "video": media_index.content_hash(video_path),
+            "subtitles": media_index.content_hash(subtitle_path) if subtitle_path else None,
+            "formats": self.formats,
+            "segment_seconds": self.segment_seconds,
+        }
+        scene_dir = os.path.join(self.stream_dir(file_prefix), f"scene{scene}")
+        source_path = os.path.join(scene_dir, "source.json")
+        if os.path.exists(source_path):
+            with open(source_path, encoding='utf-8') as f:
+                previous = json.load(f)
+            if all(previous.get(key) == value for key, value in source.items()):
+                return False
+
+        # Package next to the old segments and swap directories, so players never see a half-written scene
+        tmp_dir = scene_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        if "hls" in self.formats:
+            (
+                ffmpeg.input(video_path)
+                .output(os.path.join(tmp_dir, "index.m3u8"), c='copy', f='hls',
+                        hls_time=self.segment_seconds, hls_playlist_type='vod',
+                        hls_segment_type='fmp4', hls_fmp4_init_filename='init.mp4',
+                        hls_segment_filename=os.path.join(tmp_dir, 'seg_%05d.m4s'))
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        if "dash" in self.formats:
+            os.makedirs(os.path.join(tmp_dir, "dash"))
+            (
+                ffmpeg.input(video_path)
+                .output(os.path.join(tmp_dir, "dash", "manifest.mpd"), c='copy', f='dash',
+                        seg_duration=self.segment_seconds, use_template=1, use_timeline=1)
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        subtitles = ""
+        if subtitle_path:
+            with open(subtitle_path, encoding='utf-8') as f:
+                subtitles = f.read()
+        with open(os.path.join(tmp_dir, "subtitles.vtt"), 'w', encoding='utf-8') as f:
+            f.write(srt_to_vtt(subtitles))
+
+        info = media_index.get(video_path)
+        source.update(duration=info.duration, width=info.width, height=info.height, fps=info.fps)
+        with open(os.path.join(tmp_dir, "source.json"), 'w', encoding='utf-8') as f:
+            json.dump(source, f, indent=2)
+
+        old_dir = scene_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(scene_dir):
+            os.replace(scene_dir, old_dir)
+        os.replace(tmp_dir, scene_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return True
+
+    def write_playlists(self, file_prefix: str) -> Optional[str]:
+        """Rebuild the topic playlists from the scenes packaged so far.
+
+        Args:
+            file_prefix (str): Topic file prefix
+
+        Returns:
+            Optional[str]: Path of the HLS master playlist (or of the MPD if only DASH is
+                packaged), or None if no scene is ready yet
+        """
+        stream_dir = self.stream_dir(file_prefix)
+        scene_count, titles = _scene_titles(os.path.join(self.output_dir, file_prefix, f"{file_prefix}_scene_outline.txt"))
+        with _playlist_lock:
+            scenes = []
+            for scene in range(1, scene_count + 1):
+                source_path = os.path.join(stream_dir, f"scene{scene}", "source.json")
+                if not os.path.exists(source_path):
+                    break
+                with open(source_path, encoding='utf-8') as f:
+                    source = json.load(f)
+                if any(fmt not in source.get("formats", []) for fmt in self.formats):
+                    break
+                scenes.append((scene, source))
+            if not scenes:
+                return None
+            complete = len(scenes) == scene_count
+
+            self._write_chapters(stream_dir, scenes, titles)
+            playlist_path = None
+            if "dash" in self.formats:
+                playlist_path = self._write_mpd(stream_dir, file_prefix, scenes)
+            if "hls" in self.formats:
+                playlist_path = self._write_hls(stream_dir, file_prefix, scenes, complete)
+        state = "complete" if complete else f"{len(scenes)}/{scene_count} scenes"
+        print(f"Stream playlists for {file_prefix} updated ({state}): {playlist_path}")
+        return playlist_path
+
+    def _write_chapters(self, stream_dir: str, scenes: List[Tuple[int, Dict]], titles: Dict[int, str]) -> None:
+        """Write the scene chapters as Apple's HLS chapter JSON and as a WebVTT chapter track."""
+        chapters, cues, start = [], ["WEBVTT", ""], 0.0
+        for scene, source in scenes:
+            title = titles.get(scene, f"Scene {scene}")
+            chapters.append({
+                "chapter": scene,
+                "start-time": round(start, 3),
+                "duration": round(source["duration"], 3),
+                "titles": [{"language": "en", "title": title}],
+            })
+            cues += [f"scene{scene}", f"{_vtt_time(start)} --> {_vtt_time(start + source['duration'])}", title, ""]
+            start += source["duration"]
+        atomic_write(os.path.join(stream_dir, "chapters.json"), json.dumps(chapters, indent=2))
+        atomic_write(os.path.join(stream_dir, "chapters.vtt"), "\n".join(cues))
+
+    def _write_hls(self, stream_dir: str, file_prefix: str, scenes: List[Tuple[int, Dict]], complete: bool) -> str:
+        """Write the joined video and subtitle media playlists and the master playlist."""
+        video_lines, target_duration = [], 1
+        peak_bitrate, total_bits, total_duration = 0, 0, 0.0
+        subtitle_lines = []
+        for i, (scene, source) in enumerate(scenes):
+            scene_dir = os.path.join(stream_dir, f"scene{scene}")
+            if i > 0:
+                video_lines.append("#EXT-X-DISCONTINUITY")
+                subtitle_lines.append("#EXT-X-DISCONTINUITY")
+            with open(os.path.join(scene_dir, "index.m3u8"), encoding='utf-8') as f:
+                scene_lines = f.read().splitlines()
+            segment_duration = None
+            for line in scene_lines:
+                if line.startswith("#EXT-X-TARGETDURATION:"):
+                    target_duration = max(target_duration, int(line.split(":", 1)[1]))
+                elif line.startswith("#EXT-X-MAP:"):
+                    video_lines.append(re.sub(r'URI="([^"]+)"', rf'URI="scene{scene}/\1"', line))
+                elif line.startswith("#EXTINF:"):
+                    segment_duration = float(line.split(":", 1)[1].split(",")[0])
+                    video_lines.append(line)
+                elif line and not line.startswith("#"):
+                    video_lines.append(f"scene{scene}/{line}")
+                    bits = os.path.getsize(os.path.join(scene_dir, line)) * 8
+                    total_bits += bits
+                    if segment_duration:
+                        peak_bitrate = max(peak_bitrate, int(bits / segment_duration))
+            total_duration += source["duration"]
+            subtitle_lines += [f"#EXTINF:{source['duration']:.3f},", f"scene{scene}/subtitles.vtt"]
+
+        header = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-MEDIA-SEQUENCE:0"]
+        # An unfinished topic gets no playlist type: EVENT would forbid replacing a scene
+        # that was already listed, which happens when a scene is re-rendered
+        if complete:
+            header.append("#EXT-X-PLAYLIST-TYPE:VOD")
+        end = ["#EXT-X-ENDLIST"] if complete else []
+        atomic_write(os.path.join(stream_dir, "video.m3u8"), "\n".join(
+            header[:2] + [f"#EXT-X-TARGETDURATION:{target_duration}"] + header[2:] + ["#EXT-X-INDEPENDENT-SEGMENTS"] + video_lines + end
+        ) + "\n")
+        subtitle_target = math.ceil(max(source["duration"] for _, source in scenes))
+        atomic_write(os.path.join(stream_dir, "subtitles.m3u8"), "\n".join(
+            header[:2] + [f"#EXT-X-TARGETDURATION:{subtitle_target}"] + header[2:] + subtitle_lines + end
+        ) + "\n")
+
+        width = max(source["width"] for _, source in scenes)
+        height = max(source["height"] for _, source in scenes)
+        fps = max(source["fps"] or 0 for _, source in scenes)
+        average_bitrate = int(total_bits / total_duration) if total_duration else peak_bitrate
+        master_path = os.path.join(stream_dir, f"{file_prefix}.m3u8")
+        atomic_write(master_path, "\n".join([
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            '#EXT-X-SESSION-DATA:DATA-ID="com.apple.hls.chapters",URI="chapters.json"',
+            '#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="English",LANGUAGE="en",DEFAULT=YES,AUTOSELECT=YES,URI="subtitles.m3u8"',
+            f'#EXT-X-STREAM-INF:BANDWIDTH={max(peak_bitrate, average_bitrate)},AVERAGE-BANDWIDTH={average_bitrate},'
+            f'RESOLUTION={width}x{height},FRAME-RATE={fps:.3f},SUBTITLES="subs"',
+            "video.m3u8",
+        ]) + "\n")
+        return master_path
+
+    def _write_mpd(self, stream_dir: str, file_prefix: str, scenes: List[Tuple[int, Dict]]) -> str:
+        """Join the scenes' DASH manifests into one multi-period MPD, one period per scene."""
+        root, periods, start = None, [], 0.0
+        for scene, source in scenes:
+            scene_root = ET.parse(os.path.join(stream_dir, f"scene{scene}", "dash", "manifest.mpd")).getroot()
+            if root is None:
+                root = scene_root
+            for period in scene_root.findall(f"{{{_MPD_NS}}}Period"):
+                if scene_root is root:
+                    root.remove(period)
+                period.set("id", f"scene{scene}")
+                period.set("start", _iso_duration(start))
+                period.set("duration", _iso_duration(source["duration"]))
+                base_url = ET.Element(f"{{{_MPD_NS}}}BaseURL")
+                base_url.text = f"scene{scene}/dash/"
+                period.insert(0, base_url)
+                subtitles = ET.SubElement(period, f"{{{_MPD_NS}}}AdaptationSet",
+                                          {"contentType": "text", "mimeType": "text/vtt", "lang": "en"})
+                ET.SubElement(subtitles, f"{{{_MPD_NS}}}Role", {"schemeIdUri": "urn:mpeg:dash:role:2011", "value": "subtitle"})
+                representation = ET.SubElement(subtitles, f"{{{_MPD_NS}}}Representation", {"id": f"subtitles{scene}", "bandwidth": "256"})
+                ET.SubElement(representation, f"{{{_MPD_NS}}}BaseURL").text = "../subtitles.vtt"
+                periods.append(period)
+            start += source["duration"]
+        for period in periods:
+            root.append(period)
+        root.set("type", "static")
+        root.set("mediaPresentationDuration", _iso_duration(start))
+
+        mpd_path = os.path.join(stream_dir, f"{file_prefix}.mpd")
+        atomic_write(mpd_path, ET.tostring(root, encoding="unicode", xml_declaration=True))
+        return mpd_path
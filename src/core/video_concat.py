@@ -0,0 +1,281 @@
+import os
+import json
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import ffmpeg # You might need to install ffmpeg-python package: pip install ffmpeg-python
+
+from src.core.render_quality import RenderQuality
+from src.utils.media_index import get_media_index
+
+# Encoders used when a segment has to be re-encoded to match the others
+VIDEO_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+AUDIO_ENCODERS = {"aac": "aac", "mp3": "libmp3lame", "opus": "libopus"}
+
+
+class SegmentInfo:
+    """Stream layout of one scene video, as far as concatenation cares.
+
+    Two segments can be joined by stream copy when their video and audio signatures are
+    equal.
+
+    Args:
+        path (str): Path of the video file
+        probe (dict): Output of ffmpeg.probe for the file
+    """
+
+    def __init__(self, path: str, probe: dict):
+        self.path = path
+        video = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+        audio = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+        self.duration = float(probe.get('format', {}).get('duration') or video['duration'])
+        self.video_codec = video['codec_name']
+        self.profile = video.get('profile')
+        self.width = int(video['width'])
+        self.height = int(video['height'])
+        self.frame_rate = video['r_frame_rate']
+        self.pix_fmt = video.get('pix_fmt')
+        self.has_audio = audio is not None
+        self.audio_codec = audio['codec_name'] if audio else None
+        self.sample_rate = int(audio['sample_rate']) if audio else None
+        self.channels = int(audio['channels']) if audio else None
+
+    @property
+    def video_signature(self) -> Tuple:
+        return (self.video_codec, self.profile, self.width, self.height, self.frame_rate, self.pix_fmt)
+
+    @property
+    def audio_signature(self) -> Optional[Tuple]:
+        if not self.has_audio:
+            return None
+        return (self.audio_codec, self.sample_rate, self.channels)
+
+    @classmethod
+    def probe(cls, path: str) -> "SegmentInfo":
+        """Look up a video file in the media index, probing it with ffprobe if needed.
+
+        Args:
+            path (str): Path of the video file
+
+        Returns:
+            SegmentInfo: Stream layout of the file
+        """
+        return cls(path, get_media_index().get(path).as_probe())
+
+
+class ConcatTarget:
+    """Stream parameters every segment is brought to before the stream-copy concat.
+
+    The most common video layout among the segments becomes the target, so that in the
+    usual case (all scenes rendered with the same manim config) nothing is re-encoded.
+    When a delivery quality is given, its resolution and frame rate override the common
+    layout's, so scenes left over from an earlier quality setting are brought to it.
+    Audio follows the most common layout among segments that have audio, if any do.
+
+    Args:
+        segments (List[SegmentInfo]): Segments to be joined
+        quality (RenderQuality, optional): Delivery quality. Defaults to None.
+    """
+
+    def __init__(self, segments: List[SegmentInfo], quality: Optional[RenderQuality] = None):
+        video_signature = Counter(s.video_signature for s in segments).most_common(1)[0][0]
+        self.video_codec, self.profile, self.width, self.height, self.frame_rate, self.pix_fmt = video_signature
+        if quality is not None:
+            self.width, self.height, self.frame_rate = quality.width, quality.height, f"{quality.fps}/1"
+        if self.video_codec not in VIDEO_ENCODERS:
+            # Segments in a codec we cannot produce are all brought to H.264 instead
+            self.video_codec, self.profile = "h264", "High"
+
+        audio_signatures = Counter(s.audio_signature for s in segments if s.has_audio)
+        self.has_audio = bool(audio_signatures)
+        self.audio_codec, self.sample_rate, self.channels = (
+            audio_signatures.most_common(1)[0][0] if audio_signatures else (None, None, None)
+        )
+        if self.has_audio and self.audio_codec not in AUDIO_ENCODERS:
+            self.audio_codec = "aac"
+
+    @property
+    def video_signature(self) -> Tuple:
+        return (self.video_codec, self.profile, self.width, self.height, self.frame_rate, self.pix_fmt)
+
+    @property
+    def audio_signature(self) -> Optional[Tuple]:
+        if not self.has_audio:
+            return None
+        return (self.audio_codec, self.sample_rate, self.channels)
+
+    @property
+    def key(self) -> str:
+        """Short hash of the target parameters, used to name conformed segments."""
+        return hashlib.sha256(repr((self.video_signature, self.audio_signature)).encode()).hexdigest()[:12]
+
+    def video_matches(self, segment: SegmentInfo) -> bool:
+        return segment.video_signature == self.video_signature
+
+    def audio_matches(self, segment: SegmentInfo) -> bool:
+        return segment.audio_signature == self.audio_signature
+
+    def video_args(self) -> dict:
+        """ffmpeg output options that encode video with the target parameters."""
+        args = {'c:v': VIDEO_ENCODERS[self.video_codec], 'r': self.frame_rate, 'preset': 'veryfast', 'crf': '23'}
+        if self.pix_fmt:
+            args['pix_fmt'] = self.pix_fmt
+        if self.profile and self.video_codec == "h264":
+            args['profile:v'] = self.profile.lower().replace(' ', '')
+        return args
+
+    def audio_args(self) -> dict:
+        """ffmpeg output options that encode audio with the target parameters."""
+        return {'c:a': AUDIO_ENCODERS[self.audio_codec], 'ar': self.sample_rate, 'ac': self.channels}
+
+
+def load_combine_record(path: str) -> Optional[dict]:
+    """Load the input hashes a combined video was built from.
+
+    Args:
+        path (str): Record written by save_combine_record
+
+    Returns:
+        Optional[dict]: The record, or None if it is missing or unreadable
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_combine_record(path: str, record: dict) -> None:
+    """Store the input hashes a combined video was built from.
+
+    Args:
+        path (str): Where to write the record
+        record (dict): Input hashes, e.g. {"videos": [...], "subtitles": [...]}
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+
+
+def make_silent_audio(target: ConcatTarget, duration: float, output_path: str) -> str:
+    """Encode a silent audio track with the target's audio parameters.
+
+    Args:
+        target (ConcatTarget): Target stream parameters; must have audio
+        duration (float): Length of the track in seconds
+        output_path (str): Where to write the track, e.g. "silence.m4a"
+
+    Returns:
+        str: output_path
+    """
+    layout = {1: "mono", 2: "stereo"}.get(target.channels, f"{target.channels}c")
+    (
+        ffmpeg.input(f'anullsrc=channel_layout={layout}:sample_rate={target.sample_rate}', f='lavfi', t=duration)
+        .output(output_path, **target.audio_args())
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return output_path
+
+
+def conform_segment(segment: SegmentInfo, target: ConcatTarget, output_path: str, silent_audio: Optional[str] = None,
+                    threads: Optional[int] = None) -> str:
+    """Bring one segment to the target parameters, copying whatever already matches.
+
+    Args:
+        segment (SegmentInfo): Segment to conform
+        target (ConcatTarget): Target stream parameters
+        output_path (str): Where to write the conformed segment
+        silent_audio (str, optional): Silent track from make_silent_audio, used when the
+            target has audio and the segment does not. Defaults to None.
+        threads (int, optional): Encoder threads when the video is re-encoded. Defaults to
+            None, which lets the encoder use every core.
+
+    Returns:
+        str: output_path
+    """
+    source = ffmpeg.input(segment.path)
+    streams = [source['v']]
+    if target.video_matches(segment):
+        options = {'c:v': 'copy'}
+    else:
+        streams = [source['v'].filter('scale', target.width, target.height).filter('setsar', 1)]
+        options = target.video_args()
+        if threads:
+            options['threads'] = threads
+
+    if target.has_audio:
+        if segment.has_audio:
+            streams.append(source['a'])
+            options.update({'c:a': 'copy'} if target.audio_matches(segment) else target.audio_args())
+        else:
+            # The shared silent track already has the target parameters
+            streams.append(ffmpeg.input(silent_audio)['a'])
+            options['c:a'] = 'copy'
+        options['t'] = segment.duration
+
+    (
+        ffmpeg.output(*streams, output_path, movflags='+faststart', **options)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return output_path
+
+
+def conform_segments(jobs: List[Tuple[SegmentInfo, str]], target: ConcatTarget, silent_audio: Optional[str] = None,
+                     max_workers: Optional[int] = None, threads: Optional[int] = None) -> None:
+    """Conform several segments in parallel.
+
+    Every job runs its own ffmpeg process, so the pool only waits on them. Unless given,
+    the cores are split between the jobs so that parallel encoders do not oversubscribe
+    the machine.
+    Each segment is written under a temporary name and renamed when done, so an
+    interrupted encode is never mistaken for a finished one.
+
+    Args:
+        jobs (List[Tuple[SegmentInfo, str]]): Segments and the paths to write them to
+        target (ConcatTarget): Target stream parameters
+        silent_audio (str, optional): Silent track for segments without audio. Defaults to None.
+        max_workers (int, optional): Maximum parallel ffmpeg processes. Defaults to the CPU count.
+        threads (int, optional): Encoder threads per process. Defaults to the CPU count
+            divided by the number of processes.
+    """
+    if not jobs:
+        return
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(len(jobs), max_workers or cpu_count))
+    threads = threads or max(1, cpu_count // workers)
+
+    def run(job):
+        segment, output_path = job
+        conform_segment(segment, target, output_path + ".part.mp4", silent_audio, threads=threads)
+        os.replace(output_path + ".part.mp4", output_path)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() re-raises the first failure
+        list(pool.map(run, jobs))
+
+
+def concat_copy(segment_paths: List[str], output_path: str, list_path: str) -> str:
+    """Join segments with identical stream parameters using the concat demuxer, without re-encoding.
+
+    Args:
+        segment_paths (List[str]): Segments in playback order
+        output_path (str): Where to write the joined video
+        list_path (str): Where to write the concat demuxer's file list
+
+    Returns:
+        str: output_path
+    """
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    (
+        ffmpeg.input(list_path, f='concat', safe=0)
+        .output(output_path, c='copy', movflags='+faststart')
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return output_path
@@ -3,11 +3,13 @@ import re
 import json
 import glob
 from typing import List, Optional
+import time
 import uuid
 import asyncio
+import hashlib
 
-from mllm_tools.utils import _prepare_text_inputs
-from src.utils.utils import extract_xml
+from mllm_tools.utils import _prepare_cached_text_inputs
+from src.utils.utils import extract_xml, atomic_write
 from task_generator import (
     get_prompt_scene_plan,
     get_prompt_scene_vision_storyboard,
@@ -20,6 +22,8 @@ from task_generator import (
     get_prompt_context_learning_code
 )
 from src.rag.rag_integration import RAGIntegration
+from src.core.run_manifest import STAGE_OUTLINE, STAGE_PLAN, STATUS_RUNNING, STATUS_SUCCEEDED
+from src.utils.tracing import traced, span
 
 class VideoPlanner:
     """A class for planning and generating video content.
@@ -40,9 +44,10 @@ class VideoPlanner:
         manim_docs_path (str): Path to Manim docs. Defaults to "data/rag/manim_docs"
         embedding_model (str): Name of embedding model. Defaults to "text-embedding-ada-002"
         use_langfuse (bool): Whether to use Langfuse logging. Defaults to True
+        run_manifest (RunManifest): Optional run manifest to record outline and plan state. Defaults to None
     """
 
-    def __init__(self, planner_model, helper_model=None, output_dir="output", print_response=False, use_context_learning=False, context_learning_path="data/context_learning", use_rag=False, session_id=None, chroma_db_path="data/rag/chroma_db", manim_docs_path="data/rag/manim_docs", embedding_model="text-embedding-ada-002", use_langfuse=True):
+    def __init__(self, planner_model, helper_model=None, output_dir="output", print_response=False, use_context_learning=False, context_learning_path="data/context_learning", use_rag=False, session_id=None, chroma_db_path="data/rag/chroma_db", manim_docs_path="data/rag/manim_docs", embedding_model="text-embedding-ada-002", use_langfuse=True, run_manifest=None):
         self.planner_model = planner_model
         self.helper_model = helper_model if helper_model is not None else planner_model
         self.output_dir = output_dir
@@ -67,7 +72,7 @@ class VideoPlanner:
                 use_langfuse=use_langfuse,
                 session_id=session_id
             )
-        self.relevant_plugins = []  # Initialize as an empty list
+        self.run_manifest = run_manifest
 
     def _load_context_examples(self, example_type: str) -> str:
         """Load context learning examples of a specific type from files.
@@ -132,7 +137,42 @@ class VideoPlanner:
             return template(examples="\n".join(examples))
         return None
 
-    def generate_scene_outline(self,
+    async def detect_relevant_plugins(self, topic: str, description: str) -> List[str]:
+        """Detect the plugins relevant to a topic, reusing the persisted result on reruns.
+
+        The plugin list is part of every subplan prompt, so re-detecting it on resume
+        could change the prompts and invalidate the subplan checkpoints. The list is
+        returned rather than stored on the planner, since topics share one planner.
+
+        Args:
+            topic (str): The topic of the video
+            description (str): Description of the video content
+
+        Returns:
+            List[str]: Names of the relevant plugins
+        """
+        file_prefix = re.sub(r'[^a-z0-9_]+', '_', topic.lower())
+        plugins_path = os.path.join(self.output_dir, file_prefix, "relevant_plugins.json")
+        if os.path.exists(plugins_path):
+            try:
+                with open(plugins_path, "r") as f:
+                    relevant_plugins = json.load(f)
+                print(f"Loaded relevant plugins: {relevant_plugins}")
+                return relevant_plugins
+            except (OSError, ValueError) as e:
+                print(f"Could not read {plugins_path}, detecting plugins again: {e}")
+
+        relevant_plugins = await self.rag_integration.detect_relevant_plugins(topic, description)
+        if relevant_plugins is None:
+            # A failed detection is not persisted, so the next run tries again
+            print("Plugin detection failed, continuing without plugins for this run")
+            return []
+        atomic_write(plugins_path, json.dumps(relevant_plugins))
+        print(f"Detected relevant plugins: {relevant_plugins}")
+        return relevant_plugins
+
+    @traced("outline")
+    async def generate_scene_outline(self,
                             topic: str,
                             description: str,
                             session_id: str) -> str:
@@ -148,18 +188,18 @@ class VideoPlanner:
         """
         # Detect relevant plugins upfront if RAG is enabled
         if self.use_rag:
-            self.relevant_plugins = self.rag_integration.detect_relevant_plugins(topic, description) or []
-            self.rag_integration.set_relevant_plugins(self.relevant_plugins)
-            print(f"Detected relevant plugins: {self.relevant_plugins}")
+            await self.detect_relevant_plugins(topic, description)
 
         prompt = get_prompt_scene_plan(topic, description)
-        
+
+        # Examples are the same for every topic, so they lead the prompt as a cacheable prefix
+        examples = []
         if self.use_context_learning and self.scene_plan_examples:
-            prompt += f"\n\nHere are some example scene plans for reference:\n{self.scene_plan_examples}"
+            examples.append(f"Here are some example scene plans for reference:\n{self.scene_plan_examples}")
 
         # Generate plan using planner model
-        response_text = self.planner_model(
-            _prepare_text_inputs(prompt),
+        response_text = await self.planner_model.acall(
+            _prepare_cached_text_inputs(examples, prompt),
             metadata={"generation_name": "scene_outline", "tags": [topic, "scene-outline"], "session_id": session_id}
         )
         # extract scene outline <SCENE_OUTLINE> ... </SCENE_OUTLINE>
@@ -171,13 +211,92 @@ class VideoPlanner:
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
         # save plan to file
         os.makedirs(os.path.join(self.output_dir, file_prefix), exist_ok=True) # Ensure directory exists
-        with open(os.path.join(self.output_dir, file_prefix, f"{file_prefix}_scene_outline.txt"), "w") as f:
+        scene_outline_path = os.path.join(self.output_dir, file_prefix, f"{file_prefix}_scene_outline.txt")
+        with open(scene_outline_path, "w") as f:
             f.write(scene_outline)
         print(f"Plan saved to {file_prefix}_scene_outline.txt")
 
+        if self.run_manifest is not None:
+            self.run_manifest.set_scene_count(file_prefix, len(re.findall(r'<SCENE_(\d+)>[^<]', scene_outline)))
+            self.run_manifest.record(file_prefix, STAGE_OUTLINE, STATUS_SUCCEEDED, artifact_path=scene_outline_path)
+
         return scene_outline
 
-    async def _generate_scene_implementation_single(self, topic: str, description: str, scene_outline_i: str, i: int, file_prefix: str, session_id: str, scene_trace_id: str) -> str:
+    def _subplan_input_hash(self, prompt: str) -> str:
+        """Hash the inputs of a scene implementation sub-stage.
+
+        Args:
+            prompt (str): Sub-stage prompt before retrieved documentation is appended; it
+                already contains the topic, scene outline, upstream subplans and plugins
+
+        Returns:
+            str: Hex digest identifying the sub-stage inputs
+        """
+        payload = json.dumps({
+            "model": getattr(self.planner_model, "model_name", None),
+            "use_rag": self.use_rag,
+            "prompt": prompt
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_subplan_checkpoint(self, subplan_dir: str, name: str, input_hash: str) -> Optional[str]:
+        """Load a persisted subplan if it was produced from the same inputs.
+
+        Args:
+            subplan_dir (str): Scene subplans directory
+            name (str): Sub-stage name, e.g. "vision_storyboard"
+            input_hash (str): Hash of the current sub-stage inputs
+
+        Returns:
+            Optional[str]: The persisted subplan, or None if it is missing, stale or corrupt
+        """
+        checkpoint_path = os.path.join(subplan_dir, "checkpoint.json")
+        if not os.path.exists(checkpoint_path):
+            return None
+        try:
+            with open(checkpoint_path, "r") as f:
+                entry = json.load(f).get(name)
+            if not entry or entry["input_hash"] != input_hash:
+                return None
+            with open(entry["artifact_path"], "r") as f:
+                subplan = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        # Guard against artifacts truncated by a crash mid-write
+        if hashlib.sha256(subplan.encode("utf-8")).hexdigest() != entry.get("output_hash"):
+            return None
+        return subplan
+
+    def _save_subplan_checkpoint(self, subplan_dir: str, name: str, input_hash: str, artifact_path: str, subplan: str) -> None:
+        """Record that a subplan artifact was produced from the given inputs.
+
+        Args:
+            subplan_dir (str): Scene subplans directory
+            name (str): Sub-stage name, e.g. "vision_storyboard"
+            input_hash (str): Hash of the sub-stage inputs
+            artifact_path (str): Path of the saved subplan
+            subplan (str): Content of the saved subplan
+        """
+        checkpoint_path = os.path.join(subplan_dir, "checkpoint.json")
+        checkpoint = {}
+        if os.path.exists(checkpoint_path):
+            try:
+                with open(checkpoint_path, "r") as f:
+                    checkpoint = json.load(f)
+            except (OSError, ValueError):
+                checkpoint = {}
+        checkpoint[name] = {
+            "input_hash": input_hash,
+            "artifact_path": artifact_path,
+            "output_hash": hashlib.sha256(subplan.encode("utf-8")).hexdigest()
+        }
+        # Write then rename so a crash never leaves a half-written checkpoint
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, checkpoint_path)
+
+    async def _generate_scene_implementation_single(self, topic: str, description: str, scene_outline_i: str, i: int, file_prefix: str, session_id: str, scene_trace_id: str, relevant_plugins: List[str] = None) -> str:
         """Generate implementation plan for a single scene.
 
         Args:
@@ -188,12 +307,18 @@ class VideoPlanner:
             file_prefix (str): Prefix for output files
             session_id (str): Session identifier
             scene_trace_id (str): Unique trace ID for this scene
+            relevant_plugins (List[str], optional): Plugins relevant to the topic, from
+                detect_relevant_plugins. Defaults to None, meaning no plugins.
 
         Returns:
             str: Generated implementation plan for the scene
         """
+        relevant_plugins = relevant_plugins or []
         # Initialize empty implementation plan
         implementation_plan = ""
+        started_at = time.time()
+        if self.run_manifest is not None:
+            self.run_manifest.record(file_prefix, STAGE_PLAN, STATUS_RUNNING, scene=i, started_at=started_at)
         scene_dir = os.path.join(self.output_dir, file_prefix, f"scene{i}")
         subplan_dir = os.path.join(scene_dir, "subplans")
         os.makedirs(scene_dir, exist_ok=True)
@@ -207,141 +332,166 @@ class VideoPlanner:
 
         # ===== Step 1: Generate Scene Vision and Storyboard =====
         # ===================================================
-        prompt_vision_storyboard = get_prompt_scene_vision_storyboard(i, topic, description, scene_outline_i, self.relevant_plugins)
+        prompt_vision_storyboard = get_prompt_scene_vision_storyboard(i, topic, description, scene_outline_i, relevant_plugins)
 
-        # Add vision storyboard examples only for this stage if available
+        # Add vision storyboard examples only for this stage if available, ahead of the prompt as a cacheable prefix
+        vision_examples = []
         if self.use_context_learning and self.vision_storyboard_examples:
-            prompt_vision_storyboard += f"\n\nHere are some example storyboards:\n{self.vision_storyboard_examples}"
-        
-        if self.rag_integration:
-            # Use the already detected plugins instead of detecting again
-            # relevant_plugins = self.relevant_plugins # Removed redundant variable
-            # print(f"Using detected plugins: {relevant_plugins}") # Removed redundant print
-
-            # Generate RAG queries
-            rag_queries = self.rag_integration._generate_rag_queries_storyboard(
-                scene_plan=scene_outline_i,
-                scene_trace_id=scene_trace_id,
-                topic=topic,
-                scene_number=i,
-                session_id=session_id,
-                relevant_plugins=self.relevant_plugins # Use self.relevant_plugins directly
-            )
-
-            retrieved_docs = self.rag_integration.get_relevant_docs(
-                rag_queries=rag_queries,
-                scene_trace_id=scene_trace_id,
-                topic=topic,
-                scene_number=i
-            )
-            
-            # Add documentation to prompt
-            prompt_vision_storyboard += f"\n\n{retrieved_docs}"
-
-        vision_storyboard_plan = self.planner_model(
-            _prepare_text_inputs(prompt_vision_storyboard),
-            metadata={"generation_name": "scene_vision_storyboard", "trace_id": scene_trace_id, "tags": [topic, f"scene{i}"], "session_id": session_id}
-        )
-        # extract vision storyboard plan <SCENE_VISION_STORYBOARD_PLAN> ... </SCENE_VISION_STORYBOARD_PLAN>
-        vision_match = re.search(r'(<SCENE_VISION_STORYBOARD_PLAN>.*?</SCENE_VISION_STORYBOARD_PLAN>)', vision_storyboard_plan, re.DOTALL)
-        vision_storyboard_plan = vision_match.group(1) if vision_match else vision_storyboard_plan
+            vision_examples.append(f"Here are some example storyboards:\n{self.vision_storyboard_examples}")
+
+        # The prompt carries every upstream input of this sub-stage, so it defines the checkpoint
+        vision_input_hash = self._subplan_input_hash(prompt_vision_storyboard + "".join(f"\n\n{example}" for example in vision_examples))
+        vision_storyboard_plan = self._load_subplan_checkpoint(subplan_dir, "vision_storyboard", vision_input_hash)
+        if vision_storyboard_plan is not None:
+            print(f"Scene {i} Vision and Storyboard Plan resumed from checkpoint")
+        else:
+            if self.rag_integration:
+                # Generate RAG queries
+                rag_queries = await self.rag_integration._generate_rag_queries_storyboard(
+                    scene_plan=scene_outline_i,
+                    scene_trace_id=scene_trace_id,
+                    topic=topic,
+                    scene_number=i,
+                    session_id=session_id,
+                    relevant_plugins=relevant_plugins
+                )
+
+                retrieved_docs = await self.rag_integration.get_relevant_docs(
+                    rag_queries=rag_queries,
+                    scene_trace_id=scene_trace_id,
+                    topic=topic,
+                    scene_number=i
+                )
+
+                # Add documentation to prompt
+                prompt_vision_storyboard += f"\n\n{retrieved_docs}"
+
+            with span("storyboard", topic=topic, scene=i):
+                vision_storyboard_plan = await self.planner_model.acall(
+                    _prepare_cached_text_inputs(vision_examples, prompt_vision_storyboard),
+                    metadata={"generation_name": "scene_vision_storyboard", "trace_id": scene_trace_id, "tags": [topic, f"scene{i}"], "session_id": session_id}
+                )
+            # extract vision storyboard plan <SCENE_VISION_STORYBOARD_PLAN> ... </SCENE_VISION_STORYBOARD_PLAN>
+            vision_match = re.search(r'(<SCENE_VISION_STORYBOARD_PLAN>.*?</SCENE_VISION_STORYBOARD_PLAN>)', vision_storyboard_plan, re.DOTALL)
+            vision_storyboard_plan = vision_match.group(1) if vision_match else vision_storyboard_plan
+            file_path_vs = os.path.join(subplan_dir, f"{file_prefix}_scene{i}_vision_storyboard_plan.txt")
+            with open(file_path_vs, "w") as f:
+                f.write(vision_storyboard_plan)
+            print(f"Scene {i} Vision and Storyboard Plan saved to {file_path_vs}")
+            if vision_match:
+                # Unparsable responses (e.g. model errors) are not checkpointed so they get retried
+                self._save_subplan_checkpoint(subplan_dir, "vision_storyboard", vision_input_hash, file_path_vs, vision_storyboard_plan)
         implementation_plan += vision_storyboard_plan + "\n\n"
-        file_path_vs = os.path.join(subplan_dir, f"{file_prefix}_scene{i}_vision_storyboard_plan.txt")
-        with open(file_path_vs, "w") as f:
-            f.write(vision_storyboard_plan)
-        print(f"Scene {i} Vision and Storyboard Plan saved to {file_path_vs}")
 
         # ===== Step 2: Generate Technical Implementation Plan =====
         # =========================================================
-        prompt_technical_implementation = get_prompt_scene_technical_implementation(i, topic, description, scene_outline_i, vision_storyboard_plan, self.relevant_plugins)
+        prompt_technical_implementation = get_prompt_scene_technical_implementation(i, topic, description, scene_outline_i, vision_storyboard_plan, relevant_plugins)
 
         # Add technical implementation examples only for this stage if available
+        technical_examples = []
         if self.use_context_learning and self.technical_implementation_examples:
-            prompt_technical_implementation += f"\n\nHere are some example technical implementations:\n{self.technical_implementation_examples}"
-
-        if self.rag_integration:
-            # Use the already detected plugins instead of detecting again
-            # relevant_plugins = self.relevant_plugins # Removed redundant variable
-            # print(f"Using detected plugins: {relevant_plugins}") # Removed redundant print
-
-            # Generate RAG queries
-            rag_queries = self.rag_integration._generate_rag_queries_technical(
-                storyboard=vision_storyboard_plan,
-                scene_trace_id=scene_trace_id,
-                topic=topic,
-                scene_number=i,
-                session_id=session_id,
-                relevant_plugins=self.relevant_plugins # Use self.relevant_plugins directly
-            )
-
-            retrieved_docs = self.rag_integration.get_relevant_docs(
-                rag_queries=rag_queries,
-                scene_trace_id=scene_trace_id,
-                topic=topic,
-                scene_number=i
-            )
-
-            # Add documentation to prompt
-            prompt_technical_implementation += f"\n\n{retrieved_docs}"
-
-        technical_implementation_plan = self.planner_model(
-            _prepare_text_inputs(prompt_technical_implementation),
-            metadata={"generation_name": "scene_technical_implementation", "trace_id": scene_trace_id, "tags": [topic, f"scene{i}"], "session_id": session_id}
-        )
-        # extract technical implementation plan <SCENE_TECHNICAL_IMPLEMENTATION_PLAN> ... </SCENE_TECHNICAL_IMPLEMENTATION_PLAN>
-        technical_match = re.search(r'(<SCENE_TECHNICAL_IMPLEMENTATION_PLAN>.*?</SCENE_TECHNICAL_IMPLEMENTATION_PLAN>)', technical_implementation_plan, re.DOTALL)
-        technical_implementation_plan = technical_match.group(1) if technical_match else technical_implementation_plan
+            technical_examples.append(f"Here are some example technical implementations:\n{self.technical_implementation_examples}")
+
+        technical_input_hash = self._subplan_input_hash(prompt_technical_implementation + "".join(f"\n\n{example}" for example in technical_examples))
+        technical_implementation_plan = self._load_subplan_checkpoint(subplan_dir, "technical_implementation", technical_input_hash)
+        if technical_implementation_plan is not None:
+            print(f"Scene {i} Technical Implementation Plan resumed from checkpoint")
+        else:
+            if self.rag_integration:
+                # Generate RAG queries
+                rag_queries = await self.rag_integration._generate_rag_queries_technical(
+                    storyboard=vision_storyboard_plan,
+                    scene_trace_id=scene_trace_id,
+                    topic=topic,
+                    scene_number=i,
+                    session_id=session_id,
+                    relevant_plugins=relevant_plugins
+                )
+
+                retrieved_docs = await self.rag_integration.get_relevant_docs(
+                    rag_queries=rag_queries,
+                    scene_trace_id=scene_trace_id,
+                    topic=topic,
+                    scene_number=i
+                )
+
+                # Add documentation to prompt
+                prompt_technical_implementation += f"\n\n{retrieved_docs}"
+
+            with span("technical_plan", topic=topic, scene=i):
+                technical_implementation_plan = await self.planner_model.acall(
+                    _prepare_cached_text_inputs(technical_examples, prompt_technical_implementation),
+                    metadata={"generation_name": "scene_technical_implementation", "trace_id": scene_trace_id, "tags": [topic, f"scene{i}"], "session_id": session_id}
+                )
+            # extract technical implementation plan <SCENE_TECHNICAL_IMPLEMENTATION_PLAN> ... </SCENE_TECHNICAL_IMPLEMENTATION_PLAN>
+            technical_match = re.search(r'(<SCENE_TECHNICAL_IMPLEMENTATION_PLAN>.*?</SCENE_TECHNICAL_IMPLEMENTATION_PLAN>)', technical_implementation_plan, re.DOTALL)
+            technical_implementation_plan = technical_match.group(1) if technical_match else technical_implementation_plan
+            file_path_ti = os.path.join(subplan_dir, f"{file_prefix}_scene{i}_technical_implementation_plan.txt")
+            with open(file_path_ti, "w") as f:
+                f.write(technical_implementation_plan)
+            print(f"Scene {i} Technical Implementation Plan saved to {file_path_ti}")
+            if technical_match:
+                self._save_subplan_checkpoint(subplan_dir, "technical_implementation", technical_input_hash, file_path_ti, technical_implementation_plan)
         implementation_plan += technical_implementation_plan + "\n\n"
-        file_path_ti = os.path.join(subplan_dir, f"{file_prefix}_scene{i}_technical_implementation_plan.txt")
-        with open(file_path_ti, "w") as f:
-            f.write(technical_implementation_plan)
-        print(f"Scene {i} Technical Implementation Plan saved to {file_path_ti}")
-       
+
         # ===== Step 3: Generate Animation and Narration Plan =====
         # =========================================================
-        prompt_animation_narration = get_prompt_scene_animation_narration(i, topic, description, scene_outline_i, vision_storyboard_plan, technical_implementation_plan, self.relevant_plugins)
-        
+        prompt_animation_narration = get_prompt_scene_animation_narration(i, topic, description, scene_outline_i, vision_storyboard_plan, technical_implementation_plan, relevant_plugins)
+
         # Add animation narration examples only for this stage if available
+        narration_examples = []
         if self.use_context_learning and self.animation_narration_examples:
-            prompt_animation_narration += f"\n\nHere are some example animation and narration plans:\n{self.animation_narration_examples}"
-        
-        if self.rag_integration:
-            rag_queries = self.rag_integration._generate_rag_queries_narration(
-                storyboard=vision_storyboard_plan,
-                scene_trace_id=scene_trace_id,
-                topic=topic,
-                scene_number=i,
-                session_id=session_id,
-                relevant_plugins=self.relevant_plugins # Use self.relevant_plugins directly
-            )
-            retrieved_docs = self.rag_integration.get_relevant_docs(
-                rag_queries=rag_queries,
-                scene_trace_id=scene_trace_id,
-                topic=topic,
-                scene_number=i
-            )
-            prompt_animation_narration += f"\n\n{retrieved_docs}"
-
-        animation_narration_plan = self.planner_model(
-            _prepare_text_inputs(prompt_animation_narration),
-            metadata={"generation_name": "scene_animation_narration", "trace_id": scene_trace_id, "tags": [topic, f"scene{i}"], "session_id": session_id}
-        )
-        # extract animation narration plan <SCENE_ANIMATION_NARRATION_PLAN> ... </SCENE_ANIMATION_NARRATION_PLAN>
-        animation_match = re.search(r'(<SCENE_ANIMATION_NARRATION_PLAN>.*?</SCENE_ANIMATION_NARRATION_PLAN>)', animation_narration_plan, re.DOTALL)
-        animation_narration_plan = animation_match.group(1) if animation_match else animation_narration_plan
+            narration_examples.append(f"Here are some example animation and narration plans:\n{self.animation_narration_examples}")
+
+        animation_input_hash = self._subplan_input_hash(prompt_animation_narration + "".join(f"\n\n{example}" for example in narration_examples))
+        animation_narration_plan = self._load_subplan_checkpoint(subplan_dir, "animation_narration", animation_input_hash)
+        if animation_narration_plan is not None:
+            print(f"Scene {i} Animation and Narration Plan resumed from checkpoint")
+        else:
+            if self.rag_integration:
+                rag_queries = await self.rag_integration._generate_rag_queries_narration(
+                    storyboard=vision_storyboard_plan,
+                    scene_trace_id=scene_trace_id,
+                    topic=topic,
+                    scene_number=i,
+                    session_id=session_id,
+                    relevant_plugins=relevant_plugins
+                )
+                retrieved_docs = await self.rag_integration.get_relevant_docs(
+                    rag_queries=rag_queries,
+                    scene_trace_id=scene_trace_id,
+                    topic=topic,
+                    scene_number=i
+                )
+                prompt_animation_narration += f"\n\n{retrieved_docs}"
+
+            with span("narration_plan", topic=topic, scene=i):
+                animation_narration_plan = await self.planner_model.acall(
+                    _prepare_cached_text_inputs(narration_examples, prompt_animation_narration),
+                    metadata={"generation_name": "scene_animation_narration", "trace_id": scene_trace_id, "tags": [topic, f"scene{i}"], "session_id": session_id}
+                )
+            # extract animation narration plan <SCENE_ANIMATION_NARRATION_PLAN> ... </SCENE_ANIMATION_NARRATION_PLAN>
+            animation_match = re.search(r'(<SCENE_ANIMATION_NARRATION_PLAN>.*?</SCENE_ANIMATION_NARRATION_PLAN>)', animation_narration_plan, re.DOTALL)
+            animation_narration_plan = animation_match.group(1) if animation_match else animation_narration_plan
+            file_path_an = os.path.join(subplan_dir, f"{file_prefix}_scene{i}_animation_narration_plan.txt")
+            with open(file_path_an, "w") as f:
+                f.write(animation_narration_plan)
+            print(f"Scene {i} Animation and Narration Plan saved to {file_path_an}")
+            if animation_match:
+                self._save_subplan_checkpoint(subplan_dir, "animation_narration", animation_input_hash, file_path_an, animation_narration_plan)
         implementation_plan += animation_narration_plan + "\n\n"
-        file_path_an = os.path.join(subplan_dir, f"{file_prefix}_scene{i}_animation_narration_plan.txt")
-        with open(file_path_an, "w") as f:
-            f.write(animation_narration_plan)
-        print(f"Scene {i} Animation and Narration Plan saved to {file_path_an}")
 
         # ===== Step 4: Save Implementation Plan =====
         # ==========================================
         # save the overall implementation plan to file
-        with open(os.path.join(self.output_dir, file_prefix, f"scene{i}", f"{file_prefix}_scene{i}_implementation_plan.txt"), "w") as f:
+        implementation_plan_path = os.path.join(self.output_dir, file_prefix, f"scene{i}", f"{file_prefix}_scene{i}_implementation_plan.txt")
+        with open(implementation_plan_path, "w") as f:
             f.write(f"# Scene {i} Implementation Plan\n\n")
             f.write(implementation_plan)
-        print(f"Scene {i} Implementation Plan saved to {file_path_ti}")
+        print(f"Scene {i} Implementation Plan saved to {implementation_plan_path}")
+
+        if self.run_manifest is not None:
+            self.run_manifest.record(file_prefix, STAGE_PLAN, STATUS_SUCCEEDED, scene=i, artifact_path=implementation_plan_path, started_at=started_at)
 
         return implementation_plan
 
@@ -368,6 +518,7 @@ class VideoPlanner:
         # replace all spaces and special characters with underscores for file path compatibility
         file_prefix = topic.lower()
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
+        relevant_plugins = await self.detect_relevant_plugins(topic, description) if self.use_rag else []
         # generate implementation plan for each scene
         all_scene_implementation_plans = []
 
@@ -376,7 +527,7 @@ class VideoPlanner:
             print(f"Generating implementation plan for scene {i} in topic {topic}")
             scene_outline_i = re.search(r'(<SCENE_{i}>.*?</SCENE_{i}>)'.format(i=i), scene_outline, re.DOTALL).group(1)
             scene_trace_id = str(uuid.uuid4())
-            task = asyncio.create_task(self._generate_scene_implementation_single(topic, description, scene_outline_i, i, file_prefix, session_id, scene_trace_id))
+            task = asyncio.create_task(self._generate_scene_implementation_single(topic, description, scene_outline_i, i, file_prefix, session_id, scene_trace_id, relevant_plugins))
             tasks.append(task)
 
         all_scene_implementation_plans = await asyncio.gather(*tasks)
@@ -403,6 +554,7 @@ class VideoPlanner:
         scene_outline = extract_xml(plan)
         scene_number = len(re.findall(r'<SCENE_(\d+)>[^<]', scene_outline))
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', topic.lower())
+        relevant_plugins = await self.detect_relevant_plugins(topic, description) if self.use_rag else []
         all_scene_implementation_plans = []
 
         async def generate_single_scene_implementation(i):
@@ -410,7 +562,7 @@ class VideoPlanner:
                 print(f"Generating implementation plan for scene {i} in topic {topic}")
                 scene_outline_i = re.search(r'(<SCENE_{i}>.*?</SCENE_{i}>)'.format(i=i), scene_outline, re.DOTALL).group(1)
                 scene_trace_id = str(uuid.uuid4())  # Generate UUID here
-                return await self._generate_scene_implementation_single(topic, description, scene_outline_i, i, file_prefix, session_id, scene_trace_id)
+                return await self._generate_scene_implementation_single(topic, description, scene_outline_i, i, file_prefix, session_id, scene_trace_id, relevant_plugins)
 
         tasks = [generate_single_scene_implementation(i + 1) for i in range(scene_number)]
         all_scene_implementation_plans = await asyncio.gather(*tasks)
@@ -1,33 +1,65 @@
 import os
 import re
+import time
+import shutil
 import subprocess
 import asyncio
 from PIL import Image
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 import traceback
 import sys
 
 from src.core.parse_video import (
-    get_images_from_video,
-    image_with_most_non_black_space
+    extract_snapshot_frame
 )
 from mllm_tools.vertex_ai import VertexAIWrapper
 from mllm_tools.gemini import GeminiWrapper
+from src.core.render_scheduler import RenderScheduler
+from src.core.render_quality import RenderQuality, find_video_folder
+from src.utils.tracing import traced, span
+from src.utils.media_index import get_media_index
+from src.core.run_manifest import (
+    STAGE_CODE,
+    STAGE_RENDER,
+    STAGE_COMBINE,
+    STATUS_RUNNING,
+    STATUS_SUCCEEDED,
+    STATUS_FAILED
+)
+
+# Manim's default of 100 evicts partial movies that later fix versions of a scene could reuse
+MAX_CACHED_PARTIAL_MOVIES = 1000
 
 class VideoRenderer:
     """Class for rendering and combining Manim animation videos."""
 
-    def __init__(self, output_dir="output", print_response=False, use_visual_fix_code=False):
+    def __init__(self, output_dir="output", print_response=False, use_visual_fix_code=False, render_scheduler=None, run_manifest=None, preflight=None, draft_quality=None, final_quality=None, stream_packager=None):
         """Initialize the VideoRenderer.
 
         Args:
             output_dir (str, optional): Directory for output files. Defaults to "output".
             print_response (bool, optional): Whether to print responses. Defaults to False.
             use_visual_fix_code (bool, optional): Whether to use visual fix code. Defaults to False.
+            render_scheduler (RenderScheduler, optional): Worker pool that runs manim renders. Defaults to a pool sized to this machine.
+            run_manifest (RunManifest, optional): Run manifest to record render and combine state in. Defaults to None.
+            preflight (PreflightChecker, optional): Fast checks run before every render; code that fails
+                them is sent back for fixing without a render. Defaults to None.
+            draft_quality (str, optional): Quality of fix-loop, candidate and visual reflection renders,
+                see RenderQuality. Defaults to "low".
+            final_quality (str, optional): Delivery quality the accepted version of each scene is
+                rendered at once, e.g. "high" or "1080p30". Defaults to "high".
+            stream_packager (StreamPackager, optional): Packages each accepted scene render for
+                HLS/DASH streaming as soon as it is rendered. Defaults to None.
         """
         self.output_dir = output_dir
         self.print_response = print_response
         self.use_visual_fix_code = use_visual_fix_code
+        self.render_scheduler = render_scheduler if render_scheduler is not None else RenderScheduler()
+        self.run_manifest = run_manifest
+        self.preflight = preflight
+        self.draft_quality = RenderQuality(draft_quality or "low")
+        self.final_quality = RenderQuality(final_quality or "high")
+        self.stream_packager = stream_packager
 
     async def render_scene(self, code: str, file_prefix: str, curr_scene: int, curr_version: int, code_dir: str, media_dir: str, max_retries: int = 3, use_visual_fix_code=False, visual_self_reflection_func=None, banned_reasonings=None, scene_trace_id=None, topic=None, session_id=None):
         """Render a single scene and handle error retries and visual fixes.
@@ -53,38 +85,41 @@ class VideoRenderer:
         retries = 0
         while retries < max_retries:
             try:
-                # Execute manim in a thread to prevent blocking
+                # Queue manim on the render worker pool so LLM slots stay free while it runs
                 file_path = os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}.py")
-                result = await asyncio.to_thread(
-                    subprocess.run,
-                    ["manim", "-qh", file_path, "--media_dir", media_dir, "--progress_bar", "none"],
-                    capture_output=True,
-                    text=True
-                )
+                started_at = time.time()
+                if self.run_manifest is not None:
+                    self.run_manifest.record(file_prefix, STAGE_RENDER, STATUS_RUNNING, scene=curr_scene, version=curr_version, started_at=started_at)
+                if self.preflight is not None:
+                    preflight_error = await self.preflight.check(file_path, media_dir, topic=topic or file_prefix, scene=curr_scene, version=curr_version)
+                    if preflight_error is not None:
+                        raise Exception(preflight_error)
+                with span("render", topic=topic or file_prefix, scene=curr_scene, version=curr_version, attempt=retries + 1,
+                          quality=self.draft_quality.folder_name):
+                    result = await self.render_scheduler.run(
+                        self._manim_command(file_path, media_dir, self.draft_quality, f"{file_prefix}_scene{curr_scene}")
+                    )
 
-                # if result.returncode != 0, it means that the code is not rendered successfully
-                # so we need to fix the code by returning the code and the error message
-                if result.returncode != 0:
-                    raise Exception(result.stderr)
+                    # if result.returncode != 0, it means that the code is not rendered successfully
+                    # so we need to fix the code by returning the code and the error message
+                    if result.returncode != 0:
+                        raise Exception(result.stderr)
 
                 if use_visual_fix_code and visual_self_reflection_func and banned_reasonings:
-                    # Get the rendered video path
-                    video_path = os.path.join(
-                        media_dir,
-                        "videos",
-                        f"{file_prefix}_scene{curr_scene}_v{curr_version}.mp4"
-                    )
-                    
-                    # For Gemini/Vertex AI models, pass the video directly
+                    # For Gemini/Vertex AI models, pass the draft video directly
                     if self.scene_model.model_name.startswith(('gemini/', 'vertex_ai/')):
-                        media_input = video_path
+                        video_folder = find_video_folder(
+                            os.path.join(media_dir, "videos", f"{file_prefix}_scene{curr_scene}_v{curr_version}"),
+                            self.draft_quality
+                        )
+                        media_input = os.path.join(video_folder, next(f for f in os.listdir(video_folder) if f.endswith('.mp4')))
                     else:
                         # For other models, use image snapshot
                         media_input = self.create_snapshot_scene(
                             topic, curr_scene, curr_version, return_type="path"
                         )
                         
-                    new_code, log = visual_self_reflection_func(
+                    new_code, log = await visual_self_reflection_func(
                         code,
                         media_input,
                         scene_trace_id=scene_trace_id,
@@ -100,10 +135,15 @@ class VideoRenderer:
                     if "<LGTM>" in new_code or any(word in new_code for word in banned_reasonings):
                         break
 
+                    # Only render_final marks a render succeeded; a draft that passed here may
+                    # still be followed by a failing visual fix or an interrupted run
                     code = new_code
                     curr_version += 1
-                    with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}.py"), "w") as f:
+                    code_path = os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}.py")
+                    with open(code_path, "w") as f:
                         f.write(code)
+                    if self.run_manifest is not None:
+                        self.run_manifest.record(file_prefix, STAGE_CODE, STATUS_SUCCEEDED, scene=curr_scene, version=curr_version, artifact_path=code_path)
                     print(f"Code saved to scene{curr_scene}/code/{file_prefix}_scene{curr_scene}_v{curr_version}.py")
                     retries = 0
                     continue
@@ -116,14 +156,156 @@ class VideoRenderer:
 
                 with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}_error.log"), "a") as f:
                     f.write(f"\nError in attempt {retries}:\n{str(e)}\n")
+                if self.run_manifest is not None:
+                    self.run_manifest.record(file_prefix, STAGE_RENDER, STATUS_FAILED, scene=curr_scene, version=curr_version, started_at=started_at)
                 retries += 1
                 return code, str(e) # Indicate failure and return error message
-            
+
+
+        # Only the accepted version is rendered at delivery quality
+        return code, await self.render_final(file_prefix, curr_scene, curr_version, code_dir, media_dir, topic=topic, started_at=started_at)
+
+    def _manim_command(self, file_path: str, media_dir: str, quality: RenderQuality, cache_key: str) -> List[str]:
+        """Build the manim command rendering `file_path` at `quality` with the partial movie cache of `cache_key`."""
+        return ["manim", *quality.manim_args(), file_path, "--media_dir", media_dir, "--progress_bar", "none",
+                "--config_file", self._render_cache_config(media_dir, cache_key)]
+
+    def _render_cache_config(self, media_dir: str, cache_key: str) -> str:
+        """Write the manim config that points partial movie files at a cache shared across code versions.
+
+        Manim caches every animation as a partial movie file named by its hash, but keeps
+        them under the video folder of the module, and each fix version is a new module
+        ({prefix}_scene{N}_v{K}). Sharing one partial movie directory per scene lets a new
+        version reuse every animation that the fix did not change.
+
+        Args:
+            media_dir (str): Media directory of the render
+            cache_key (str): Identity of the code chain, e.g. "{prefix}_scene{N}"; renders that
+                may run concurrently need different keys
+
+        Returns:
+            str: Path to the config file
+        """
+        cache_dir = os.path.abspath(os.path.join(media_dir, "partial_movie_cache", cache_key))
+        config_path = os.path.join(cache_dir, "manim.cfg")
+        if not os.path.exists(config_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(config_path, "w") as f:
+                # {quality} and {scene_name} are filled in by manim
+                f.write("[CLI]\n"
+                        f"partial_movie_dir = {cache_dir}/{{quality}}/{{scene_name}}\n"
+                        f"max_files_cached = {MAX_CACHED_PARTIAL_MOVIES}\n")
+        return config_path
+
+    async def render_final(self, file_prefix: str, curr_scene: int, curr_version: int, code_dir: str, media_dir: str, topic: str = None, started_at: float = None) -> Optional[str]:
+        """Render the accepted version of a scene at delivery quality and mark the scene as rendered.
+
+        Fix-loop renders run at draft quality, so the version that passed them is rendered
+        once more at the final quality. When both qualities are the same, the draft render
+        is already the deliverable and is only recorded.
+
+        Args:
+            file_prefix (str): Prefix for file naming
+            curr_scene (int): Current scene number
+            curr_version (int): Accepted version
+            code_dir (str): Directory for code files
+            media_dir (str): Directory for media output
+            topic (str, optional): Topic name. Defaults to None.
+            started_at (float, optional): Start time of the render stage for the manifest. Defaults to None.
+
+        Returns:
+            Optional[str]: None on success, otherwise the render error
+        """
+        file_path = os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}.py")
+        if self.final_quality.folder_name != self.draft_quality.folder_name:
+            with span("render", topic=topic or file_prefix, scene=curr_scene, version=curr_version, final=True,
+                      quality=self.final_quality.folder_name):
+                result = await self.render_scheduler.run(
+                    self._manim_command(file_path, media_dir, self.final_quality, f"{file_prefix}_scene{curr_scene}")
+                )
+            if result.returncode != 0:
+                print(f"Error rendering {file_path} at {self.final_quality.folder_name}: {result.stderr}")
+                with open(os.path.join(code_dir, f"{file_prefix}_scene{curr_scene}_v{curr_version}_error.log"), "a") as f:
+                    f.write(f"\nError in final render:\n{result.stderr}\n")
+                if self.run_manifest is not None:
+                    self.run_manifest.record(file_prefix, STAGE_RENDER, STATUS_FAILED, scene=curr_scene, version=curr_version, started_at=started_at)
+                return result.stderr
+
         print(f"Successfully rendered {file_path}")
         with open(os.path.join(self.output_dir, file_prefix, f"scene{curr_scene}", "succ_rendered.txt"), "w") as f:
             f.write("")
+        if self.run_manifest is not None:
+            self.run_manifest.record(file_prefix, STAGE_RENDER, STATUS_SUCCEEDED, scene=curr_scene, version=curr_version,
+                                     artifact_path=os.path.join(media_dir, "videos", f"{file_prefix}_scene{curr_scene}_v{curr_version}"),
+                                     started_at=started_at)
+        if self.stream_packager is not None:
+            await asyncio.to_thread(self.package_scene, file_prefix, curr_scene,
+                                    os.path.join(media_dir, "videos", f"{file_prefix}_scene{curr_scene}_v{curr_version}"))
+        return None
+
+    async def render_candidate(self, file_prefix: str, curr_scene: int, curr_version: int, candidate: int, code_dir: str, candidate_media_dir: str, topic: str = None) -> Optional[str]:
+        """Render one speculative code candidate.
 
-        return code, None # Indicate success
+        Candidates render into their own media directory so that losing or cancelled
+        candidates never leave folders that combine_videos would pick up.
+
+        Args:
+            file_prefix (str): Prefix for file naming
+            curr_scene (int): Current scene number
+            curr_version (int): Code version within the candidate's fix chain
+            candidate (int): Candidate index
+            code_dir (str): Directory containing the candidate code files
+            candidate_media_dir (str): Media directory for candidate renders
+            topic (str, optional): Topic name. Defaults to None.
+
+        Returns:
+            Optional[str]: None on success, otherwise the render error
+        """
+        stem = f"{file_prefix}_scene{curr_scene}_v{curr_version}_c{candidate}"
+        try:
+            if self.preflight is not None:
+                preflight_error = await self.preflight.check(os.path.join(code_dir, f"{stem}.py"), candidate_media_dir,
+                                                             topic=topic or file_prefix, scene=curr_scene, version=curr_version)
+                if preflight_error is not None:
+                    raise Exception(preflight_error)
+            with span("render", topic=topic or file_prefix, scene=curr_scene, version=curr_version, candidate=candidate,
+                      quality=self.draft_quality.folder_name):
+                result = await self.render_scheduler.run(
+                    self._manim_command(os.path.join(code_dir, f"{stem}.py"), candidate_media_dir, self.draft_quality,
+                                        f"{file_prefix}_scene{curr_scene}_c{candidate}")
+                )
+                if result.returncode != 0:
+                    raise Exception(result.stderr)
+        except Exception as e:
+            with open(os.path.join(code_dir, f"{stem}_error.log"), "a") as f:
+                f.write(f"\nError:\n{str(e)}\n")
+            return str(e)
+        return None
+
+    def promote_candidate(self, file_prefix: str, curr_scene: int, curr_version: int, candidate: int, candidate_media_dir: str, media_dir: str) -> None:
+        """Make a successfully rendered candidate the scene's render for `curr_version`.
+
+        The candidate's draft video folder is moved to where a regular render of that
+        version would have written it. The scene is marked as rendered by `render_final`.
+
+        Args:
+            file_prefix (str): Prefix for file naming
+            curr_scene (int): Current scene number
+            curr_version (int): Version the winning candidate is saved as
+            candidate (int): Candidate index
+            candidate_media_dir (str): Media directory the candidate rendered into
+            media_dir (str): Media directory of the topic
+        """
+        source = os.path.join(candidate_media_dir, "videos", f"{file_prefix}_scene{curr_scene}_v{curr_version}_c{candidate}")
+        target = os.path.join(media_dir, "videos", f"{file_prefix}_scene{curr_scene}_v{curr_version}")
+        if os.path.isdir(source):
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+        else:
+            print(f"Warning: rendered video folder {source} not found")
+        print(f"Candidate {candidate} of scene {curr_scene} promoted to version {curr_version}")
 
     def run_manim_process(self,
                           topic: str):
@@ -154,7 +336,8 @@ class VideoRenderer:
                 try:
                     media_dir = os.path.join(self.output_dir, file_prefix, "media")
                     result = subprocess.run(
-                        f"manim -qh {file_path} --media_dir {media_dir}",
+                        f"manim {' '.join(self.final_quality.manim_args())} {file_path} --media_dir {media_dir} "
+                        f"--config_file {self._render_cache_config(media_dir, f'{file_prefix}_{folder}')}",
                         shell=True,
                         capture_output=True,
                         text=True
@@ -189,7 +372,9 @@ class VideoRenderer:
         file_prefix = topic.lower()
         file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
         search_path = os.path.join(self.output_dir, file_prefix)
-        video_folder_path = os.path.join(search_path, "media", "videos", f"{file_prefix}_scene{scene_number}_v{version_number}", "1080p60")
+        version_dir = os.path.join(search_path, "media", "videos", f"{file_prefix}_scene{scene_number}_v{version_number}")
+        # During the fix loop only the draft render exists
+        video_folder_path = find_video_folder(version_dir, self.final_quality) or os.path.join(version_dir, self.final_quality.folder_name)
         os.makedirs(video_folder_path, exist_ok=True)
         snapshot_path = os.path.join(video_folder_path, "snapshot.png")
         # Get the mp4 video file from the video folder path
@@ -197,41 +382,68 @@ class VideoRenderer:
         if not video_files:
             raise FileNotFoundError(f"No mp4 files found in {video_folder_path}")
         video_path = os.path.join(video_folder_path, video_files[0])
-        saved_image = image_with_most_non_black_space(get_images_from_video(video_path), snapshot_path, return_type=return_type)
+        saved_image = extract_snapshot_frame(video_path, snapshot_path, return_type=return_type)
         return saved_image
 
-    def combine_videos(self, topic: str):
-        """Combine all videos and subtitle files for a specific topic using ffmpeg.
+    def package_scene(self, file_prefix: str, scene_number: int, version_dir: str) -> None:
+        """Package the accepted render of one scene for streaming and update the topic playlists.
+
+        Packaging failures are reported but never fail the render.
 
         Args:
-            topic (str): Topic name to combine videos for
+            file_prefix (str): Topic file prefix
+            scene_number (int): Scene number
+            version_dir (str): Manim video folder of the accepted version
+        """
+        try:
+            quality_folder = find_video_folder(version_dir, self.final_quality)
+            filenames = sorted(os.listdir(quality_folder)) if quality_folder else []
+            video_path = next((os.path.join(quality_folder, f) for f in filenames if f.endswith('.mp4')), None)
+            subtitle_path = next((os.path.join(quality_folder, f) for f in filenames if f.endswith('.srt')), None)
+            if video_path is None:
+                return
+            with span("package", topic=file_prefix, scene=scene_number):
+                self.stream_packager.package_scene(file_prefix, scene_number, video_path, subtitle_path)
+                self.stream_packager.write_playlists(file_prefix)
+        except Exception as e:
+            print(f"Error packaging scene {scene_number} of {file_prefix} for streaming: {e}")
+            traceback.print_exc()
 
-        This function will:
-        - Find all scene videos and subtitles
-        - Combine videos with or without audio
-        - Merge subtitle files with correct timing
-        - Save combined video and subtitles to output directory
+    def package_topic(self, topic: str) -> None:
+        """Package every rendered scene of a topic for streaming, skipping scenes whose segments are up to date.
+
+        Args:
+            topic (str): Topic name
         """
-        file_prefix = topic.lower()
-        file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
-        search_path = os.path.join(self.output_dir, file_prefix, "media", "videos")
+        file_prefix = re.sub(r'[^a-z0-9_]+', '_', topic.lower())
+        try:
+            scene_count, scene_files = self._find_scene_files(file_prefix)
+            with span("package", topic=file_prefix):
+                for scene_number, (video_path, subtitle_path) in sorted(scene_files.items()):
+                    self.stream_packager.package_scene(file_prefix, scene_number, video_path, subtitle_path)
+                if scene_files:
+                    self.stream_packager.write_playlists(file_prefix)
+        except Exception as e:
+            print(f"Error packaging {file_prefix} for streaming: {e}")
+            traceback.print_exc()
 
-        # Create output directory if it doesn't exist
-        video_output_dir = os.path.join(self.output_dir, file_prefix)
-        os.makedirs(video_output_dir, exist_ok=True)
+    def _find_scene_files(self, file_prefix: str) -> Tuple[int, Dict[int, Tuple[str, Optional[str]]]]:
+        """Find the latest rendered video and subtitles of every scene of a topic.
 
-        output_video_path = os.path.join(video_output_dir, f"{file_prefix}_combined.mp4")
-        output_srt_path = os.path.join(video_output_dir, f"{file_prefix}_combined.srt")
-        
-        if os.path.exists(output_video_path) and os.path.exists(output_srt_path):
-            print(f"Combined video and subtitles already exist at {output_video_path}, not combining again.")
-            return
+        Args:
+            file_prefix (str): Topic file prefix
+
+        Returns:
+            Tuple[int, Dict[int, Tuple[str, Optional[str]]]]: Scene count from the outline (0 if
+                there is no outline) and, for each scene with a video, its video and subtitle paths
+        """
+        search_path = os.path.join(self.output_dir, file_prefix, "media", "videos")
 
         # Get scene count from outline
         scene_outline_path = os.path.join(self.output_dir, file_prefix, f"{file_prefix}_scene_outline.txt")
         if not os.path.exists(scene_outline_path):
             print(f"Warning: Scene outline file not found at {scene_outline_path}. Cannot determine scene count.")
-            return
+            return 0, {}
         with open(scene_outline_path) as f:
             plan = f.read()
         scene_outline = re.search(r'(<SCENE_OUTLINE>.*?</SCENE_OUTLINE>)', plan, re.DOTALL).group(1)
@@ -244,9 +456,7 @@ class VideoRenderer:
                 if dir.startswith(file_prefix + "_scene"):
                     scene_folders.append(os.path.join(root, dir))
 
-        scene_videos = []
-        scene_subtitles = []
-
+        scene_files = {}
         for scene_num in range(1, scene_count + 1):
             folders = [f for f in scene_folders if int(f.split("scene")[-1].split("_")[0]) == scene_num]
             if not folders:
@@ -256,20 +466,56 @@ class VideoRenderer:
             folders.sort(key=lambda f: int(f.split("_v")[-1]))
             folder = folders[-1]
 
-            video_found = False
-            subtitles_found = False
-            for filename in os.listdir(os.path.join(folder, "1080p60")):
+            video_path = None
+            subtitle_path = None
+            quality_folder = find_video_folder(folder, self.final_quality)
+            if quality_folder is None:
+                quality_folder = os.path.join(folder, self.final_quality.folder_name)
+            elif os.path.basename(quality_folder) != self.final_quality.folder_name:
+                print(f"Warning: scene {scene_num} has no {self.final_quality.folder_name} render, using {os.path.basename(quality_folder)}")
+            for filename in (os.listdir(quality_folder) if os.path.isdir(quality_folder) else []):
                 if filename.endswith('.mp4'):
-                    scene_videos.append(os.path.join(folder, "1080p60", filename))
-                    video_found = True
+                    video_path = os.path.join(quality_folder, filename)
                 elif filename.endswith('.srt'):
-                    scene_subtitles.append(os.path.join(folder, "1080p60", filename))
-                    subtitles_found = True
+                    subtitle_path = os.path.join(quality_folder, filename)
 
-            if not video_found:
+            if video_path is None:
                 print(f"Warning: Missing video for scene {scene_num}")
-            if not subtitles_found:
-                scene_subtitles.append(None)
+                continue
+            scene_files[scene_num] = (video_path, subtitle_path)
+        return scene_count, scene_files
+
+    @traced("combine")
+    def combine_videos(self, topic: str):
+        """Combine all videos and subtitle files for a specific topic using ffmpeg.
+
+        Args:
+            topic (str): Topic name to combine videos for
+
+        This function will:
+        - Find all scene videos and subtitles
+        - Skip the topic if none of them changed since the last combine
+        - Combine videos by stream copy, conforming only scenes whose streams differ
+        - Merge subtitle files with correct timing
+        - Save combined video and subtitles to output directory
+        """
+        file_prefix = topic.lower()
+        file_prefix = re.sub(r'[^a-z0-9_]+', '_', file_prefix)
+
+        # Create output directory if it doesn't exist
+        video_output_dir = os.path.join(self.output_dir, file_prefix)
+        os.makedirs(video_output_dir, exist_ok=True)
+
+        output_video_path = os.path.join(video_output_dir, f"{file_prefix}_combined.mp4")
+        output_srt_path = os.path.join(video_output_dir, f"{file_prefix}_combined.srt")
+        segment_dir = os.path.join(video_output_dir, "media", "combine_segments")
+        record_path = os.path.join(segment_dir, "combined_inputs.json")
+
+        scene_count, scene_files = self._find_scene_files(file_prefix)
+        if not scene_count:
+            return
+        scene_videos = [scene_files[n][0] for n in sorted(scene_files)]
+        scene_subtitles = [scene_files[n][1] for n in sorted(scene_files)]
 
         if len(scene_videos) != scene_count:
             print("Not all videos/subtitles are found, aborting video combination.")
@@ -277,115 +523,61 @@ class VideoRenderer:
 
         try:
             import ffmpeg # You might need to install ffmpeg-python package: pip install ffmpeg-python
-            from tqdm import tqdm
+            from src.core.video_concat import (
+                SegmentInfo, ConcatTarget, make_silent_audio, conform_segments, concat_copy,
+                load_combine_record, save_combine_record
+            )
+            media_index = get_media_index()
+
+            # The combined video only needs rebuilding when a scene render, its subtitles or the delivery profile changed
+            inputs = {
+                "quality": self.final_quality.folder_name,
+                "videos": [media_index.content_hash(video) for video in scene_videos],
+                "subtitles": [media_index.content_hash(srt) if srt else None for srt in scene_subtitles],
+            }
+            if (os.path.exists(output_video_path) and os.path.exists(output_srt_path)
+                    and load_combine_record(record_path) == inputs):
+                print(f"Combined video and subtitles at {output_video_path} are up to date, not combining again.")
+                return
 
             print("Analyzing video streams...")
-            # Check if videos have audio streams
-            has_audio = []
-            for video in tqdm(scene_videos, desc="Checking audio streams"):
-                probe = ffmpeg.probe(video)
-                audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
-                has_audio.append(len(audio_streams) > 0)
-
-            print("Preparing video combination...")
-            # If any video has audio, we need to ensure all videos have audio streams
-            if any(has_audio):
-                # Create list to store video and audio streams
-                streams = []
-                for video, has_aud in tqdm(list(zip(scene_videos, has_audio)), desc="Processing videos"):
-                    if has_aud:
-                        # Video has audio, use as is
-                        input_vid = ffmpeg.input(video)
-                        streams.extend([input_vid['v'], input_vid['a']])
-                    else:
-                        # Video lacks audio, add silent audio
-                        input_vid = ffmpeg.input(video)
-                        # Generate silent audio for the duration of the video
-                        probe = ffmpeg.probe(video)
-                        duration = float(probe['streams'][0]['duration'])
-                        silent_audio = ffmpeg.input(f'anullsrc=channel_layout=stereo:sample_rate=44100',
-                                                  f='lavfi', t=duration)['a']
-                        streams.extend([input_vid['v'], silent_audio])
-                    
-                print("Combining videos with audio...")
-                try:
-                    # Concatenate all streams using optimized CPU encoding settings
-                    concat = ffmpeg.concat(*streams, v=1, a=1, unsafe=True)
-                    process = (
-                        concat
-                        .output(output_video_path,
-                               **{'c:v': 'libx264',
-                                  'c:a': 'aac',
-                                  'preset': 'veryfast',    # Changed from ultrafast for better speed/quality balance
-                                  'crf': '28',             # Same quality setting
-                                  'threads': '0',          # Use all CPU threads
-                                  'tune': 'fastdecode',    # Optimize for decoding speed
-                                  'profile:v': 'baseline', # Simpler profile for faster encoding
-                                  'level': '4.0',
-                                  'x264-params': 'aq-mode=0:no-deblock:no-cabac:ref=1:subme=0:trellis=0:weightp=0',  # Added aggressive speed optimizations
-                                  'movflags': '+faststart',
-                                  'stats': None,
-                                  'progress': 'pipe:1'})
-                        .overwrite_output()
-                        .run_async(pipe_stdout=True, pipe_stderr=True)
-                    )
-                    
-                    # Process progress output
-                    while True:
-                        line = process.stdout.readline().decode('utf-8')
-                        if not line:
-                            break
-                        if 'frame=' in line:
-                            sys.stdout.write('\rProcessing: ' + line.strip())
-                            sys.stdout.flush()
-                    
-                    # Wait for the process to complete and capture output
-                    stdout, stderr = process.communicate()
-                    print("\nEncoding complete!")
-                    
-                except ffmpeg.Error as e:
-                    print(f"FFmpeg stdout:\n{e.stdout.decode('utf8')}")
-                    print(f"FFmpeg stderr:\n{e.stderr.decode('utf8')}")
-                    raise
-            else:
-                # No videos have audio, concatenate video streams only
-                streams = []
-                for video in tqdm(scene_videos, desc="Processing videos"):
-                    streams.append(ffmpeg.input(video)['v'])
-                
-                print("Combining videos without audio...")
-                try:
-                    concat = ffmpeg.concat(*streams, v=1, unsafe=True)
-                    process = (
-                        concat
-                        .output(output_video_path,
-                               **{'c:v': 'libx264',
-                                  'preset': 'medium',
-                                  'crf': '23',
-                                  'stats': None,  # Enable progress stats
-                                  'progress': 'pipe:1'})  # Output progress to pipe
-                        .overwrite_output()
-                        .run_async(pipe_stdout=True, pipe_stderr=True)
-                    )
-                    
-                    # Process progress output
-                    while True:
-                        line = process.stdout.readline().decode('utf-8')
-                        if not line:
-                            break
-                        if 'frame=' in line:
-                            sys.stdout.write('\rProcessing: ' + line.strip())
-                            sys.stdout.flush()
-                    
-                    # Wait for the process to complete and capture output
-                    stdout, stderr = process.communicate()
-                    print("\nEncoding complete!")
-                    
-                except ffmpeg.Error as e:
-                    print(f"FFmpeg stdout:\n{e.stdout.decode('utf8')}")
-                    print(f"FFmpeg stderr:\n{e.stderr.decode('utf8')}")
-                    raise
-            
+            segments = [SegmentInfo.probe(video) for video in scene_videos]
+            target = ConcatTarget(segments, self.final_quality)
+            os.makedirs(segment_dir, exist_ok=True)
+
+            # Conformed segments are named after their input and the target, so unchanged scenes reuse them
+            segment_paths = []
+            pending = []
+            for scene_num, (segment, digest) in enumerate(zip(segments, inputs["videos"]), start=1):
+                if target.video_matches(segment) and target.audio_matches(segment):
+                    segment_paths.append(segment.path)
+                    continue
+                conformed_path = os.path.join(segment_dir, f"{digest[:16]}_{target.key}.mp4")
+                if not os.path.exists(conformed_path):
+                    action = "Adding silent audio to" if target.video_matches(segment) and not segment.has_audio else "Re-encoding"
+                    print(f"{action} scene {scene_num} to match the delivery profile")
+                    pending.append((segment, conformed_path))
+                segment_paths.append(conformed_path)
+
+            silent_audio = None
+            if target.has_audio and any(not segment.has_audio for segment, _ in pending):
+                # Scenes without voiceover share one silent track encoded like the others' audio
+                longest = max(segment.duration for segment, _ in pending if not segment.has_audio)
+                silent_audio = make_silent_audio(target, longest, os.path.join(segment_dir, "silence.m4a"))
+            # Encoders compete with manim renders for the same cores, so take only the idle
+            # render slots, each with the share of cores a render worker gets
+            scheduler = self.render_scheduler
+            threads = max(1, scheduler.available_cores() // scheduler.max_workers)
+            with span("normalize", topic=file_prefix, segments=len(pending)):
+                conform_segments(pending, target, silent_audio, max_workers=max(1, scheduler.free_workers), threads=threads)
+
+            print("Combining videos with stream copy...")
+            try:
+                concat_copy(segment_paths, output_video_path, os.path.join(segment_dir, "concat.txt"))
+            except ffmpeg.Error as e:
+                print(f"FFmpeg stderr:\n{e.stderr.decode('utf8') if e.stderr else ''}")
+                raise
+
             print(f"Successfully combined videos into {output_video_path}")
 
             # Handle subtitle combination (existing subtitle code remains the same)
@@ -394,8 +586,10 @@ class VideoRenderer:
                     current_time_offset = 0
                     subtitle_index = 1
 
-                    for srt_file, video_file in zip(scene_subtitles, scene_videos):
+                    for srt_file, segment in zip(scene_subtitles, segments):
                         if srt_file is None:
+                            # Scenes without subtitles still shift the ones after them
+                            current_time_offset += segment.duration
                             continue
 
                         with open(srt_file, 'r', encoding='utf-8') as infile:
@@ -434,14 +628,19 @@ class VideoRenderer:
                                 else:
                                     i += 1
 
-                        # Update time offset using ffprobe
-                        probe = ffmpeg.probe(video_file)
-                        duration = float(probe['streams'][0]['duration'])
-                        current_time_offset += duration
+                        current_time_offset += segment.duration
 
             print(f"Successfully combined videos into {output_video_path}")
             if scene_subtitles:
                 print(f"Successfully combined subtitles into {output_srt_path}")
+            save_combine_record(record_path, inputs)
+            # Drop conformed segments of scene renders that are no longer part of the video
+            for filename in os.listdir(segment_dir):
+                path = os.path.join(segment_dir, filename)
+                if filename.endswith(".mp4") and path not in segment_paths:
+                    os.remove(path)
+            if self.run_manifest is not None:
+                self.run_manifest.record(file_prefix, STAGE_COMBINE, STATUS_SUCCEEDED, artifact_path=output_video_path)
 
         except Exception as e:
             print(f"Error combining videos and subtitles: {e}")
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+import contextlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    item_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    lease_expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    enqueued_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_status ON work_items (status, lease_expires_at);
+"""
+
+
+def default_worker_id() -> str:
+    """Build a worker id that is unique across machines sharing a queue.
+
+    Returns:
+        str: "{hostname}-{pid}"
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """SQLite-backed work queue with leases, shared by worker processes on several machines.
+
+    Every `generate_video.py` worker enqueues the same topics (enqueueing is idempotent)
+    and then pulls them one at a time. A leased item belongs to its worker until the lease
+    expires; workers extend it with `heartbeat` while they work. If a worker dies, its
+    lease runs out and the item is handed to the next worker that asks, up to
+    `max_attempts` times. State changes run in `BEGIN IMMEDIATE` transactions, so two
+    workers never lease the same item. The database can live on a shared filesystem that
+    supports POSIX locks; it uses the default rollback journal because WAL is unsafe on
+    network filesystems.
+
+    Args:
+        db_path (str): Path to the queue database
+        lease_seconds (float, optional): Lease duration. Defaults to 600.
+        max_attempts (int, optional): Leases per item before it is marked failed. Defaults to 3.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 600, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None lets us issue BEGIN IMMEDIATE ourselves
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run `fn` inside a write-locked transaction.
+
+        Args:
+            fn (Callable[[sqlite3.Connection], Any]): Function receiving the connection
+
+        Returns:
+            Any: Return value of `fn`
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, item_id: str, payload: Dict) -> bool:
+        """Add an item unless it is already queued.
+
+        Args:
+            item_id (str): Unique item id, e.g. the topic file prefix
+            payload (Dict): JSON-serializable work description
+
+        Returns:
+            bool: True if the item was added, False if it already existed
+        """
+        now = time.time()
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO work_items (item_id, payload, status, enqueued_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (item_id, json.dumps(payload), STATUS_PENDING, now, now)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(insert)
+
+    def lease(self, worker_id: str) -> Optional[Dict]:
+        """Lease the next pending item, or an item whose lease has expired.
+
+        Args:
+            worker_id (str): Id of the leasing worker
+
+        Returns:
+            Optional[Dict]: Dict with item_id, payload and attempts, or None if no work is available
+        """
+        def take(conn):
+            now = time.time()
+            # Items whose worker died too often are given up on
+            conn.execute(
+                "UPDATE work_items SET status = ?, last_error = COALESCE(last_error, 'lease expired'), updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (STATUS_FAILED, now, STATUS_LEASED, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT item_id, payload, attempts FROM work_items "
+                "WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY enqueued_at, item_id LIMIT 1",
+                (STATUS_PENDING, STATUS_LEASED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE work_items SET status = ?, worker_id = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE item_id = ?",
+                (STATUS_LEASED, worker_id, now + self.lease_seconds, now, row["item_id"])
+            )
+            return {"item_id": row["item_id"], "payload": json.loads(row["payload"]), "attempts": row["attempts"] + 1}
+
+        return self._transaction(take)
+
+    def heartbeat(self, item_id: str, worker_id: str) -> bool:
+        """Extend the lease of an item held by this worker.
+
+        Args:
+            item_id (str): Leased item id
+            worker_id (str): Id of the worker holding the lease
+
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        def extend(conn):
+            now = time.time()
+            cursor = conn.execute(
+                "UPDATE work_items SET lease_expires_at = ?, updated_at = ? WHERE item_id = ? AND worker_id = ? AND status = ?",
+                (now + self.lease_seconds, now, item_id, worker_id, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(extend)
+
+    def complete(self, item_id: str, worker_id: str) -> bool:
+        """Mark a leased item as done.
+
+        Args:
+            item_id (str): Leased item id
+            worker_id (str): Id of the worker holding the lease
+
+        Returns:
+            bool: False if the lease was lost before completion
+        """
+        def finish(conn):
+            cursor = conn.execute(
+                "UPDATE work_items SET status = ?, lease_expires_at = NULL, updated_at = ? WHERE item_id = ? AND worker_id = ? AND status = ?",
+                (STATUS_DONE, time.time(), item_id, worker_id, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(finish)
+
+    def fail(self, item_id: str, worker_id: str, error: str) -> bool:
+        """Release a leased item after an error; it is retried until max_attempts is reached.
+
+        Args:
+            item_id (str): Leased item id
+            worker_id (str): Id of the worker holding the lease
+            error (str): Error description
+
+        Returns:
+            bool: False if the lease was lost before the failure was reported
+        """
+        def release(conn):
+            cursor = conn.execute(
+                "UPDATE work_items SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "worker_id = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+                "WHERE item_id = ? AND worker_id = ? AND status = ?",
+                (self.max_attempts, STATUS_FAILED, STATUS_PENDING, error, time.time(), item_id, worker_id, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(release)
+
+    def counts(self) -> Dict[str, int]:
+        """Count items by status.
+
+        Returns:
+            Dict[str, int]: Number of items per status
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM work_items GROUP BY status").fetchall()
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_FAILED)}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    async def run_worker(self, worker_id: str, handler: Callable[[Dict], Awaitable[None]], slot_limiter=None) -> int:
+        """Lease and process items until every item is done or failed.
+
+        While `handler` runs, a heartbeat extends the lease every third of the lease
+        duration. If the lease is lost (e.g. this worker stalled past its lease and another
+        worker took the item), the handler is cancelled so two workers never keep writing
+        the same topic directory.
+
+        Args:
+            worker_id (str): Id of this worker
+            handler (Callable[[Dict], Awaitable[None]]): Coroutine function receiving the item payload
+            slot_limiter (optional): Async context manager (semaphore or adaptive limiter) held
+                while leasing and processing an item. Defaults to None.
+
+        Returns:
+            int: Number of items this worker completed
+        """
+        completed = 0
+        while True:
+            async with slot_limiter if slot_limiter is not None else contextlib.nullcontext():
+                outcome = await self._process_next(worker_id, handler)
+            if outcome is None:
+                # Leases held by other workers may still expire and need a new owner
+                if (await asyncio.to_thread(self.counts))[STATUS_LEASED] == 0:
+                    return completed
+                await asyncio.sleep(min(self.lease_seconds / 3, 30))
+                continue
+            completed += int(outcome)
+
+    async def _process_next(self, worker_id: str, handler: Callable[[Dict], Awaitable[None]]) -> Optional[bool]:
+        """Lease one item and run `handler` on it while heartbeating the lease.
+
+        Args:
+            worker_id (str): Id of this worker
+            handler (Callable[[Dict], Awaitable[None]]): Coroutine function receiving the item payload
+
+        Returns:
+            Optional[bool]: None if no item was available, otherwise whether the item completed
+        """
+        item = await asyncio.to_thread(self.lease, worker_id)
+        if item is None:
+            return None
+        item_id = item["item_id"]
+        print(f"Worker {worker_id} leased {item_id} (attempt {item['attempts']})")
+
+        work = asyncio.ensure_future(handler(item["payload"]))
+        while not work.done():
+            await asyncio.wait([work], timeout=self.lease_seconds / 3)
+            if not work.done() and not await asyncio.to_thread(self.heartbeat, item_id, worker_id):
+                print(f"Worker {worker_id} lost the lease on {item_id}, cancelling")
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+                return False
+
+        error = work.exception() if not work.cancelled() else asyncio.CancelledError()
+        if error is None:
+            await asyncio.to_thread(self.complete, item_id, worker_id)
+            return True
+        print(f"Worker {worker_id} failed on {item_id}: {error!r}")
+        await asyncio.to_thread(self.fail, item_id, worker_id, repr(error))
+        return False
@@ -1,7 +1,8 @@
 import os
 import re
 import json
-from typing import List, Dict
+import asyncio
+from typing import List, Dict, Optional
 
 from mllm_tools.utils import _prepare_text_inputs
 from task_generator import (
@@ -13,6 +14,7 @@ from task_generator import (
     get_prompt_rag_query_generation_code
 )
 from src.rag.vector_store import RAGVectorStore
+from src.utils.tracing import traced
 
 class RAGIntegration:
     """Class for integrating RAG (Retrieval Augmented Generation) functionality.
@@ -35,7 +37,6 @@ class RAGIntegration:
         self.output_dir = output_dir
         self.manim_docs_path = manim_docs_path
         self.session_id = session_id
-        self.relevant_plugins = None
 
         self.vector_store = RAGVectorStore(
             chroma_db_path=chroma_db_path,
@@ -46,15 +47,8 @@ class RAGIntegration:
             helper_model=helper_model
         )
 
-    def set_relevant_plugins(self, plugins: List[str]) -> None:
-        """Set the relevant plugins for the current video.
-
-        Args:
-            plugins (List[str]): List of plugin names to set as relevant
-        """
-        self.relevant_plugins = plugins
-
-    def detect_relevant_plugins(self, topic: str, description: str) -> List[str]:
+    @traced("plugin_detection")
+    async def detect_relevant_plugins(self, topic: str, description: str) -> Optional[List[str]]:
         """Detect which plugins might be relevant based on topic and description.
 
         Args:
@@ -62,7 +56,8 @@ class RAGIntegration:
             description (str): Description of the video content
 
         Returns:
-            List[str]: List of detected relevant plugin names
+            Optional[List[str]]: List of detected relevant plugin names, or None if the
+                detection failed (e.g. a model error or an unparsable response)
         """
         # Load plugin descriptions
         plugins = self._load_plugin_descriptions()
@@ -77,7 +72,7 @@ class RAGIntegration:
         )
 
         try:
-            response = self.helper_model(
+            response = await self.helper_model.acall(
                 _prepare_text_inputs(prompt),
                 metadata={"generation_name": "detect-relevant-plugins", "tags": [topic, "plugin-detection"], "session_id": self.session_id}
             )
@@ -88,13 +83,16 @@ class RAGIntegration:
             except json.JSONDecodeError as e:
                 print(f"JSONDecodeError when parsing relevant plugins: {e}")
                 print(f"Response text was: {response}")
-                return []
+                return None
+            if not isinstance(relevant_plugins, list):
+                print(f"Unexpected relevant plugins response: {relevant_plugins}")
+                return None
 
             print(f"LLM detected relevant plugins: {relevant_plugins}")
             return relevant_plugins
         except Exception as e:
             print(f"Error detecting plugins with LLM: {e}")
-            return []
+            return None
 
     def _load_plugin_descriptions(self) -> list:
         """Load plugin descriptions from JSON file.
@@ -118,7 +116,8 @@ class RAGIntegration:
             print(f"Error loading plugin descriptions: {e}")
             return []
 
-    def _generate_rag_queries_storyboard(self, scene_plan: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
+    @traced("rag_query_generation", kind="storyboard")
+    async def _generate_rag_queries_storyboard(self, scene_plan: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
         """Generate RAG queries from the scene plan to help create storyboard.
 
         Args:
@@ -150,7 +149,7 @@ class RAGIntegration:
             relevant_plugins=plugins_str
         )
         
-        queries = self.helper_model(
+        queries = await self.helper_model.acall(
             _prepare_text_inputs(prompt),
             metadata={"generation_name": "rag_query_generation_storyboard", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
         )
@@ -171,7 +170,8 @@ class RAGIntegration:
 
         return queries
 
-    def _generate_rag_queries_technical(self, storyboard: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
+    @traced("rag_query_generation", kind="technical")
+    async def _generate_rag_queries_technical(self, storyboard: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
         """Generate RAG queries from the storyboard to help create technical implementation.
 
         Args:
@@ -199,7 +199,7 @@ class RAGIntegration:
             relevant_plugins=", ".join(relevant_plugins) if relevant_plugins else "No plugins are relevant."
         )
         
-        queries = self.helper_model(
+        queries = await self.helper_model.acall(
             _prepare_text_inputs(prompt),
             metadata={"generation_name": "rag_query_generation_technical", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
         )
@@ -218,7 +218,8 @@ class RAGIntegration:
 
         return queries
 
-    def _generate_rag_queries_narration(self, storyboard: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
+    @traced("rag_query_generation", kind="narration")
+    async def _generate_rag_queries_narration(self, storyboard: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = []) -> List[str]:
         """Generate RAG queries from the storyboard to help create narration plan.
 
         Args:
@@ -246,7 +247,7 @@ class RAGIntegration:
             relevant_plugins=", ".join(relevant_plugins) if relevant_plugins else "No plugins are relevant."
         )
         
-        queries = self.helper_model(
+        queries = await self.helper_model.acall(
             _prepare_text_inputs(prompt),
             metadata={"generation_name": "rag_query_generation_narration", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
         )
@@ -265,7 +266,8 @@ class RAGIntegration:
 
         return queries
 
-    def get_relevant_docs(self, rag_queries: List[Dict], scene_trace_id: str, topic: str, scene_number: int) -> List[str]:
+    @traced("retrieval")
+    async def get_relevant_docs(self, rag_queries: List[Dict], scene_trace_id: str, topic: str, scene_number: int) -> List[str]:
         """Get relevant documentation using the vector store.
 
         Args:
@@ -277,7 +279,9 @@ class RAGIntegration:
         Returns:
             List[str]: List of relevant documentation snippets
         """
-        return self.vector_store.find_relevant_docs(
+        # Embedding lookups are blocking, so run them in a worker thread
+        return await asyncio.to_thread(
+            self.vector_store.find_relevant_docs,
             queries=rag_queries,
             k=2,
             trace_id=scene_trace_id,
@@ -285,7 +289,8 @@ class RAGIntegration:
             scene_number=scene_number
         )
     
-    def _generate_rag_queries_code(self, implementation_plan: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, relevant_plugins: List[str] = None) -> List[str]:
+    @traced("rag_query_generation", kind="code")
+    async def _generate_rag_queries_code(self, implementation_plan: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, relevant_plugins: List[str] = None) -> List[str]:
         """Generate RAG queries from implementation plan.
 
         Args:
@@ -313,7 +318,7 @@ class RAGIntegration:
         )
 
         try:
-            response = self.helper_model(
+            response = await self.helper_model.acall(
                 _prepare_text_inputs(prompt),
                 metadata={"generation_name": "rag_query_generation_code", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": self.session_id}
             )
@@ -331,7 +336,8 @@ class RAGIntegration:
             print(f"Error generating RAG queries: {e}")
             return []
 
-    def _generate_rag_queries_error_fix(self, error: str, code: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None) -> List[str]:
+    @traced("rag_query_generation", kind="error_fix")
+    async def _generate_rag_queries_error_fix(self, error: str, code: str, scene_trace_id: str = None, topic: str = None, scene_number: int = None, session_id: str = None, relevant_plugins: List[str] = None) -> List[str]:
         """Generate RAG queries for fixing code errors.
 
         Args:
@@ -341,15 +347,12 @@ class RAGIntegration:
             topic (str, optional): Topic name. Defaults to None
             scene_number (int, optional): Scene number. Defaults to None
             session_id (str, optional): Session identifier. Defaults to None
+            relevant_plugins (List[str], optional): List of relevant plugins. Defaults to None
 
         Returns:
             List[str]: List of generated RAG queries
         """
-        if self.relevant_plugins is None:
-            print("Warning: No plugins have been detected yet")
-            plugins_str = "No plugins are relevant."
-        else:
-            plugins_str = ", ".join(self.relevant_plugins) if self.relevant_plugins else "No plugins are relevant."
+        plugins_str = ", ".join(relevant_plugins) if relevant_plugins else "No plugins are relevant."
 
         cache_key = f"{topic}_scene{scene_number}_error_fix"
         cache_dir = os.path.join(self.output_dir, re.sub(r'[^a-z0-9_]+', '_', topic.lower()), f"scene{scene_number}", "rag_cache")
@@ -368,7 +371,7 @@ class RAGIntegration:
             relevant_plugins=plugins_str
         )
 
-        queries = self.helper_model(
+        queries = await self.helper_model.acall(
             _prepare_text_inputs(prompt),
             metadata={"generation_name": "rag-query-generation-fix-error", "trace_id": scene_trace_id, "tags": [topic, f"scene{scene_number}"], "session_id": session_id}
         )
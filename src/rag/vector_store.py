@@ -283,7 +283,8 @@ class RAGVectorStore:
         # Search in core manim docs
         for query in manim_core_queries:
             query_text = query["query"]
-            self.core_vector_store._embedding_function.parent_observation_id = span.id
+            if self.use_langfuse:
+                self.core_vector_store._embedding_function.parent_observation_id = span.id
             manim_core_results = self.core_vector_store.similarity_search_with_relevance_scores(
                 query=query_text,
                 k=k,
@@ -301,8 +302,9 @@ class RAGVectorStore:
         for query in manim_plugin_queries:
             plugin_name = query["type"]
             query_text = query["query"]
-            self.plugin_stores[plugin_name]._embedding_function.parent_observation_id = span.id
             if plugin_name in self.plugin_stores:
+                if self.use_langfuse:
+                    self.plugin_stores[plugin_name]._embedding_function.parent_observation_id = span.id
                 plugin_results = self.plugin_stores[plugin_name].similarity_search_with_relevance_scores(
                     query=query_text,
                     k=k,
@@ -0,0 +1,196 @@
+import re
+from typing import List, Optional, Tuple
+
+# Characters rich uses to draw the traceback box
+_BOX_CHARS = "│╭╮╰╯─┃━┏┓┗┛"
+
+_EXCEPTION_LINE = re.compile(r"^(?:[A-Za-z_][\w]*\.)*([A-Za-z_]\w*(?:Error|Exception|Exit|Warning|Interrupt|Iteration))(?::\s*(.*))?$")
+# Frame headers of plain Python tracebacks and of rich tracebacks (where long paths wrap)
+_PLAIN_FRAME = re.compile(r'File "([^"]+)", line (\d+), in (\S+)')
+_RICH_FRAME = re.compile(r"([^\s:│]+\.py):(\d+) in (\w+)")
+_LIBRARY_PATHS = ("site-packages", "dist-packages", "/lib/python", "<frozen")
+# Manim log lines end with the logging call site, e.g. "tex_file_writing.py:314"
+_LOG_SUFFIX = re.compile(r"\s+\S+\.py:\d+\s*$")
+_LOG_LEVEL = re.compile(r"^(DEBUG|INFO|WARNING|ERROR|CRITICAL)\s+")
+
+_SYMBOL_PATTERNS = [
+    (re.compile(r"name '(\w+)' is not defined"), "{0}"),
+    (re.compile(r"module '([\w.]+)' has no attribute '(\w+)'"), "{0}.{1}"),
+    (re.compile(r"'(\w+)' object has no attribute '(\w+)'"), "{0}.{1}"),
+    (re.compile(r"type object '(\w+)' has no attribute '(\w+)'"), "{0}.{1}"),
+    (re.compile(r"cannot import name '(\w+)' from '([\w.]+)'"), "{1}.{0}"),
+    (re.compile(r"No module named '([\w.]+)'"), "{0}"),
+    (re.compile(r"([\w.]+)\(\) got an unexpected keyword argument '(\w+)'"), "{0}({1}=...)"),
+    (re.compile(r"([\w.]+)\(\) (?:missing \d+ required|takes \d+|got multiple values)"), "{0}"),
+]
+
+
+class ErrorRecord:
+    """Compact description of a render or preflight failure.
+
+    Attributes:
+        exception_type (str): Exception class name, e.g. "AttributeError"
+        message (str): Exception message
+        line_number (int): Line of the scene code the error was raised from, if known
+        function (str): Function containing that line, if known
+        code_context (str): Numbered scene code around the failing line
+        symbol (str): API symbol the error is about, e.g. "Circle.set_colour"
+        latex_error (str): LaTeX error reported by manim, if any
+        latex_context (str): LaTeX source around that error, if any
+    """
+
+    def __init__(self, exception_type: Optional[str] = None, message: Optional[str] = None, line_number: Optional[int] = None,
+                 function: Optional[str] = None, code_context: Optional[str] = None, symbol: Optional[str] = None,
+                 latex_error: Optional[str] = None, latex_context: Optional[str] = None):
+        self.exception_type = exception_type
+        self.message = message
+        self.line_number = line_number
+        self.function = function
+        self.code_context = code_context
+        self.symbol = symbol
+        self.latex_error = latex_error
+        self.latex_context = latex_context
+
+    def format(self) -> str:
+        """Render the record as the short text used in fix prompts and RAG queries.
+
+        Returns:
+            str: One labelled section per known field
+        """
+        parts = []
+        if self.exception_type:
+            parts.append(f"{self.exception_type}: {self.message}" if self.message else self.exception_type)
+        if self.latex_error:
+            parts.append(f"LaTeX error: {self.latex_error}")
+        if self.latex_context:
+            parts.append(f"LaTeX source near the error:\n{self.latex_context}")
+        if self.line_number is not None:
+            location = f"Raised at line {self.line_number}" + (f" in {self.function}" if self.function else "")
+            parts.append(f"{location}:\n{self.code_context}" if self.code_context else location)
+        if self.symbol:
+            parts.append(f"Offending symbol: {self.symbol}")
+        return "\n".join(parts)
+
+
+def _strip_box(line: str) -> str:
+    return line.strip().strip(_BOX_CHARS).strip()
+
+
+def _find_frames(lines: List[str]) -> List[Tuple[str, int, str]]:
+    """Collect (file, line, function) of every traceback frame in order."""
+    frames = [(m.group(1), int(m.group(2)), m.group(3)) for line in lines for m in _PLAIN_FRAME.finditer(line)]
+    if frames:
+        return frames
+    # Rich wraps long paths over several box lines; a wrapped line fills the box up to its one-space padding
+    joined = re.sub(r"(\S) [│┃]\n[│┃] (\S)", r"\1\2", "\n".join(line.strip() for line in lines))
+    return [(m.group(1), int(m.group(2)), m.group(3)) for m in _RICH_FRAME.finditer(joined)]
+
+
+def _find_exception(lines: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Find the last exception line and its message, including up to two continuation lines."""
+    for i in range(len(lines) - 1, -1, -1):
+        stripped = _strip_box(lines[i])
+        match = _EXCEPTION_LINE.match(stripped)
+        if match is None or " " in match.group(1):
+            continue
+        message = (match.group(2) or "").strip()
+        for extra in lines[i + 1:i + 3]:
+            extra = _strip_box(extra)
+            if not extra or _LOG_LEVEL.match(extra):
+                break
+            message += " " + extra
+        return match.group(1), message
+    return None, None
+
+
+def _find_latex_error(lines: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Find manim's "LaTeX compilation error" log entry and the source lines around it."""
+    latex_error, context = None, []
+    for i, line in enumerate(lines):
+        text = _LOG_SUFFIX.sub("", _LOG_LEVEL.sub("", line.strip()))
+        if latex_error is None and "LaTeX compilation error:" in text:
+            latex_error = text.split("LaTeX compilation error:", 1)[1].strip()
+        elif latex_error is not None and text.startswith("Context of error"):
+            for following in lines[i + 1:]:
+                if _LOG_LEVEL.match(following) or any(c in following for c in _BOX_CHARS) or not following.strip():
+                    break
+                context.append(_LOG_SUFFIX.sub("", following).strip())
+            break
+    marker = next((j for j, line in enumerate(context) if line.startswith("->")), None)
+    if marker is not None:
+        context = context[max(0, marker - 2):marker + 3]
+    return latex_error, "\n".join(context[:8]) or None
+
+
+def _code_context(code: str, line_number: int, radius: int = 2) -> Optional[str]:
+    """Number the code lines around `line_number` and mark the failing one."""
+    code_lines = code.splitlines()
+    if not 1 <= line_number <= len(code_lines):
+        return None
+    start, end = max(1, line_number - radius), min(len(code_lines), line_number + radius)
+    return "\n".join(
+        f"{'>' if n == line_number else ' '} {n:4d} | {code_lines[n - 1]}" for n in range(start, end + 1)
+    )
+
+
+def _find_symbol(exception_type: Optional[str], message: Optional[str], failing_line: Optional[str]) -> Optional[str]:
+    """Name the API symbol an error is about, from the message or else the failing call."""
+    if message:
+        for pattern, template in _SYMBOL_PATTERNS:
+            match = pattern.search(message)
+            if match:
+                return template.format(*match.groups())
+    if failing_line and exception_type in ("TypeError", "ValueError", "AttributeError", "KeyError", "IndexError"):
+        calls = re.findall(r"([A-Za-z_][\w.]*)\s*\(", failing_line)
+        if calls:
+            return calls[0]
+    return None
+
+
+def parse_error(error: str, code: Optional[str] = None) -> ErrorRecord:
+    """Reduce manim, LaTeX or Python failure output to an ErrorRecord.
+
+    Args:
+        error (str): Error text, e.g. the stderr of a manim render or a preflight traceback
+        code (str, optional): Scene code that produced the error, used for the failing line
+            and its context. Defaults to None.
+
+    Returns:
+        ErrorRecord: Fields that could be recovered from the output
+    """
+    lines = error.splitlines()
+    record = ErrorRecord()
+    record.exception_type, record.message = _find_exception(lines)
+    record.latex_error, record.latex_context = _find_latex_error(lines)
+
+    user_frames = [frame for frame in _find_frames(lines) if not any(path in frame[0] for path in _LIBRARY_PATHS)]
+    failing_line = None
+    if user_frames:
+        _, record.line_number, record.function = user_frames[-1]
+        if code is not None:
+            record.code_context = _code_context(code, record.line_number)
+            code_lines = code.splitlines()
+            if record.line_number <= len(code_lines):
+                failing_line = code_lines[record.line_number - 1]
+    record.symbol = _find_symbol(record.exception_type, record.message, failing_line)
+    return record
+
+
+def distill_error(error: str, code: Optional[str] = None, max_tail_lines: int = 20) -> str:
+    """Turn failure output into the compact text used in code fix prompts.
+
+    Args:
+        error (str): Error text, e.g. the stderr of a manim render
+        code (str, optional): Scene code that produced the error. Defaults to None.
+        max_tail_lines (int, optional): Lines of raw output kept when nothing could be
+            parsed. Defaults to 20.
+
+    Returns:
+        str: The formatted ErrorRecord, or the last lines of the output if it has no
+            recognisable exception
+    """
+    record = parse_error(error, code)
+    if record.exception_type is None and record.latex_error is None:
+        tail = [line.rstrip() for line in error.strip().splitlines() if _strip_box(line)]
+        return "\n".join(tail[-max_tail_lines:])
+    return record.format()
@@ -0,0 +1,192 @@
+import os
+import json
+import sqlite3
+import threading
+from fractions import Fraction
+from typing import Dict, List, Optional
+
+from src.utils.utils import hash_file
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    streams TEXT,
+    content_hash TEXT
+);
+"""
+
+# ffprobe stream fields kept in the index
+_STREAM_FIELDS = (
+    "codec_type", "codec_name", "profile", "width", "height", "r_frame_rate", "avg_frame_rate",
+    "pix_fmt", "sample_rate", "channels", "duration",
+)
+
+
+class MediaInfo:
+    """Metadata of one media file as recorded in the index.
+
+    Args:
+        path (str): Path of the file
+        duration (float): Container duration in seconds
+        streams (List[Dict]): ffprobe stream entries, reduced to the fields in _STREAM_FIELDS
+    """
+
+    def __init__(self, path: str, duration: float, streams: List[Dict]):
+        self.path = path
+        self.duration = duration
+        self.streams = streams
+
+    @property
+    def video_stream(self) -> Optional[Dict]:
+        return next((s for s in self.streams if s.get("codec_type") == "video"), None)
+
+    @property
+    def audio_stream(self) -> Optional[Dict]:
+        return next((s for s in self.streams if s.get("codec_type") == "audio"), None)
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_stream is not None
+
+    @property
+    def width(self) -> Optional[int]:
+        video = self.video_stream
+        return int(video["width"]) if video else None
+
+    @property
+    def height(self) -> Optional[int]:
+        video = self.video_stream
+        return int(video["height"]) if video else None
+
+    @property
+    def fps(self) -> Optional[float]:
+        video = self.video_stream
+        if not video or video.get("r_frame_rate") in (None, "0/0"):
+            return None
+        return float(Fraction(video["r_frame_rate"]))
+
+    def as_probe(self) -> Dict:
+        """Shape the metadata like the output of ffmpeg.probe.
+
+        Returns:
+            Dict: {"streams": [...], "format": {"duration": ...}}
+        """
+        return {"streams": self.streams, "format": {"duration": str(self.duration)}}
+
+
+class MediaIndex:
+    """Persistent cache of ffprobe results and content hashes.
+
+    Entries are keyed by path and stay valid while the file's size and modification time
+    are unchanged, so looking up a file that was already probed costs one stat instead of
+    an ffprobe process (or opening it with moviepy). Content hashes are computed on first
+    request and cached the same way.
+
+    Args:
+        db_path (str, optional): SQLite database path. Defaults to None, which keeps the
+            index in memory for the lifetime of the process.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or ":memory:"
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # Combines run in worker threads, so share one guarded connection
+        self._conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _entry(self, path: str) -> sqlite3.Row:
+        """Get the entry of a file, replacing it with an empty one if the file changed."""
+        stat = os.stat(path)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM media WHERE path = ?", (path,)).fetchone()
+            if row is not None and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns:
+                return row
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (path, size, mtime_ns) VALUES (?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns)
+            )
+            return self._conn.execute("SELECT * FROM media WHERE path = ?", (path,)).fetchone()
+
+    def _update(self, path: str, row: sqlite3.Row, **fields) -> None:
+        """Store computed fields, unless the file changed again in the meantime."""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE media SET {assignments} WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (*fields.values(), path, row["size"], row["mtime_ns"])
+            )
+
+    def get(self, path: str) -> MediaInfo:
+        """Get the metadata of a media file, probing it with ffprobe if it is not indexed.
+
+        Args:
+            path (str): Path of the file
+
+        Returns:
+            MediaInfo: Duration and stream layout of the file
+        """
+        path = os.path.abspath(path)
+        row = self._entry(path)
+        if row["streams"] is not None:
+            return MediaInfo(path, row["duration"], json.loads(row["streams"]))
+
+        import ffmpeg # You might need to install ffmpeg-python package: pip install ffmpeg-python
+        probe = ffmpeg.probe(path)
+        streams = [{k: s[k] for k in _STREAM_FIELDS if k in s} for s in probe.get("streams", [])]
+        duration = probe.get("format", {}).get("duration")
+        if duration is None:
+            duration = max((float(s["duration"]) for s in streams if "duration" in s), default=0.0)
+        info = MediaInfo(path, float(duration), streams)
+        self._update(path, row, duration=info.duration, streams=json.dumps(streams))
+        return info
+
+    def content_hash(self, path: str) -> str:
+        """Get the sha256 hash of a file's content, hashing it only if it changed.
+
+        Args:
+            path (str): Path of the file
+
+        Returns:
+            str: Hex digest
+        """
+        path = os.path.abspath(path)
+        row = self._entry(path)
+        if row["content_hash"] is not None:
+            return row["content_hash"]
+        digest = hash_file(path)
+        self._update(path, row, content_hash=digest)
+        return digest
+
+
+_media_index = MediaIndex()
+
+
+def get_media_index() -> MediaIndex:
+    """Get the process-wide media index.
+
+    Returns:
+        MediaIndex: The index shared by the renderer and the evaluation suite
+    """
+    return _media_index
+
+
+def set_media_index(index: MediaIndex) -> None:
+    """Replace the process-wide media index, e.g. with one stored on disk.
+
+    Args:
+        index (MediaIndex): New index
+    """
+    global _media_index
+    _media_index = index
@@ -0,0 +1,133 @@
+from typing import List, Optional
+
+from mllm_tools.rate_limiter import count_tokens
+from src.utils.tracing import get_tracer
+
+# Used when the model's context window is unknown
+DEFAULT_MAX_INPUT_TOKENS = 128000
+# Room left for the response within the context window
+RESERVED_OUTPUT_TOKENS = 8192
+# Trimming a component below this many tokens keeps nothing useful, so it is dropped instead
+MIN_TRIMMED_TOKENS = 200
+
+
+def prompt_token_budget(model_name: Optional[str], max_prompt_tokens: Optional[int] = None) -> int:
+    """Work out how many prompt tokens a request to a model may use.
+
+    Args:
+        model_name (str, optional): LiteLLM model name, used to look up the context window
+        max_prompt_tokens (int, optional): Upper bound set by the user. Defaults to None.
+
+    Returns:
+        int: The context window minus room for the response, capped at max_prompt_tokens
+    """
+    max_input_tokens = DEFAULT_MAX_INPUT_TOKENS
+    if model_name:
+        try:
+            import litellm
+            info = litellm.get_model_info(model_name)
+            max_input_tokens = info.get("max_input_tokens") or max_input_tokens
+        except Exception:
+            pass
+    budget = max(MIN_TRIMMED_TOKENS, max_input_tokens - RESERVED_OUTPUT_TOKENS)
+    if max_prompt_tokens is not None:
+        budget = min(budget, max_prompt_tokens)
+    return budget
+
+
+class PromptComponent:
+    """One named part of a prompt.
+
+    Args:
+        name (str): Name used in logs, e.g. "cheatsheet"
+        text (str): Content
+        priority (int): Lower priorities are cut first
+        trimmable (bool): Whether the tail may be cut off instead of dropping the whole component
+        required (bool): Whether the component is never cut
+    """
+
+    def __init__(self, name: str, text: str, priority: int, trimmable: bool, required: bool):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.trimmable = trimmable
+        self.required = required
+        self.tokens = count_tokens(text)
+
+
+class PromptBudget:
+    """Assembles prompt components within a token budget.
+
+    Components are counted with tiktoken as they are added. `fit` then drops or trims the
+    lowest-priority optional components until the total fits the budget, and logs what
+    was cut. Required components (the plan itself) are never cut.
+
+    Args:
+        budget (int): Maximum prompt tokens
+        name (str, optional): Prompt name used in logs. Defaults to "prompt".
+    """
+
+    def __init__(self, budget: int, name: str = "prompt"):
+        self.budget = budget
+        self.name = name
+        self.components: List[PromptComponent] = []
+
+    def add(self, name: str, text: str, priority: int = 0, trimmable: bool = False, required: bool = False) -> None:
+        """Add a component; components keep the order they were added in.
+
+        Args:
+            name (str): Name used in logs
+            text (str): Content
+            priority (int, optional): Lower priorities are cut first. Defaults to 0.
+            trimmable (bool, optional): Whether the tail may be cut off. Defaults to False.
+            required (bool, optional): Whether the component is never cut. Defaults to False.
+        """
+        self.components.append(PromptComponent(name, text, priority, trimmable, required))
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(component.tokens for component in self.components)
+
+    def fit(self) -> List[PromptComponent]:
+        """Cut optional components until the prompt fits the budget.
+
+        Returns:
+            List[PromptComponent]: Remaining components in their original order
+        """
+        before = self.total_tokens
+        if before <= self.budget:
+            return self.components
+
+        cuts = []
+        # Stable sort: among equal priorities, later components are cut first
+        for component in sorted(reversed(self.components), key=lambda c: c.priority):
+            excess = self.total_tokens - self.budget
+            if excess <= 0:
+                break
+            if component.required:
+                continue
+            keep_tokens = component.tokens - excess
+            if component.trimmable and keep_tokens >= MIN_TRIMMED_TOKENS:
+                old_tokens = component.tokens
+                self._trim(component, keep_tokens)
+                cuts.append(f"trimmed {component.name} {old_tokens} -> {component.tokens}")
+            else:
+                self.components.remove(component)
+                cuts.append(f"dropped {component.name} ({component.tokens})")
+
+        after = self.total_tokens
+        print(f"Prompt {self.name} over budget ({before} > {self.budget} tokens): {', '.join(cuts) or 'nothing to cut'}; now {after} tokens")
+        get_tracer().event("prompt_budget", prompt=self.name, budget=self.budget, tokens_before=before, tokens_after=after, cuts=cuts)
+        return self.components
+
+    @staticmethod
+    def _trim(component: PromptComponent, max_tokens: int) -> None:
+        """Cut the tail of a component at a line boundary so that it fits max_tokens."""
+        text = component.text
+        while component.tokens > max_tokens and text:
+            # Token density varies, so shrink proportionally and recount
+            keep_chars = int(len(text) * max_tokens / component.tokens * 0.98)
+            cut = text.rfind("\n", 0, keep_chars)
+            text = text[:cut if cut > 0 else keep_chars]
+            component.text = text + "\n[... truncated to fit the prompt budget]"
+            component.tokens = count_tokens(component.text)
@@ -0,0 +1,259 @@
+import json
+import math
+import time
+import inspect
+import asyncio
+import functools
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+class Span:
+    """A timed pipeline stage, used as `with` or `async with` block.
+
+    The outcome is "ok" when the block finishes, "error" when it raises and "cancelled"
+    when it is cancelled, unless the block sets one explicitly with `set(outcome=...)`.
+
+    Args:
+        tracer (Tracer): Tracer that receives the finished span
+        stage (str): Stage name, e.g. "render"
+        attrs (Dict[str, Any]): Attributes such as topic, scene and version
+    """
+
+    def __init__(self, tracer: "Tracer", stage: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.stage = stage
+        self.attrs = attrs
+        self.start = None
+        self._start_perf = None
+
+    def set(self, **attrs) -> None:
+        """Add or override attributes of the span.
+
+        Args:
+            **attrs: Attributes to record, e.g. outcome="failed"
+        """
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start_perf
+        if "outcome" not in self.attrs:
+            if exc_type is None:
+                self.attrs["outcome"] = "ok"
+            elif issubclass(exc_type, asyncio.CancelledError):
+                self.attrs["outcome"] = "cancelled"
+            else:
+                self.attrs["outcome"] = "error"
+                # Render errors carry the whole stderr; the last line names the exception
+                lines = str(exc).strip().splitlines()
+                self.attrs["error"] = lines[-1][:500] if lines else type(exc).__name__
+        self.tracer._finish(self, duration)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class Tracer:
+    """Collects per-stage timing spans and writes them as JSONL.
+
+    Every finished span becomes one JSON line with stage, start, end, duration, topic,
+    scene, version and outcome. Durations are also kept in memory so `summary` can report
+    p50/p95/p99 per stage at the end of a batch.
+
+    Args:
+        trace_path (str, optional): JSONL file to append spans to. Defaults to None (in memory only).
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._durations = defaultdict(list)
+        self._outcomes = defaultdict(Counter)
+        self._file = open(trace_path, "a") if trace_path else None
+
+    def span(self, stage: str, topic: Optional[str] = None, scene: Optional[int] = None, version: Optional[int] = None, **attrs) -> Span:
+        """Create a span for a stage.
+
+        Args:
+            stage (str): Stage name
+            topic (str, optional): Topic. Defaults to None.
+            scene (int, optional): Scene number. Defaults to None.
+            version (int, optional): Code version. Defaults to None.
+            **attrs: Additional attributes
+
+        Returns:
+            Span: Context manager timing the stage
+        """
+        return Span(self, stage, {"topic": topic, "scene": scene, "version": version, **attrs})
+
+    def event(self, name: str, **attrs) -> None:
+        """Write a point-in-time event, e.g. a concurrency snapshot.
+
+        Args:
+            name (str): Event name
+            **attrs: Event payload
+        """
+        self._write({"type": "event", "name": name, "time": time.time(), **attrs})
+
+    def _finish(self, span: Span, duration: float) -> None:
+        with self._lock:
+            self._durations[span.stage].append(duration)
+            self._outcomes[span.stage][span.attrs["outcome"]] += 1
+        self._write({
+            "type": "span",
+            "stage": span.stage,
+            "start": span.start,
+            "end": span.start + duration,
+            "duration": duration,
+            **span.attrs
+        })
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            return
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Aggregate span durations per stage.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: For each stage: count, total, p50, p95, p99 and outcome counts
+        """
+        with self._lock:
+            stages = {stage: sorted(durations) for stage, durations in self._durations.items()}
+            outcomes = {stage: dict(counter) for stage, counter in self._outcomes.items()}
+        return {
+            stage: {
+                "count": len(durations),
+                "total": sum(durations),
+                "p50": _percentile(durations, 0.50),
+                "p95": _percentile(durations, 0.95),
+                "p99": _percentile(durations, 0.99),
+                "outcomes": outcomes[stage]
+            }
+            for stage, durations in stages.items()
+        }
+
+    def format_summary(self) -> str:
+        """Format the per-stage summary as a table.
+
+        Returns:
+            str: Human-readable latency table
+        """
+        lines = [f"{'Stage':<24} {'Count':>6} {'Total s':>10} {'p50 s':>9} {'p95 s':>9} {'p99 s':>9}  Outcomes"]
+        for stage, stats in sorted(self.summary().items(), key=lambda item: -item[1]["total"]):
+            outcomes = ", ".join(f"{name}={count}" for name, count in sorted(stats["outcomes"].items()))
+            lines.append(
+                f"{stage:<24} {stats['count']:>6} {stats['total']:>10.1f} "
+                f"{stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}  {outcomes}"
+            )
+        return "\n".join(lines)
+
+    def write_summary(self, path: str) -> None:
+        """Write the per-stage summary as JSON.
+
+        Args:
+            path (str): Output file
+        """
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def close(self) -> None:
+        """Close the trace file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Get the process-wide tracer.
+
+    Returns:
+        Tracer: The tracer spans are reported to
+    """
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> None:
+    """Replace the process-wide tracer, e.g. with one that writes a trace file.
+
+    Args:
+        tracer (Tracer): New tracer
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def span(stage: str, topic: Optional[str] = None, scene: Optional[int] = None, version: Optional[int] = None, **attrs) -> Span:
+    """Create a span on the process-wide tracer.
+
+    Args:
+        stage (str): Stage name
+        topic (str, optional): Topic. Defaults to None.
+        scene (int, optional): Scene number. Defaults to None.
+        version (int, optional): Code version. Defaults to None.
+        **attrs: Additional attributes
+
+    Returns:
+        Span: Context manager timing the stage
+    """
+    return _tracer.span(stage, topic=topic, scene=scene, version=version, **attrs)
+
+
+def traced(stage: str, **static_attrs) -> Callable:
+    """Decorator that records each call of a function as a span.
+
+    The span's topic and scene are taken from the function's `topic` and
+    `scene_number` arguments when it has them.
+
+    Args:
+        stage (str): Stage name
+        **static_attrs: Attributes added to every span, e.g. kind="storyboard"
+
+    Returns:
+        Callable: Decorator for sync or async functions
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        def make_span(args, kwargs):
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            return span(stage, topic=arguments.get("topic"), scene=arguments.get("scene_number"), **static_attrs)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with make_span(args, kwargs):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with make_span(args, kwargs):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
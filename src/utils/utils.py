@@ -1,5 +1,9 @@
+import os
 import json
 import re
+import hashlib
+import tempfile
+from typing import Optional
 try:
     from pylatexenc.latexencode import utf8tolatex, UnicodeToLatexEncoder
 except:
@@ -126,3 +130,84 @@ def extract_xml(response: str) -> str:
         return re.search(r'```xml\n(.*?)\n```', response, re.DOTALL).group(1)
     except:
         return response
+
+def atomic_write(path: str, content: str) -> None:
+    """Write a text file atomically.
+
+    Writes to a temporary file in the same directory and renames it over the target, so
+    concurrent readers (possibly on other machines sharing the filesystem) see either the
+    old or the new content, never a partial file.
+
+    Args:
+        path (str): Destination file path
+        content (str): Text to write
+
+    Returns:
+        None
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> Optional[str]:
+    """Compute the sha256 hash of a file.
+
+    Args:
+        path (str): Path to the file
+        chunk_size (int, optional): Read size in bytes. Defaults to 1 MiB.
+
+    Returns:
+        Optional[str]: Hex digest, or None if the path is not a file
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def create_file_once(path: str, content: str) -> bool:
+    """Create a text file only if it does not exist yet.
+
+    Uses an exclusive create so that when several processes race, exactly one of them
+    writes the file.
+
+    Args:
+        path (str): Destination file path
+        content (str): Text to write
+
+    Returns:
+        bool: True if this call created the file, False if it already existed
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # A unique temporary name: pids alone collide between hosts sharing the filesystem
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    try:
+        # link() fails if the target exists, and the target appears with its full content
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        # Filesystems without hard links: fall back to an exclusive create
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        return True
+    finally:
+        os.remove(tmp_path)
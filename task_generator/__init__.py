@@ -23,7 +23,14 @@ from .prompts_raw import (
     _prompt_rag_query_generation_narration,
     _prompt_rag_query_generation_fix_error
 )
-from typing import Union, List
+from typing import Union, List, Tuple
+
+# The code generation template is reordered so that its instructions, which only depend on the
+# scene number, come before the per-scene inputs and form a prefix providers can cache
+_code_generation_intro, _code_generation_rest = _prompt_code_generation.split("Input Context:\n", 1)
+_code_generation_inputs, _code_generation_guidelines = _code_generation_rest.split("**Code Generation Guidelines:**", 1)
+_code_generation_instructions = _code_generation_intro + "**Code Generation Guidelines:**" + _code_generation_guidelines.rstrip() + "\n"
+_code_generation_inputs = "Input Context:\n" + _code_generation_inputs.rstrip() + "\n"
   
 def get_prompt_scene_plan(topic: str, description: str) -> str:
     """
@@ -79,14 +86,18 @@ def get_prompt_scene_animation_narration(scene_number: int, topic: str, descript
     )
     return prompt
 
-def get_prompt_code_generation(topic: str,
-                               description: str,
-                               scene_outline: str,
-                               scene_implementation: str,
-                               scene_number: int,
-                               additional_context: Union[str, List[str]] = None) -> str:
+def get_prompt_code_generation_parts(topic: str,
+                                     description: str,
+                                     scene_outline: str,
+                                     scene_implementation: str,
+                                     scene_number: int,
+                                     additional_context: Union[str, List[str]] = None,
+                                     static_context: Union[str, List[str]] = None) -> Tuple[List[str], str]:
     """
-    Generate a prompt for code generation based on the given video plan and implementation details.
+    Generate the code generation prompt split into a static prefix and dynamic content.
+
+    The static parts are identical for every topic (static context) and for every scene with
+    the same number (instructions), so providers can serve them from their prompt cache.
 
     Args:
         topic (str): The topic of the video.
@@ -94,25 +105,58 @@ def get_prompt_code_generation(topic: str,
         scene_outline (str): The scene outline.
         scene_implementation (str): The detailed scene implementation.
         scene_number (int): The scene number
-        additional_context (Union[str, List[str]]): Additional context to include in the prompt
+        additional_context (Union[str, List[str]]): Per-scene context, e.g. retrieved documentation
+        static_context (Union[str, List[str]]): Context shared by all scenes, e.g. the cheatsheet
+            and context learning examples
     Returns:
-        str: The formatted prompt for code generation.
+        Tuple[List[str], str]: Static prefix parts (static context, instructions) and the dynamic content
     """
-    prompt = _prompt_code_generation.format(
+    static_parts = []
+    if static_context:
+        static_context = [static_context] if isinstance(static_context, str) else static_context
+        static_parts.append("\n".join(static_context))
+    static_parts.append(_code_generation_instructions.format(scene_number=scene_number))
+
+    prompt = _code_generation_inputs.format(
         topic=topic,
         description=description,
         scene_outline=scene_outline,
-        scene_implementation=scene_implementation,
-        scene_number=scene_number
+        scene_implementation=scene_implementation
     )
     if additional_context is not None:
         if isinstance(additional_context, str):
             prompt += f"\nAdditional context: {additional_context}"
-        elif isinstance(additional_context, list):
+        elif isinstance(additional_context, list) and additional_context:
             prompt += f"\nAdditional context: {additional_context[0]}"
             if len(additional_context) > 1:
                 prompt += f"\n" + "\n".join(additional_context[1:])
-    return prompt
+    return static_parts, prompt
+
+def get_prompt_code_generation(topic: str,
+                               description: str,
+                               scene_outline: str,
+                               scene_implementation: str,
+                               scene_number: int,
+                               additional_context: Union[str, List[str]] = None,
+                               static_context: Union[str, List[str]] = None) -> str:
+    """
+    Generate a prompt for code generation based on the given video plan and implementation details.
+
+    Args:
+        topic (str): The topic of the video.
+        description (str): A brief description of the video content.
+        scene_outline (str): The scene outline.
+        scene_implementation (str): The detailed scene implementation.
+        scene_number (int): The scene number
+        additional_context (Union[str, List[str]]): Additional context to include in the prompt
+        static_context (Union[str, List[str]]): Context shared by all scenes, placed before the instructions
+    Returns:
+        str: The formatted prompt for code generation.
+    """
+    static_parts, prompt = get_prompt_code_generation_parts(
+        topic, description, scene_outline, scene_implementation, scene_number, additional_context, static_context
+    )
+    return "\n".join(static_parts + [prompt])
 
 def get_prompt_fix_error(implementation_plan: str, manim_code: str, error: str, additional_context: Union[str, List[str]] = None) -> str:
     """